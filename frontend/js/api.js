@@ -34,13 +34,14 @@ class APIClient {
             console.warn('[API] window.auth not available');
         }
 
+        // No HTTP caching unless the caller opts in (e.g. cache: 'no-cache' to revalidate by ETag)
         const config = {
+            cache: 'no-store',
             ...options,
             headers: {
                 ...defaultHeaders,
                 ...options.headers,
             },
-            cache: 'no-store',
         };
 
         try {
@@ -73,7 +74,9 @@ class APIClient {
             const data = await response.json();
 
             if (!response.ok) {
-                throw new Error(data.detail || `HTTP ${response.status}: ${response.statusText}`);
+                const err = new Error(data.detail || `HTTP ${response.status}: ${response.statusText}`);
+                err.status = response.status;
+                throw err;
             }
 
             return data;
@@ -86,11 +89,15 @@ class APIClient {
     // ==================== Template Methods ====================
 
     /**
-     * Get all templates
+     * Get all templates (lean rows; template_json only when listed in fields)
+     * @param {boolean} archived - List archived instead of active templates
+     * @param {string[]} [fields] - Columns to return, e.g. ['name', 'template_json']
      * @returns {Promise<Array>} List of templates
      */
-    async getTemplates(archived = false) {
-        return this.request(`/api/templates?archived=${archived}`);
+    async getTemplates(archived = false, fields = null) {
+        const params = new URLSearchParams({ archived });
+        if (fields) params.set('fields', fields.join(','));
+        return this.request(`/api/templates?${params.toString()}`);
     }
 
     /**
@@ -162,7 +169,18 @@ class APIClient {
      * @returns {Promise<Object>} Preview with base64 PDF
      */
     async getTemplatePreview(templateId) {
-        return this.request(`/api/templates/${templateId}/preview`);
+        // Previews carry an ETag per template version: keep them in the browser
+        // cache and revalidate (If-None-Match -> 304) instead of downloading again
+        return this.request(`/api/templates/${templateId}/preview`, { cache: 'no-cache' });
+    }
+
+    /**
+     * Get the URL of a template's server-rendered page-1 thumbnail
+     * @param {string} templateId - UUID of the template
+     * @returns {Promise<Object>} { template_id, thumbnail_url }
+     */
+    async getTemplateThumbnail(templateId) {
+        return this.request(`/api/templates/${templateId}/thumbnail`);
     }
 
     /**
@@ -335,6 +353,19 @@ class APIClient {
         });
     }
 
+    async getDocumentPdfStatus(documentId) {
+        return this.request(`/api/documents/${documentId}/pdf-status`);
+    }
+
+    /**
+     * Get the URL of a document's page-1 thumbnail (created on first request)
+     * @param {string} documentId - UUID of the document
+     * @returns {Promise<Object>} { document_id, thumbnail_url }
+     */
+    async getDocumentThumbnail(documentId) {
+        return this.request(`/api/documents/${documentId}/thumbnail`);
+    }
+
     // ==================== AI Template ====================
 
     async generateTemplateFromImage(file, documentType = 'invoice') {
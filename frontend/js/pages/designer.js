@@ -325,11 +325,13 @@ async function loadTemplatePreviews(templates) {
                 const session = await window.auth.getSession();
                 if (session?.access_token) headers['Authorization'] = `Bearer ${session.access_token}`;
             }
+            // preview_key: a newer preview of this card supersedes an older one (409)
             const previewRes = await fetch('/api/preview', {
                 method: 'POST',
                 headers,
-                body: JSON.stringify({ template: templateJson })
+                body: JSON.stringify({ template: templateJson, preview_key: `card:${t.file}` })
             });
+            if (previewRes.status === 409) return;
             const previewData = await previewRes.json();
 
             if (!previewData.success || !previewData.pdf) {
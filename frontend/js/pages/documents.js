@@ -7,6 +7,8 @@ import { showConfirmDialog } from '/js/components/confirm-dialog.js';
 
 let currentFilters = { type: '', status: '' };
 let showingArchived = false;
+// Set once the server reports it can't render thumbnails (no PyMuPDF)
+let thumbnailsUnavailable = false;
 
 function showNotification(message, type = 'success') {
     const existing = document.querySelector('.settings-notification');
@@ -169,6 +171,28 @@ export async function initDocuments() {
     });
 }
 
+/**
+ * Fetch thumbnails for listed documents that have a PDF but no thumbnail yet
+ * (rendered before thumbnails existed); the server creates and saves them once.
+ */
+async function loadDocumentThumbnails(documents) {
+    const missing = documents.filter(doc => doc.pdf_url && !doc.thumbnail_url);
+    const CONCURRENCY = 3;
+    for (let i = 0; i < missing.length && !thumbnailsUnavailable; i += CONCURRENCY) {
+        await Promise.all(missing.slice(i, i + CONCURRENCY).map(async doc => {
+            try {
+                const { thumbnail_url } = await api.getDocumentThumbnail(doc.id);
+                const link = document.querySelector(`.doc-thumb[data-id="${doc.id}"]`);
+                if (link && thumbnail_url) {
+                    link.innerHTML = `<img src="${thumbnail_url}" alt="" loading="lazy" />`;
+                }
+            } catch (error) {
+                if (error.status === 501) thumbnailsUnavailable = true;
+            }
+        }));
+    }
+}
+
 async function loadDocuments() {
     const loading = document.getElementById('docs-loading');
     const table = document.getElementById('docs-table-container');
@@ -198,7 +222,14 @@ async function loadDocuments() {
         tbody.innerHTML = documents.map(doc => `
             <tr>
                 <td>
-                    <strong>${escapeHtml(doc.document_number)}</strong>
+                    <div class="doc-number-cell">
+                        ${doc.pdf_url ? `
+                            <a href="${doc.pdf_url}" target="_blank" class="doc-thumb" data-id="${doc.id}" title="Open PDF">
+                                ${doc.thumbnail_url ? `<img src="${doc.thumbnail_url}" alt="" loading="lazy" />` : ''}
+                            </a>
+                        ` : ''}
+                        <strong>${escapeHtml(doc.document_number)}</strong>
+                    </div>
                 </td>
                 <td>
                     <span class="status-badge ${doc.document_type === 'invoice' ? 'badge-sent' : 'badge-concept'}">
@@ -264,6 +295,7 @@ async function loadDocuments() {
         `).join('');
 
         lucide.createIcons();
+        loadDocumentThumbnails(documents);
 
         // Status change handlers
         tbody.querySelectorAll('.status-select').forEach(select => {
@@ -180,7 +180,7 @@ export async function initGenerator() {
     }
 
     // Template selection handler
-    elements.templateSelect.addEventListener('change', (e) => {
+    elements.templateSelect.addEventListener('change', async (e) => {
         const templateId = e.target.value;
 
         if (!templateId) {
@@ -192,7 +192,13 @@ export async function initGenerator() {
             return;
         }
 
-        currentTemplate = templates.find(t => t.id === templateId);
+        // The list is lean; fetch the full template (with template_json) for the form
+        try {
+            currentTemplate = await api.getTemplate(templateId);
+        } catch (error) {
+            console.error('Failed to load template:', error);
+            currentTemplate = null;
+        }
 
         if (currentTemplate) {
             elements.emptyState.style.display = 'none';
@@ -7,6 +7,12 @@ import { showConfirmDialog } from '/js/components/confirm-dialog.js';
 let templates = [];
 let showingArchived = false;
 
+// Template cards show field badges, so the library also needs template_json
+const LIBRARY_FIELDS = [
+    'name', 'description', 'thumbnail_base64', 'thumbnail_url', 'payment_status',
+    'is_archived', 'created_at', 'updated_at', 'template_json'
+];
+
 // --- Persistent preview cache (localStorage) ---
 const PREVIEW_CACHE_PREFIX = 'tpl_preview_';
 
@@ -189,17 +195,28 @@ async function loadInlinePreview(template) {
             return;
         }
 
-        // 2. Fetch preview PDF from API
+        // 2. Server-rendered thumbnail (unavailable without PyMuPDF on the server)
+        try {
+            const { thumbnail_url } = await api.getTemplateThumbnail(template.id);
+            if (thumbnail_url) {
+                previewArea.innerHTML = `<img src="${thumbnail_url}" alt="Template preview" class="template-thumbnail" />`;
+                return;
+            }
+        } catch {
+            // Fall back to rendering the preview PDF in the browser
+        }
+
+        // 3. Fetch preview PDF from API
         console.log(`[Library] Fetching preview for template: ${template.name}`);
         const result = await api.getTemplatePreview(template.id);
 
-        // 3. Render PDF to image
+        // 4. Render PDF to image
         const dataUrl = await pdfToImageDataUrl(result.pdf);
 
-        // 4. Persist in localStorage for next visit
+        // 5. Persist in localStorage for next visit
         setPersistedPreview(template.id, updatedAt, dataUrl);
 
-        // 5. Show the image
+        // 6. Show the image
         previewArea.innerHTML = `<img src="${dataUrl}" alt="Template preview" class="template-thumbnail" />`;
 
     } catch (error) {
@@ -218,7 +235,7 @@ async function loadInlinePreview(template) {
  * Load inline previews for all templates without thumbnails
  */
 async function loadInlinePreviews() {
-    const templatesNeedingPreview = templates.filter(t => !t.thumbnail_base64);
+    const templatesNeedingPreview = templates.filter(t => !t.thumbnail_base64 && !t.thumbnail_url);
     if (templatesNeedingPreview.length === 0) return;
 
     console.log(`[Library] Loading previews for ${templatesNeedingPreview.length} template(s)...`);
@@ -251,6 +268,10 @@ function renderTemplateCard(template) {
         thumbnailHtml = `<img src="data:image/png;base64,${template.thumbnail_base64}"
                  alt="Template preview"
                  class="template-thumbnail" />`;
+    } else if (template.thumbnail_url) {
+        thumbnailHtml = `<img src="${template.thumbnail_url}"
+                 alt="Template preview"
+                 class="template-thumbnail" />`;
     } else {
         thumbnailHtml = `<div class="template-placeholder" style="flex-direction:column;">
                 <div class="loader-pulse loader-pulse--mini">
@@ -506,7 +527,7 @@ export async function initLibrary() {
         }
         lucide.createIcons();
         try {
-            templates = await api.getTemplates(showingArchived);
+            templates = await api.getTemplates(showingArchived, LIBRARY_FIELDS);
             const loading = document.getElementById('loading-library');
             if (loading) loading.style.display = 'none';
             renderTemplates('templates-grid', 'empty-state', 'stats');
@@ -517,7 +538,7 @@ export async function initLibrary() {
 
     // Load templates
     try {
-        templates = await api.getTemplates(showingArchived);
+        templates = await api.getTemplates(showingArchived, LIBRARY_FIELDS);
         console.log(`[Library] Loaded ${templates.length} templates`);
 
         // Hide loading
@@ -739,9 +739,40 @@ async function saveDocument(generatePdf) {
     }
 
     console.log('[SaveDocument] Result:', JSON.stringify(result, null, 2));
+
+    // New documents are rendered in the background: wait for the PDF
+    if (result && result.pdf_status === 'pending') {
+        result.pdf_url = await waitForPdf(result.id);
+    } else if (result && result.pdf_status === 'failed') {
+        // Rendered inline by the server (serverless deployment) and failed
+        showNotification('Document saved, but PDF generation failed: ' + (result.pdf_error || 'unknown error'), 'error');
+        result.pdf_url = null;
+    }
     return result;
 }
 
+/**
+ * Poll the PDF render status of a document until it is ready.
+ * Returns the PDF URL, or null (with a notification) when rendering failed
+ * or is still running after timeoutMs — the document itself is saved.
+ */
+async function waitForPdf(documentId, timeoutMs = 60000) {
+    const started = Date.now();
+    let delay = 300;
+    while (Date.now() - started < timeoutMs) {
+        await new Promise(resolve => setTimeout(resolve, delay));
+        const status = await api.getDocumentPdfStatus(documentId);
+        if (status.pdf_status === 'ready') return status.pdf_url;
+        if (status.pdf_status === 'failed') {
+            showNotification('Document saved, but PDF generation failed: ' + (status.error || 'unknown error'), 'error');
+            return null;
+        }
+        delay = Math.min(delay * 2, 2000);
+    }
+    showNotification('Document saved, the PDF is still being generated', 'info');
+    return null;
+}
+
 /**
  * Full submit flow — called by buttons. Handles UI feedback and navigation.
  */
@@ -798,7 +829,8 @@ async function submitDocument(generatePdf) {
             lucide.createIcons();
         } else {
             console.log(`[Submit] No PDF flow. generatePdf=${generatePdf}, pdf_url=${result.pdf_url}. Navigating to #/documents`);
-            showNotification(editingDocumentId ? 'Document updated!' : 'Document saved as concept!');
+            // Without a PDF URL after generating, waitForPdf() already reported why
+            if (!generatePdf) showNotification(editingDocumentId ? 'Document updated!' : 'Document saved as concept!');
             window.location.hash = '#/documents';
         }
         console.log('[Submit] === END (success) ===');
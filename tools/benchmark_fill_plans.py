@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for build_input_data fill plans
+Fills the bundled frontend/templates/factuur-*.json templates with sample data,
+once with the compiled plan cache cleared before every fill (the old per-render
+schema walk) and once with the plan cached, and prints the speedup.
+
+Usage:
+    python tools/benchmark_fill_plans.py [iterations]
+"""
+
+import sys
+import json
+import timeit
+from pathlib import Path
+
+# Add parent directory to path to import invoice_app
+sys.path.insert(0, str(Path(__file__).parent))
+
+from invoice_app.document_routes import build_input_data, calculate_totals, compile_fill_plan
+
+TEMPLATES_DIR = Path(__file__).parent.parent / "frontend" / "templates"
+
+COMPANY_SETTINGS = {
+    "company_name": "Studio Voorbeeld B.V.",
+    "address": "Keizersgracht 1",
+    "postal_code": "1015 AA",
+    "city": "Amsterdam",
+    "kvk_number": "12345678",
+    "btw_number": "NL001234567B01",
+    "iban": "NL91ABNA0417164300",
+}
+CUSTOMER = {"name": "Klant B.V.", "address": "Stationsplein 2", "postal_code": "3511 ED", "city": "Utrecht"}
+LINE_ITEMS = [
+    {"description": "Ontwerp", "quantity": 8, "unit_price": 95.0, "btw_percentage": 21},
+    {"description": "Drukwerk", "quantity": 250, "unit_price": 0.42, "btw_percentage": 21},
+    {"description": "Boek", "quantity": 1, "unit_price": 24.95, "btw_percentage": 9},
+]
+
+
+def fill(template_json, totals):
+    return build_input_data(
+        template_json, COMPANY_SETTINGS, CUSTOMER, LINE_ITEMS,
+        "F-2025-0042", "15-01-2025", "14-02-2025", totals, "invoice"
+    )
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    totals = calculate_totals(LINE_ITEMS)
+    paths = sorted(TEMPLATES_DIR.glob("factuur-*.json"))
+    if not paths:
+        print(f"[Benchmark] No factuur-*.json templates found in {TEMPLATES_DIR}")
+        sys.exit(1)
+
+    print(f"[Benchmark] build_input_data, {iterations} fills per template\n")
+    print(f"{'template':<28}{'fields':>7}{'walk (us)':>12}{'plan (us)':>12}{'speedup':>10}")
+
+    for path in paths:
+        template_json = json.loads(path.read_text(encoding="utf-8"))
+        fields = len(template_json["schemas"][0])
+
+        def uncached():
+            compile_fill_plan.cache_clear()
+            return fill(template_json, totals)
+
+        def cached():
+            return fill(template_json, totals)
+
+        assert uncached() == cached(), f"{path.name}: cached plan changed the output"
+
+        walk = min(timeit.repeat(uncached, number=iterations, repeat=3)) / iterations * 1e6
+        plan = min(timeit.repeat(cached, number=iterations, repeat=3)) / iterations * 1e6
+        print(f"{path.name:<28}{fields:>7}{walk:>12.2f}{plan:>12.2f}{walk / plan:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Benchmark: loopback TCP vs Unix domain socket to the Node.js PDF service
+Requires the service running with both listeners, e.g.
+    NODE_SERVICE_SOCKET=/tmp/invoice-pdf.sock node tools/node_service/start_service.js
+
+For each transport it times GET /health (pure request overhead) and
+POST /generate with the bundled factuur-basis.json template (a full render,
+binary response), then prints per-request latency.
+
+Usage:
+    python tools/benchmark_node_transport.py [iterations]
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import statistics
+from pathlib import Path
+
+import httpx
+from dotenv import load_dotenv
+
+# Add parent directory to path to import invoice_app
+sys.path.insert(0, str(Path(__file__).parent))
+
+load_dotenv()
+
+from invoice_app.document_routes import build_input_data, calculate_totals
+
+NODE_SERVICE_HOST = os.getenv("NODE_SERVICE_HOST", "localhost")
+NODE_SERVICE_PORT = os.getenv("NODE_SERVICE_PORT", "3001")
+NODE_SERVICE_URL = f"http://{NODE_SERVICE_HOST}:{NODE_SERVICE_PORT}"
+NODE_SERVICE_SOCKET = os.getenv("NODE_SERVICE_SOCKET", "/tmp/invoice-pdf.sock")
+
+TEMPLATE_PATH = Path(__file__).parent.parent / "frontend" / "templates" / "factuur-basis.json"
+LINE_ITEMS = [
+    {"description": "Ontwerp", "quantity": 8, "unit_price": 95.0, "btw_percentage": 21},
+    {"description": "Drukwerk", "quantity": 250, "unit_price": 0.42, "btw_percentage": 21},
+]
+
+
+def render_payload():
+    template_json = json.loads(TEMPLATE_PATH.read_text(encoding="utf-8"))
+    input_data = build_input_data(
+        template_json, {"company_name": "Studio Voorbeeld B.V.", "iban": "NL91ABNA0417164300"},
+        {"name": "Klant B.V."}, LINE_ITEMS, "F-2025-0042", "15-01-2025", "14-02-2025",
+        calculate_totals(LINE_ITEMS), "invoice"
+    )
+    return {"template": template_json, "inputs": [input_data]}
+
+
+async def time_requests(client, iterations, method, path, **kwargs):
+    """Latencies in ms for sequential requests (after one warm-up request)."""
+    await client.request(method, path, **kwargs)
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        response = await client.request(method, path, **kwargs)
+        response.raise_for_status()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def summarize(latencies):
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return f"mean {statistics.mean(ordered):8.3f} ms   p50 {statistics.median(ordered):8.3f} ms   p95 {p95:8.3f} ms"
+
+
+async def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    if not os.path.exists(NODE_SERVICE_SOCKET):
+        print(f"[Benchmark] Socket {NODE_SERVICE_SOCKET} not found. Start the Node.js service with "
+              f"NODE_SERVICE_SOCKET={NODE_SERVICE_SOCKET}")
+        sys.exit(1)
+
+    payload = render_payload()
+    render_kwargs = {"json": payload, "headers": {"Accept": "application/pdf"}}
+    transports = {
+        "tcp": httpx.AsyncClient(base_url=NODE_SERVICE_URL, timeout=30.0),
+        "uds": httpx.AsyncClient(
+            base_url=NODE_SERVICE_URL, timeout=30.0,
+            transport=httpx.AsyncHTTPTransport(uds=NODE_SERVICE_SOCKET)
+        ),
+    }
+
+    print(f"[Benchmark] {iterations} sequential requests per case\n")
+    results = {}
+    for name, client in transports.items():
+        async with client:
+            health = await time_requests(client, iterations, "GET", "/health")
+            render = await time_requests(client, iterations, "POST", "/generate", **render_kwargs)
+        results[name] = (health, render)
+        print(f"{name}  /health    {summarize(health)}")
+        print(f"{name}  /generate  {summarize(render)}")
+
+    saved_health = statistics.mean(results["tcp"][0]) - statistics.mean(results["uds"][0])
+    saved_render = statistics.mean(results["tcp"][1]) - statistics.mean(results["uds"][1])
+    print(f"\n[Benchmark] UDS saves {saved_health:.3f} ms per request, {saved_render:.3f} ms per render")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -49,9 +49,11 @@ async def get_document_activity(
         rows = await supabase.select(
             "activity_log",
             filters={"document_id": document_id, "user_id": user_id},
-            order_by=("created_at", True)
+            order_by=("created_at", True),
+            limit=limit,
+            offset=offset
         )
-        return rows[offset:offset + limit]
+        return rows
     except Exception as e:
         print(f"[Activity] Error fetching document activity: {e}")
         raise HTTPException(
@@ -71,9 +73,10 @@ async def get_activity_feed(
         rows = await supabase.select(
             "activity_log",
             filters={"user_id": user_id},
-            order_by=("created_at", True)
+            order_by=("created_at", True),
+            limit=limit
         )
-        return rows[:limit]
+        return rows
     except Exception as e:
         print(f"[Activity] Error fetching activity feed: {e}")
         raise HTTPException(
@@ -95,12 +95,11 @@ async def _get_monthly_usage(user_id: str):
     """Get AI generation count for the current calendar month."""
     now = datetime.now(timezone.utc)
     month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0).isoformat()
-    logs = await sb.select_filtered(
+    return await sb.count(
         "ai_generation_logs",
-        eq_filters={"user_id": user_id, "status": "success"},
+        filters={"user_id": user_id, "status": "success"},
         gte_filters={"created_at": month_start}
     )
-    return len(logs)
 
 
 async def _get_reset_date():
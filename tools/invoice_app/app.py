@@ -8,7 +8,6 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse, RedirectResponse
 from starlette.middleware.base import BaseHTTPMiddleware
 from dotenv import load_dotenv
-import requests
 
 from .routes import router
 from .statistics_routes import router as statistics_router
@@ -24,6 +23,14 @@ from .email_events_routes import router as email_events_router
 from .automation_routes import router as automation_router
 from .models import HealthResponse
 from .supabase_client import supabase
+from .http_client import open_http_client, close_http_client, get_pool_stats
+from .pdf_generator import (
+    get_node_pool, open_node_pool, close_node_pool, render_cache_stats, get_render_scheduler,
+    get_preview_coalescer
+)
+from .cache import get_cache_stats
+from .pdf_jobs import get_pdf_job_queue, open_pdf_job_queue, close_pdf_job_queue
+from .thumbnails import thumbnail_stats, close_thumbnail_pool
 
 # Load environment variables
 load_dotenv()
@@ -39,7 +46,7 @@ app = FastAPI(
 class NoCacheAPIMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
         response = await call_next(request)
-        if request.url.path.startswith("/api/") or request.url.path == "/health":
+        if request.url.path.startswith("/api/") or request.url.path.startswith("/health"):
             response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
         return response
 
@@ -70,6 +77,22 @@ app.include_router(email_events_router)
 app.include_router(automation_router)
 
 
+# Open the shared HTTP connection pool and Node.js render workers on startup, release them on shutdown
+@app.on_event("startup")
+async def start_http_client():
+    await open_http_client()
+    await open_node_pool()
+    await open_pdf_job_queue()
+
+
+@app.on_event("shutdown")
+async def stop_http_client():
+    await close_pdf_job_queue()
+    await close_http_client()
+    await close_node_pool()
+    close_thumbnail_pool()
+
+
 # Start scheduler background task on startup
 @app.on_event("startup")
 async def start_scheduler():
@@ -78,11 +101,6 @@ async def start_scheduler():
     scheduler_interval = int(os.getenv("SCHEDULER_INTERVAL_SECONDS", "300"))
     asyncio.create_task(scheduler_loop(scheduler_interval))
 
-# Get environment variables
-NODE_SERVICE_HOST = os.getenv("NODE_SERVICE_HOST", "localhost")
-NODE_SERVICE_PORT = os.getenv("NODE_SERVICE_PORT", "3001")
-NODE_SERVICE_URL = f"http://{NODE_SERVICE_HOST}:{NODE_SERVICE_PORT}"
-
 @app.get("/")
 async def serve_index():
     """Serve the landing page"""
@@ -104,10 +122,9 @@ async def health_check():
     except Exception as e:
         print(f"Supabase connection failed: {e}")
 
-    # Check Node.js service connection
+    # Check Node.js render workers (over the configured TCP/socket transport)
     try:
-        response = requests.get(f"{NODE_SERVICE_URL}/health", timeout=2)
-        node_service_connected = response.status_code == 200
+        node_service_connected = await get_node_pool().check_health() > 0
     except Exception as e:
         print(f"Node.js service connection failed: {e}")
 
@@ -120,6 +137,20 @@ async def health_check():
         node_service_connected=node_service_connected
     )
 
+@app.get("/health/metrics")
+async def metrics():
+    """Runtime metrics for monitoring (connection pools, cache hit rates, render workers)"""
+    return {
+        "http_pool": get_pool_stats(),
+        "caches": get_cache_stats(),
+        "render_cache": render_cache_stats(),
+        "node_pool": get_node_pool().stats(),
+        "render_scheduler": get_render_scheduler().stats(),
+        "designer_previews": get_preview_coalescer().stats(),
+        "pdf_jobs": get_pdf_job_queue().stats(),
+        "thumbnails": thumbnail_stats(),
+    }
+
 # Get frontend path
 frontend_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "frontend")
 
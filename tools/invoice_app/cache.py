@@ -0,0 +1,197 @@
+"""
+Read-through caches — TTL + LRU with a pluggable backend.
+The default memory backend is per worker process. CACHE_BACKEND=redis stores
+entries in Redis (REDIS_URL), so every uvicorn worker sees the same entries and
+an invalidation in one worker applies to all of them.
+"""
+import os
+import json
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory").lower()
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+_caches: dict = {}
+
+
+class CacheBackend(ABC):
+    """Abstract storage for cache entries."""
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Any]:
+        """Return the cached value, or None if missing/expired."""
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, ttl: float):
+        """Store a value for ttl seconds."""
+
+    @abstractmethod
+    async def delete(self, key: str):
+        """Remove a key (no-op if missing)."""
+
+    def size(self) -> Optional[int]:
+        """Number of entries held, if the backend can tell cheaply."""
+        return None
+
+
+def json_size(value: Any) -> int:
+    """Approximate memory cost of a JSON-like value (its serialized length)."""
+    return len(json.dumps(value, default=str))
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    In-process TTL + LRU store. Least recently used entries are evicted past
+    max_entries, or past max_bytes when a byte budget is set (sizes measured
+    with json_size at insert time).
+    """
+
+    def __init__(self, max_entries: int, max_bytes: Optional[int] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict = OrderedDict()
+        self.bytes = 0
+        self.evictions = 0
+
+    def _pop(self, key):
+        _, _, size = self._entries.pop(key)
+        self.bytes -= size
+
+    async def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value, _ = entry
+        if expires_at < time.monotonic():
+            self._pop(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key, value, ttl):
+        size = json_size(value) if self.max_bytes else 0
+        if self.max_bytes and size > self.max_bytes:
+            return  # larger than the whole budget, never cache it
+        if key in self._entries:
+            self._pop(key)
+        self._entries[key] = (time.monotonic() + ttl, value, size)
+        self.bytes += size
+        while len(self._entries) > self.max_entries or (self.max_bytes and self.bytes > self.max_bytes):
+            self._pop(next(iter(self._entries)))
+            self.evictions += 1
+
+    async def delete(self, key):
+        if key in self._entries:
+            self._pop(key)
+
+    def size(self):
+        return len(self._entries)
+
+
+class RedisCacheBackend(CacheBackend):
+    """Redis-backed store shared by all workers; values are stored as JSON."""
+
+    def __init__(self, namespace: str, url: str = REDIS_URL):
+        import redis.asyncio as redis  # optional dependency
+        self.namespace = namespace
+        self._redis = redis.from_url(url)
+
+    def _key(self, key):
+        return f"invoice_studio:{self.namespace}:{key}"
+
+    async def get(self, key):
+        raw = await self._redis.get(self._key(key))
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key, value, ttl):
+        await self._redis.set(self._key(key), json.dumps(value, default=str), ex=max(1, int(ttl)))
+
+    async def delete(self, key):
+        await self._redis.delete(self._key(key))
+
+
+def get_cache_backend(namespace: str, max_entries: int, max_bytes: Optional[int] = None) -> CacheBackend:
+    """Factory: returns the configured cache backend (falls back to memory)."""
+    if CACHE_BACKEND == "redis":
+        try:
+            return RedisCacheBackend(namespace)
+        except ImportError:
+            print("[Cache] CACHE_BACKEND=redis but 'redis' is not installed, using in-process cache")
+    return MemoryCacheBackend(max_entries, max_bytes)
+
+
+class Cache:
+    """
+    Named read-through cache with hit/miss counters.
+    Backend errors are logged and treated as misses so a cache outage
+    never fails the request.
+    """
+
+    def __init__(self, name: str, ttl: float, max_entries: int = 1000,
+                 max_bytes: Optional[int] = None, backend: Optional[CacheBackend] = None):
+        self.name = name
+        self.ttl = ttl
+        self.backend = backend or get_cache_backend(name, max_entries, max_bytes)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        _caches[name] = self
+
+    async def get(self, key: str) -> Optional[Any]:
+        try:
+            value = await self.backend.get(key)
+        except Exception as e:
+            print(f"[Cache] {self.name} get failed: {e}")
+            value = None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key: str, value: Any):
+        try:
+            await self.backend.set(key, value, self.ttl)
+        except Exception as e:
+            print(f"[Cache] {self.name} set failed: {e}")
+
+    async def invalidate(self, key: str):
+        self.invalidations += 1
+        try:
+            await self.backend.delete(key)
+        except Exception as e:
+            print(f"[Cache] {self.name} invalidate failed: {e}")
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value, or await loader() and cache its result."""
+        value = await self.get(key)
+        if value is None:
+            value = await loader()
+            if value is not None:
+                await self.set(key, value)
+        return value
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": self.backend.size(),
+            "bytes": getattr(self.backend, "bytes", None),
+            "max_bytes": getattr(self.backend, "max_bytes", None),
+            "evictions": getattr(self.backend, "evictions", None),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "invalidations": self.invalidations,
+        }
+
+
+def get_cache_stats() -> dict:
+    """Counters for every cache created in this process, keyed by name."""
+    return {name: cache.stats() for name, cache in _caches.items()}
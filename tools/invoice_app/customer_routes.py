@@ -4,7 +4,7 @@ Customer API routes for address book management
 from fastapi import APIRouter, HTTPException, status, Query, Depends
 from typing import Optional
 from datetime import datetime, timezone
-from .supabase_client import supabase
+from .supabase_client import supabase, DEFAULT_PAGE_SIZE, filter_uuids
 from .auth_middleware import get_current_user
 from .models import CustomerBulkCreate
 
@@ -15,14 +15,34 @@ router = APIRouter(prefix="/api/customers")
 async def list_customers(
     q: Optional[str] = Query(None, description="Search query"),
     active: Optional[bool] = Query(True, description="Filter by active status"),
+    limit: Optional[int] = Query(None, ge=1, le=200, description="Page size (enables pagination)"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
     user: dict = Depends(get_current_user)
 ):
     """
     List all customers for the current user, optionally filtered by search query.
     Search matches against name and company_name.
+    With limit/cursor the response is { items, next_cursor } (keyset on name).
     """
     try:
         user_id = user["sub"]
+        if limit is not None or cursor:
+            filters = {"user_id": user_id}
+            if active is not None:
+                filters["is_active"] = active
+            or_filters = None
+            if q and q.strip():
+                or_filters = f"(name.ilike.*{q.strip()}*,company_name.ilike.*{q.strip()}*)"
+            items, next_cursor = await supabase.select_page(
+                "customers",
+                filters=filters,
+                order_by=("name", False),
+                limit=limit or DEFAULT_PAGE_SIZE,
+                cursor=cursor,
+                or_filters=or_filters
+            )
+            return {"items": items, "next_cursor": next_cursor}
+
         if q and q.strip():
             search_filters = {"user_id": user_id}
             if active is not None:
@@ -43,6 +63,8 @@ async def list_customers(
                 filters=filters,
                 order_by=("name", False)
             )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         print(f"[Customers] Error listing customers: {str(e)}")
         raise HTTPException(
@@ -61,17 +83,20 @@ async def bulk_delete_customers(payload: dict, user: dict = Depends(get_current_
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Maximum 500 items per request")
 
     user_id = user["sub"]
-    deleted = 0
-    for customer_id in ids:
-        try:
-            rows = await supabase.select("customers", columns="id", filters={"id": customer_id, "user_id": user_id})
-            if rows:
-                await supabase.delete("customers", {"id": customer_id, "user_id": user_id})
-                deleted += 1
-        except Exception:
-            pass
+    try:
+        rows = await supabase.delete_in(
+            "customers", "id", filter_uuids(ids),
+            extra_filters={"user_id": user_id},
+            columns="id"
+        )
+    except Exception as e:
+        print(f"[Customers] Error bulk deleting: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to bulk delete customers: {str(e)}"
+        )
 
-    return {"deleted": deleted}
+    return {"deleted": len(rows), "ids": [r["id"] for r in rows]}
 
 
 @router.post("/bulk-archive")
@@ -84,21 +109,22 @@ async def bulk_archive_customers(payload: dict, user: dict = Depends(get_current
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Maximum 500 items per request")
 
     user_id = user["sub"]
-    archived = 0
-    for customer_id in ids:
-        try:
-            rows = await supabase.select("customers", columns="id", filters={"id": customer_id, "user_id": user_id})
-            if rows:
-                await supabase.update(
-                    "customers",
-                    {"is_active": False, "updated_at": datetime.now(timezone.utc).isoformat()},
-                    {"id": customer_id, "user_id": user_id}
-                )
-                archived += 1
-        except Exception:
-            pass
+    try:
+        rows = await supabase.update_in(
+            "customers",
+            {"is_active": False, "updated_at": datetime.now(timezone.utc).isoformat()},
+            "id", filter_uuids(ids),
+            extra_filters={"user_id": user_id},
+            columns="id"
+        )
+    except Exception as e:
+        print(f"[Customers] Error bulk archiving: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to bulk archive customers: {str(e)}"
+        )
 
-    return {"archived": archived}
+    return {"archived": len(rows), "ids": [r["id"] for r in rows]}
 
 
 @router.post("/bulk-create", status_code=status.HTTP_201_CREATED)
@@ -1,33 +1,165 @@
 """
 Document API routes for invoice/quote creation and management
 """
+import os
 import re
-from datetime import datetime, timedelta
+import csv
+import time
+import asyncio
+import zipfile
+import tempfile
+from collections import deque
+from functools import lru_cache
+from datetime import datetime, timedelta, date
 from fastapi import APIRouter, HTTPException, status, Query, Depends
+from fastapi.responses import StreamingResponse
 from typing import Optional
-from .supabase_client import supabase
+from .supabase_client import supabase, DEFAULT_PAGE_SIZE, project_columns
 from .auth_middleware import get_current_user
-from .pdf_generator import generate_pdf, delete_from_storage
-from .settings_routes import format_document_number, get_default_settings
+from .pdf_generator import (
+    generate_pdf, delete_from_storage, download_from_storage, render_hash, record_render_cache
+)
+from .thumbnails import THUMBNAILS_ENABLED, store_thumbnail, delete_thumbnail
+from .settings_routes import allocate_document_number, get_company_settings, get_default_settings
 from .activity_routes import _log_activity
+from .pdf_jobs import get_pdf_job_queue
+from .routes import get_template_for_render, resolve_template, TEMPLATE_VERSION_COLUMNS
 
 router = APIRouter(prefix="/api/documents")
 
+# Columns returned by the list route; line_items, notes etc. only on GET /{id}
+DOCUMENT_LIST_COLUMNS = [
+    "id", "document_type", "document_number", "date", "due_date",
+    "customer_id", "customer_name", "template_id", "status",
+    "subtotal", "btw_amount", "total_amount", "pdf_url", "thumbnail_url",
+    "sent_at", "last_sent_email", "recurring_rule_id", "is_archived",
+    "pdf_status", "created_at", "updated_at",
+]
+
+# Columns a caller may request with ?fields=
+DOCUMENT_FIELDS = set(DOCUMENT_LIST_COLUMNS) | {
+    "line_items", "notes", "storage_path", "source_document_id", "render_hash",
+}
+
+# ZIP export: columns read per document, PDFs fetched (or rendered) at once, list page size
+EXPORT_COLUMNS = (
+    "id,document_type,document_number,date,due_date,customer_name,status,"
+    "subtotal,btw_amount,total_amount,pdf_url,storage_path,pdf_status,created_at"
+)
+EXPORT_CONCURRENCY = max(1, int(os.getenv("EXPORT_CONCURRENCY", "8")))
+EXPORT_PAGE_SIZE = 200
+EXPORT_LEDGER_COLUMNS = [
+    "document_number", "document_type", "date", "due_date", "customer_name", "status",
+    "subtotal", "btw_amount", "total_amount", "file", "error",
+]
+
 
 def format_currency(amount):
     """Format a number as currency string"""
     return f"{amount:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
 
 
+# Schema field types whose template content is never overwritten
+SKIPPED_FIELD_TYPES = ("line", "rectangle", "ellipse", "svg")
+
+# Lowercased schema field name -> key in the per-document values dict
+FIELD_VALUE_KEYS = {
+    "bedrijfsnaam": "company_name",
+    "bedrijfsadres": "company_address",
+    "footer": "footer",
+    "klant_naam": "customer_name",
+    "klant_adres": "customer_address",
+    "factuurnummer": "document_number",
+    "offerte_nummer": "document_number",
+    "documentnummer": "document_number",
+    "datum": "date",
+    "vervaldatum": "due_date",
+    "factuur_titel": "title",
+    "offerte_titel": "title",
+    "document_titel": "title",
+    "titel": "title",
+    "subtotaal": "subtotal",
+    "btw": "btw",
+    "totaal": "total",
+    "betaalinfo": "payment_info",
+    "betaalgegevens": "payment_info",
+}
+
+LINE_ITEM_FIELD = re.compile(r"regel(\d+)_(.+)")
+
+# Line item column -> formatter for one item
+LINE_ITEM_COLUMNS = {
+    "omschrijving": lambda item: item.get("description", ""),
+    "aantal": lambda item: str(item.get("quantity", "")),
+    "prijs": lambda item: format_currency(item.get("unit_price", 0)),
+    "totaal": lambda item: format_currency(item.get("quantity", 0) * item.get("unit_price", 0)),
+    "btw": lambda item: f"{item.get('btw_percentage', 21)}%",
+}
+
+
+@lru_cache(maxsize=256)
+def compile_fill_plan(schema_signature: tuple):
+    """
+    Compile a template schema into a fill plan, once per distinct schema.
+    schema_signature is the tuple of (field_name, field_type) pairs of the
+    first page, so identical schemas share a plan regardless of their content.
+
+    Returns (value_fields, line_slots):
+        value_fields: [(field_name, value_key)] filled from the per-document values
+        line_slots: [(field_name, item_index, formatter)]; formatter is None for
+                    unknown columns, which are only blanked when there is no item
+    """
+    value_fields = []
+    line_slots = []
+    for field_name, field_type in schema_signature:
+        name_lower = field_name.lower()
+
+        # Shapes, lines and non-logo images keep their template content
+        if field_type in SKIPPED_FIELD_TYPES:
+            continue
+        if field_type == "image" and "logo" not in name_lower:
+            continue
+
+        value_key = FIELD_VALUE_KEYS.get(name_lower)
+        if value_key:
+            value_fields.append((field_name, value_key))
+            continue
+
+        match = LINE_ITEM_FIELD.match(name_lower)
+        if match:
+            idx = int(match.group(1)) - 1
+            line_slots.append((field_name, idx, LINE_ITEM_COLUMNS.get(match.group(2))))
+
+        # Labels and other static text - don't override template content
+
+    return value_fields, line_slots
+
+
+def get_fill_plan(template_json):
+    """Fill plan for a template, cached by its schema signature."""
+    schemas = template_json.get("schemas", [{}])
+    page_schema = schemas[0] if schemas else {}
+    if isinstance(page_schema, list):
+        # Array form: [{name, type, ...}, ...]
+        signature = tuple(
+            (field_def.get("name", ""), field_def.get("type", "text"))
+            for field_def in page_schema
+        )
+    else:
+        signature = tuple(
+            (field_name, field_def.get("type", "text"))
+            for field_name, field_def in page_schema.items()
+        )
+    return compile_fill_plan(signature)
+
+
 def build_input_data(template_json, company_settings, customer, line_items,
                      document_number, date_str, due_date_str, totals, document_type):
     """
     Map structured data to flat pdfme field name dict.
-    Inspects the template schemas to discover field names and fills them.
+    Uses the template's compiled fill plan to discover field names and fills them.
     """
-    schemas = template_json.get("schemas", [{}])
-    page_schema = schemas[0] if schemas else {}
-    input_data = {}
+    value_fields, line_slots = get_fill_plan(template_json)
 
     # Build company address block
     company_parts = []
@@ -36,7 +168,6 @@ def build_input_data(template_json, company_settings, customer, line_items,
     city_line = " ".join(filter(None, [company_settings.get("postal_code"), company_settings.get("city")]))
     if city_line:
         company_parts.append(city_line)
-    company_address = "\n".join(company_parts)
 
     # Build customer address block
     customer_parts = []
@@ -46,7 +177,6 @@ def build_input_data(template_json, company_settings, customer, line_items,
         cust_city = " ".join(filter(None, [customer.get("postal_code"), customer.get("city")]))
         if cust_city:
             customer_parts.append(cust_city)
-    customer_address = "\n".join(customer_parts)
 
     # Build footer
     footer_parts = []
@@ -58,87 +188,40 @@ def build_input_data(template_json, company_settings, customer, line_items,
         footer_parts.append(f"BTW: {company_settings['btw_number']}")
     if company_settings.get("iban"):
         footer_parts.append(f"IBAN: {company_settings['iban']}")
-    footer_text = company_settings.get("footer_text") or " | ".join(footer_parts)
-
-    # Title based on document type
-    title = "FACTUUR" if document_type == "invoice" else "OFFERTE"
-
-    for field_name in page_schema:
-        field_def = page_schema[field_name]
-        field_type = field_def.get("type", "text")
-        name_lower = field_name.lower()
 
-        # Skip non-text types (shapes, lines, images keep their template content)
-        if field_type in ("line", "rectangle", "ellipse", "svg"):
-            continue
-
-        # Logo image - skip (keep template content)
-        if field_type == "image" and "logo" not in name_lower:
-            continue
+    # Payment info
+    payment_parts = []
+    if company_settings.get("iban"):
+        payment_parts.append(f"IBAN: {company_settings['iban']}")
+    if document_number:
+        payment_parts.append(f"Ref: {document_number}")
+
+    values = {
+        "company_name": company_settings.get("company_name", ""),
+        "company_address": "\n".join(company_parts),
+        "footer": company_settings.get("footer_text") or " | ".join(footer_parts),
+        "customer_name": customer.get("name", "") if customer else "",
+        "customer_address": "\n".join(customer_parts),
+        "document_number": document_number,
+        "date": date_str,
+        "due_date": due_date_str,
+        # Title based on document type
+        "title": "FACTUUR" if document_type == "invoice" else "OFFERTE",
+        "subtotal": format_currency(totals["subtotal"]),
+        "btw": format_currency(totals["btw_amount"]),
+        "total": format_currency(totals["total"]),
+        "payment_info": "\n".join(payment_parts),
+    }
 
-        # Company fields
-        if name_lower == "bedrijfsnaam":
-            input_data[field_name] = company_settings.get("company_name", "")
-        elif name_lower == "bedrijfsadres":
-            input_data[field_name] = company_address
-        elif name_lower == "footer":
-            input_data[field_name] = footer_text
-
-        # Customer fields
-        elif name_lower == "klant_naam":
-            input_data[field_name] = customer.get("name", "") if customer else ""
-        elif name_lower == "klant_adres":
-            input_data[field_name] = customer_address
-
-        # Invoice meta
-        elif name_lower in ("factuurnummer", "offerte_nummer", "documentnummer"):
-            input_data[field_name] = document_number
-        elif name_lower == "datum":
-            input_data[field_name] = date_str
-        elif name_lower == "vervaldatum":
-            input_data[field_name] = due_date_str
-        elif name_lower in ("factuur_titel", "offerte_titel", "document_titel", "titel"):
-            input_data[field_name] = title
-
-        # Line items (regex: regel{N}_{column})
-        elif re.match(r"regel(\d+)_(.+)", name_lower):
-            match = re.match(r"regel(\d+)_(.+)", name_lower)
-            idx = int(match.group(1)) - 1
-            col = match.group(2)
-            if idx < len(line_items):
-                item = line_items[idx]
-                if col == "omschrijving":
-                    input_data[field_name] = item.get("description", "")
-                elif col == "aantal":
-                    input_data[field_name] = str(item.get("quantity", ""))
-                elif col == "prijs":
-                    input_data[field_name] = format_currency(item.get("unit_price", 0))
-                elif col == "totaal":
-                    line_total = item.get("quantity", 0) * item.get("unit_price", 0)
-                    input_data[field_name] = format_currency(line_total)
-                elif col == "btw":
-                    input_data[field_name] = f"{item.get('btw_percentage', 21)}%"
-            else:
-                input_data[field_name] = ""
-
-        # Totals
-        elif name_lower == "subtotaal":
-            input_data[field_name] = format_currency(totals["subtotal"])
-        elif name_lower == "btw":
-            input_data[field_name] = format_currency(totals["btw_amount"])
-        elif name_lower == "totaal":
-            input_data[field_name] = format_currency(totals["total"])
-
-        # Payment info
-        elif name_lower == "betaalinfo" or name_lower == "betaalgegevens":
-            parts = []
-            if company_settings.get("iban"):
-                parts.append(f"IBAN: {company_settings['iban']}")
-            if document_number:
-                parts.append(f"Ref: {document_number}")
-            input_data[field_name] = "\n".join(parts)
+    input_data = {field_name: values[key] for field_name, key in value_fields}
 
-        # Labels and other static text - don't override template content
+    # Line items (regel{N}_{column}); slots beyond the last item are blanked
+    item_count = len(line_items)
+    for field_name, idx, formatter in line_slots:
+        if idx >= item_count:
+            input_data[field_name] = ""
+        elif formatter is not None:
+            input_data[field_name] = formatter(line_items[idx])
 
     return input_data
 
@@ -168,6 +251,110 @@ def calculate_totals(line_items):
     }
 
 
+async def gather_or_raise(*aws):
+    """
+    Run independent awaitables concurrently and return their results in order.
+    Every call is allowed to finish before the first failure is re-raised,
+    so no request is left running in the background.
+    """
+    results = await asyncio.gather(*aws, return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
+
+
+async def fetch_render_context(user_id: str, template_id: str, customer_id: Optional[str] = None):
+    """
+    Fetch template, company settings and customer in parallel.
+    Returns (template, company_settings, customer); company_settings falls back
+    to defaults. Raises 404 if the template is missing.
+    """
+    async def _no_rows():
+        return []
+
+    template, settings, customers = await gather_or_raise(
+        get_template_for_render(template_id, user_id),
+        get_company_settings(user_id),
+        supabase.select("customers", filters={"id": customer_id, "user_id": user_id})
+        if customer_id else _no_rows(),
+    )
+    if not template:
+        raise HTTPException(404, "Template not found")
+    company_settings = settings or get_default_settings()
+    return template, company_settings, (customers[0] if customers else None)
+
+
+async def load_document_for_render(document_id: str, user_id: str, with_template: bool = True):
+    """
+    Load a document together with its customer (and template) in one request
+    using PostgREST embedding. Returns (doc, customer, template); doc is None
+    when the document does not exist. Embedded rows owned by another user are
+    dropped, matching the user_id filter of a direct select.
+    Only the template's updated_at is embedded; template_json comes from the
+    template cache and is downloaded only when that version is not cached.
+    """
+    embeds = {"customers": "*"}
+    if with_template:
+        embeds["templates"] = TEMPLATE_VERSION_COLUMNS
+
+    rows = await supabase.select_embedded(
+        "documents", embeds, filters={"id": document_id, "user_id": user_id}
+    )
+    if not rows:
+        return None, None, None
+
+    doc = rows[0]
+    customer = doc.pop("customers", None)
+    template = doc.pop("templates", None)
+    if customer and customer.get("user_id") != user_id:
+        customer = None
+    if template and template.get("user_id") != user_id:
+        template = None
+    if template:
+        template = await resolve_template(template)
+    return doc, customer, template
+
+
+async def _delete_old_pdf(storage_path: Optional[str]):
+    """Best-effort removal of a superseded PDF and its thumbnail from storage."""
+    if not storage_path:
+        return
+    try:
+        await asyncio.gather(delete_from_storage(storage_path), delete_thumbnail(storage_path))
+    except Exception as e:
+        print(f"[Documents] Failed to delete old PDF {storage_path}: {e}")
+
+
+async def render_document_pdf(
+    doc: dict, template_json: dict, input_data: dict, filename: str, lane: str = "document"
+) -> dict:
+    """
+    (Re-)render a document's PDF unless it is unchanged. The render hash of
+    (template_json, input_data) is stored on the document row; when it matches
+    and the PDF is still stored, the existing object and URL are reused without
+    calling Node.js or uploading. Otherwise the new PDF is rendered while the
+    old one is deleted. Returns generate_pdf's fields plus render_hash.
+    """
+    content_hash = render_hash(template_json, input_data)
+    if content_hash == doc.get("render_hash") and doc.get("pdf_url") and doc.get("storage_path"):
+        record_render_cache(hit=True)
+        print(f"[Documents] PDF unchanged, reusing {doc['storage_path']}")
+        return {
+            "pdf_url": doc["pdf_url"],
+            "storage_path": doc["storage_path"],
+            "thumbnail_url": doc.get("thumbnail_url"),
+            "render_hash": content_hash,
+        }
+
+    record_render_cache(hit=False)
+    pdf_result, _ = await gather_or_raise(
+        generate_pdf(template_json, input_data, filename=filename, lane=lane, user_id=doc.get("user_id")),
+        _delete_old_pdf(doc.get("storage_path")),
+    )
+    return {**pdf_result, "render_hash": content_hash}
+
+
 @router.post("", status_code=status.HTTP_201_CREATED)
 async def create_document(doc_data: dict, user: dict = Depends(get_current_user)):
     """
@@ -188,88 +375,25 @@ async def create_document(doc_data: dict, user: dict = Depends(get_current_user)
         if not line_items:
             raise HTTPException(400, "At least one line item is required")
 
-        # 1. Fetch template
-        templates = await supabase.select("templates", filters={"id": template_id, "user_id": user_id})
-        if not templates:
-            raise HTTPException(404, "Template not found")
-        template = templates[0]
-        template_json = template["template_json"]
-
-        # 2. Fetch company settings
-        settings_rows = await supabase.select("company_settings", filters={"user_id": user_id})
-        company_settings = settings_rows[0] if settings_rows else get_default_settings()
-
-        # 3. Fetch customer (optional)
-        customer = None
+        # 1-3. Fetch template, company settings and (optional) customer in parallel
         customer_id = doc_data.get("customer_id")
-        if customer_id:
-            customers = await supabase.select("customers", filters={"id": customer_id, "user_id": user_id})
-            if customers:
-                customer = customers[0]
-
-        # 4. Generate document number
-        if document_type == "invoice":
-            fmt = company_settings.get("invoice_number_format", "F-{YEAR}-{SEQ}")
-            prefix = company_settings.get("invoice_number_prefix", "F")
-            next_num = company_settings.get("invoice_number_next", 1)
-        else:
-            fmt = company_settings.get("quote_number_format", "O-{YEAR}-{SEQ}")
-            prefix = company_settings.get("quote_number_prefix", "O")
-            next_num = company_settings.get("quote_number_next", 1)
+        template, company_settings, customer = await fetch_render_context(user_id, template_id, customer_id)
 
-        # Replace {PREFIX} in format
-        actual_fmt = fmt.replace("{PREFIX}", prefix)
-        document_number = format_document_number(actual_fmt, next_num)
+        # 4. Allocate document number (atomic, never handed out twice)
+        allocated = await allocate_document_number(user_id, document_type)
+        document_number = allocated["formatted"]
 
-        # 5. Dates
-        date_str = doc_data.get("date") or datetime.utcnow().strftime("%d-%m-%Y")
+        # 5. Payment terms for the default due date
         payment_days = company_settings.get("default_payment_terms_days", 30)
-        if doc_data.get("due_date"):
-            due_date_str = doc_data["due_date"]
-        else:
-            due_date = datetime.utcnow() + timedelta(days=payment_days)
-            due_date_str = due_date.strftime("%d-%m-%Y")
 
         # 6. Calculate totals
         totals = calculate_totals(line_items)
 
-        # 7. Build input_data for pdfme
-        input_data = build_input_data(
-            template_json, company_settings, customer,
-            line_items, document_number, date_str, due_date_str,
-            totals, document_type
-        )
-
-        # 8. Determine if we should generate PDF or save as concept
+        # 7-8. Determine if we should generate PDF or save as concept
+        # (the PDF is rendered from the stored row by the job queue, see pdf_jobs.py)
         generate = doc_data.get("generate_pdf", True)
-        pdf_url = None
-        storage_path = None
-
-        if generate:
-            # Generate PDF
-            pdf_result = await generate_pdf(
-                template_json, input_data,
-                filename=f"{document_type}_{document_number}"
-            )
-            pdf_url = pdf_result["pdf_url"]
-            storage_path = pdf_result["storage_path"]
 
-        # 9. Increment document number in settings
-        if settings_rows:
-            if document_type == "invoice":
-                await supabase.update(
-                    "company_settings",
-                    {"invoice_number_next": next_num + 1},
-                    {"id": company_settings["id"], "user_id": user_id}
-                )
-            else:
-                await supabase.update(
-                    "company_settings",
-                    {"quote_number_next": next_num + 1},
-                    {"id": company_settings["id"], "user_id": user_id}
-                )
-
-        # 10. Store document record
+        # 9. Store document record
         # Convert display date (DD-MM-YYYY) to ISO (YYYY-MM-DD) for database DATE column
         def display_to_iso(dd_mm_yyyy):
             """Convert DD-MM-YYYY to YYYY-MM-DD for PostgreSQL DATE column."""
@@ -296,8 +420,7 @@ async def create_document(doc_data: dict, user: dict = Depends(get_current_user)
             "btw_amount": totals["btw_amount"],
             "total_amount": totals["total"],
             "status": "sent" if generate else "concept",
-            "pdf_url": pdf_url,
-            "storage_path": storage_path,
+            "pdf_status": "pending" if generate else None,
             "notes": doc_data.get("notes", ""),
             "user_id": user_id,
         }
@@ -306,17 +429,27 @@ async def create_document(doc_data: dict, user: dict = Depends(get_current_user)
         print(f"[Documents] Inserting doc_record: {_json.dumps(doc_record, default=str, indent=2)}")
         result = await supabase.insert("documents", doc_record)
 
-        # 11. Also log to usage_logs for statistics
+        # 10. Queue the PDF render; usage_logs is written when it completes
         if generate:
             try:
-                await supabase.insert("usage_logs", {
-                    "template_id": template_id,
-                    "pdf_filename": f"{document_type}_{document_number}.pdf",
-                    "file_size_bytes": pdf_result.get("size", 0),
-                    "user_id": user_id,
-                })
-            except Exception:
-                pass  # Non-blocking
+                job = await get_pdf_job_queue().enqueue(result["id"], user_id)
+            except Exception as e:
+                # The document is saved; mark its PDF failed so it can be regenerated
+                error = f"Could not queue PDF render: {str(e)[:400]}"
+                print(f"[Documents] {error}")
+                try:
+                    await supabase.update(
+                        "documents", {"pdf_status": "failed", "pdf_error": error},
+                        {"id": result["id"], "user_id": user_id}
+                    )
+                except Exception as update_error:
+                    print(f"[Documents] Could not mark PDF failed: {update_error}")
+                result = {**result, "pdf_status": "failed", "pdf_error": error}
+            else:
+                if job["status"] != "pending":
+                    # Rendered inline (serverless): return the row with its PDF
+                    rows = await supabase.select("documents", filters={"id": result["id"], "user_id": user_id})
+                    result = rows[0] if rows else result
 
         # Log activity
         await _log_activity(
@@ -392,11 +525,20 @@ async def list_documents(
     doc_status: Optional[str] = Query(None, alias="status"),
     customer_id: Optional[str] = Query(None),
     archived: Optional[bool] = Query(False),
+    limit: Optional[int] = Query(None, ge=1, le=200, description="Page size (enables pagination)"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return"),
     user: dict = Depends(get_current_user),
 ):
-    """List all documents with optional filters for the current user."""
+    """
+    List all documents with optional filters for the current user.
+    Returns a lean column set (see DOCUMENT_LIST_COLUMNS) unless fields= is given.
+    Without limit/cursor the full list is returned; with them the response is
+    { items, next_cursor } using keyset pagination on created_at.
+    """
     try:
         user_id = user["sub"]
+        columns = project_columns(fields, DOCUMENT_LIST_COLUMNS, DOCUMENT_FIELDS, required=("id", "created_at"))
         filters = {"user_id": user_id, "is_archived": archived}
         if type:
             filters["document_type"] = type
@@ -405,20 +547,190 @@ async def list_documents(
         if customer_id:
             filters["customer_id"] = customer_id
 
+        if limit is not None or cursor:
+            items, next_cursor = await supabase.select_page(
+                "documents",
+                columns=columns,
+                filters=filters,
+                order_by=("created_at", True),
+                limit=limit or DEFAULT_PAGE_SIZE,
+                cursor=cursor
+            )
+            return {"items": items, "next_cursor": next_cursor}
+
         documents = await supabase.select(
             "documents",
+            columns=columns,
             filters=filters,
             order_by=("created_at", True)  # Descending
         )
         if documents:
             d = documents[0]
-            print(f"[Documents] GET list: {len(documents)} docs, first={d.get('document_number')}, total={d.get('total_amount')}, notes='{d.get('notes', '')}'")
+            print(f"[Documents] GET list: {len(documents)} docs, first={d.get('document_number')}, total={d.get('total_amount')}")
         return documents
+    except ValueError as e:
+        raise HTTPException(400, str(e))
     except Exception as e:
         print(f"[Documents] Error listing documents: {str(e)}")
         raise HTTPException(500, f"Failed to list documents: {str(e)}")
 
 
+class _ZipStream:
+    """Write-only file for zipfile that hands its output to the response in chunks."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+async def _iter_export_documents(user_id: str, filters: dict, range_filters: list):
+    """Documents to export, oldest first, read page by page."""
+    cursor = None
+    while True:
+        rows, cursor = await supabase.select_page(
+            "documents",
+            columns=EXPORT_COLUMNS,
+            filters={"user_id": user_id, **filters},
+            order_by=("created_at", False),
+            limit=EXPORT_PAGE_SIZE,
+            cursor=cursor,
+            range_filters=range_filters
+        )
+        for row in rows:
+            yield row
+        if not cursor:
+            return
+
+
+async def _fetch_export_pdf(doc: dict, user_id: str):
+    """
+    (pdf_bytes, error) for one document; documents without a PDF are rendered
+    first, except those whose PDF job is still pending (rendering them here
+    would race the job and leave an orphaned PDF). A pending document whose
+    job is stale is marked failed and rendered here instead.
+    """
+    try:
+        storage_path = doc.get("storage_path")
+        if not storage_path and doc.get("pdf_status") == "pending":
+            if not await get_pdf_job_queue().fail_if_stale(doc["id"], user_id, doc.get("created_at")):
+                return None, "PDF is still being generated, export again later"
+        if not storage_path:
+            _, pdf_result = await render_stored_document_pdf(doc["id"], user_id, lane="batch")
+            storage_path = pdf_result["storage_path"]
+        pdf_bytes = await download_from_storage(storage_path)
+        if pdf_bytes is None:
+            return None, "PDF not found in storage"
+        return pdf_bytes, None
+    except Exception as e:
+        return None, str(getattr(e, "detail", None) or e)[:200]
+
+
+async def _fetch_export_pdfs(documents, user_id: str):
+    """
+    Yield (doc, pdf_bytes, error) in document order with at most
+    EXPORT_CONCURRENCY fetches in flight, so memory is bounded by that window.
+    """
+    pending = deque()
+    try:
+        async for doc in documents:
+            pending.append((doc, asyncio.ensure_future(_fetch_export_pdf(doc, user_id))))
+            if len(pending) >= EXPORT_CONCURRENCY:
+                doc, task = pending.popleft()
+                yield (doc, *await task)
+        while pending:
+            doc, task = pending.popleft()
+            yield (doc, *await task)
+    finally:
+        for _, task in pending:
+            task.cancel()
+
+
+async def _stream_export_zip(documents, user_id: str):
+    """
+    Write each PDF into the ZIP as it arrives and yield the bytes. The CSV
+    ledger is spooled to a temp file meanwhile and copied in last, so memory
+    doesn't grow with the number of documents.
+    """
+    stream = _ZipStream()
+    ledger = tempfile.TemporaryFile(mode="w+", newline="", encoding="utf-8")
+    writer = csv.writer(ledger)
+    writer.writerow(EXPORT_LEDGER_COLUMNS)
+    names = set()
+
+    # PDFs are already compressed; only the ledger is deflated
+    with ledger, zipfile.ZipFile(stream, "w", compression=zipfile.ZIP_STORED) as archive:
+        async for doc, pdf_bytes, error in _fetch_export_pdfs(documents, user_id):
+            name = ""
+            if pdf_bytes is not None:
+                base = re.sub(r"[^\w.-]+", "_", f"{doc['document_type']}_{doc['document_number']}")
+                name = f"{base}.pdf" if f"{base}.pdf" not in names else f"{base}_{doc['id']}.pdf"
+                names.add(name)
+                archive.writestr(name, pdf_bytes)
+            else:
+                print(f"[Documents] Export skipped {doc.get('document_number')}: {error}")
+            writer.writerow([
+                doc.get("document_number"), doc.get("document_type"), doc.get("date"),
+                doc.get("due_date"), doc.get("customer_name"), doc.get("status"),
+                doc.get("subtotal"), doc.get("btw_amount"), doc.get("total_amount"),
+                name, error or "",
+            ])
+            yield stream.drain()
+
+        entry = zipfile.ZipInfo("ledger.csv", date_time=time.localtime()[:6])
+        entry.compress_type = zipfile.ZIP_DEFLATED
+        ledger.seek(0)
+        with archive.open(entry, "w") as out:
+            while chunk := ledger.read(64 * 1024):
+                out.write(chunk.encode("utf-8"))
+                yield stream.drain()
+    yield stream.drain()
+
+
+@router.get("/export.zip")
+async def export_documents_zip(
+    date_from: Optional[str] = Query(None, alias="from", description="First document date (YYYY-MM-DD)"),
+    date_to: Optional[str] = Query(None, alias="to", description="Last document date (YYYY-MM-DD)"),
+    type: Optional[str] = Query(None, description="invoice or quote"),
+    user: dict = Depends(get_current_user),
+):
+    """
+    Stream a ZIP of the PDFs of every document dated within [from, to]
+    (archived ones included), plus ledger.csv listing each document. The ZIP is
+    built while it is sent: PDFs are downloaded from storage a few at a time,
+    and documents without a PDF are rendered first (unless their PDF job is
+    still pending). A document whose PDF can't be included is listed in the
+    ledger with the reason.
+    """
+    range_filters = []
+    for op, value in (("gte", date_from), ("lte", date_to)):
+        if not value:
+            continue
+        try:
+            range_filters.append(("date", op, date.fromisoformat(value).isoformat()))
+        except ValueError:
+            raise HTTPException(400, f"Invalid date: {value} (expected YYYY-MM-DD)")
+    filters = {"document_type": type} if type else {}
+
+    user_id = user["sub"]
+    filename = "_".join(["documents", date_from or "all", date_to or "now"]) + ".zip"
+    return StreamingResponse(
+        _stream_export_zip(_iter_export_documents(user_id, filters, range_filters), user_id),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
 @router.get("/{document_id}")
 async def get_document(document_id: str, user: dict = Depends(get_current_user)):
     """Get a single document by ID for the current user."""
@@ -454,24 +766,10 @@ async def update_document(document_id: str, update_data: dict, user: dict = Depe
             template_id = update_data.get("template_id", existing_doc.get("template_id"))
             customer_id = update_data.get("customer_id") or existing_doc.get("customer_id")
 
-            # Fetch template
-            templates = await supabase.select("templates", filters={"id": template_id, "user_id": user_id})
-            if not templates:
-                raise HTTPException(404, "Template not found")
-            template = templates[0]
+            # Fetch template, company settings and customer in parallel
+            template, company_settings, customer = await fetch_render_context(user_id, template_id, customer_id)
             template_json = template["template_json"]
 
-            # Fetch company settings
-            settings_rows = await supabase.select("company_settings", filters={"user_id": user_id})
-            company_settings = settings_rows[0] if settings_rows else get_default_settings()
-
-            # Fetch customer
-            customer = None
-            if customer_id:
-                customers = await supabase.select("customers", filters={"id": customer_id, "user_id": user_id})
-                if customers:
-                    customer = customers[0]
-
             # Dates
             date_str = update_data.get("date") or existing_doc.get("date", "")
             due_date_str = update_data.get("due_date") or existing_doc.get("due_date", "")
@@ -492,20 +790,19 @@ async def update_document(document_id: str, update_data: dict, user: dict = Depe
             generate = update_data.get("generate_pdf", False)
             pdf_url = existing_doc.get("pdf_url")
             storage_path = existing_doc.get("storage_path")
+            thumbnail_url = existing_doc.get("thumbnail_url")
+            content_hash = existing_doc.get("render_hash")
 
             if generate:
-                # Delete old PDF if it exists
-                if storage_path:
-                    try:
-                        await delete_from_storage(storage_path)
-                    except Exception:
-                        pass
-                pdf_result = await generate_pdf(
-                    template_json, input_data,
+                # Re-render unless template and inputs are unchanged
+                pdf_result = await render_document_pdf(
+                    existing_doc, template_json, input_data,
                     filename=f"{document_type}_{document_number}"
                 )
                 pdf_url = pdf_result["pdf_url"]
                 storage_path = pdf_result["storage_path"]
+                thumbnail_url = pdf_result["thumbnail_url"]
+                content_hash = pdf_result["render_hash"]
 
             # Convert display dates to ISO for DB
             def display_to_iso(dd_mm_yyyy):
@@ -534,7 +831,11 @@ async def update_document(document_id: str, update_data: dict, user: dict = Depe
                 "status": "sent" if generate else existing_doc.get("status", "concept"),
                 "pdf_url": pdf_url,
                 "storage_path": storage_path,
+                "thumbnail_url": thumbnail_url,
+                "render_hash": content_hash,
             }
+            if generate:
+                clean_data.update({"pdf_status": "ready", "pdf_error": None})
         else:
             # Simple update (status/notes only)
             allowed = ["status", "notes"]
@@ -593,88 +894,192 @@ async def update_document(document_id: str, update_data: dict, user: dict = Depe
         raise HTTPException(500, f"Failed to update document: {str(e)}")
 
 
+async def render_stored_document_pdf(document_id: str, user_id: str, lane: str = "document"):
+    """
+    Render (or reuse, see render_document_pdf) the PDF of a stored document and
+    save pdf_url/storage_path/thumbnail_url/render_hash with pdf_status=ready on its row.
+    Shared by POST /{id}/generate-pdf, the background job queue and the ZIP
+    export (which renders in the batch lane).
+
+    Returns:
+        (doc, pdf_result)
+
+    Raises:
+        HTTPException: 404/400 if the document or its template is missing
+    """
+    # Document + customer + template in one embedded select, settings alongside
+    (doc, customer, template), settings = await gather_or_raise(
+        load_document_for_render(document_id, user_id),
+        get_company_settings(user_id),
+    )
+    if not doc:
+        raise HTTPException(404, "Document not found")
+    if not doc.get("template_id"):
+        raise HTTPException(400, "Document has no template assigned")
+    if not template:
+        raise HTTPException(404, "Template not found")
+    template_json = template["template_json"]
+    company_settings = settings or get_default_settings()
+
+    # Build dates (stored as ISO in DB, convert to DD-MM-YYYY for display in template)
+    def iso_to_display(iso_date):
+        if not iso_date:
+            return ""
+        parts = str(iso_date).split("-")
+        if len(parts) == 3 and len(parts[0]) == 4:
+            return f"{parts[2]}-{parts[1]}-{parts[0]}"
+        return str(iso_date)
+
+    date_str = iso_to_display(doc.get("date"))
+    due_date_str = iso_to_display(doc.get("due_date"))
+
+    line_items = doc.get("line_items", [])
+    totals = calculate_totals(line_items)
+
+    input_data = build_input_data(
+        template_json, company_settings, customer,
+        line_items, doc["document_number"], date_str, due_date_str,
+        totals, doc["document_type"]
+    )
+
+    # Re-render unless template and inputs are unchanged
+    pdf_result = await render_document_pdf(
+        doc, template_json, input_data,
+        filename=f"{doc['document_type']}_{doc['document_number']}",
+        lane=lane
+    )
+
+    # Update document record with new PDF URL (unchanged on a cache hit)
+    if pdf_result["storage_path"] != doc.get("storage_path") or doc.get("pdf_status") != "ready":
+        await supabase.update(
+            "documents",
+            {
+                "pdf_url": pdf_result["pdf_url"],
+                "storage_path": pdf_result["storage_path"],
+                "thumbnail_url": pdf_result["thumbnail_url"],
+                "render_hash": pdf_result["render_hash"],
+                "pdf_status": "ready",
+                "pdf_error": None,
+            },
+            {"id": document_id, "user_id": user_id}
+        )
+
+    return doc, pdf_result
+
+
 @router.post("/{document_id}/generate-pdf")
 async def generate_document_pdf(document_id: str, user: dict = Depends(get_current_user)):
     """Generate (or re-generate) PDF for an existing document."""
+    try:
+        doc, pdf_result = await render_stored_document_pdf(document_id, user["sub"])
+
+        return {
+            "pdf_url": pdf_result["pdf_url"],
+            "document_number": doc["document_number"],
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[Documents] Error generating PDF for document: {str(e)}")
+        raise HTTPException(500, f"Failed to generate PDF: {str(e)}")
+
+
+@router.get("/{document_id}/pdf-status")
+async def get_document_pdf_status(document_id: str, user: dict = Depends(get_current_user)):
+    """
+    PDF render status for polling after create: pending, ready or failed
+    (with error). Documents created before the job queue report ready when
+    they have a PDF and none otherwise. A pending document whose job is stale
+    (see PDFJobQueue.fail_if_stale) is marked failed so it can be regenerated.
+    """
     try:
         user_id = user["sub"]
-        rows = await supabase.select("documents", filters={"id": document_id, "user_id": user_id})
+        rows = await supabase.select(
+            "documents", columns="id,pdf_status,pdf_url,pdf_error,created_at",
+            filters={"id": document_id, "user_id": user_id}
+        )
         if not rows:
             raise HTTPException(404, "Document not found")
 
         doc = rows[0]
+        if doc.get("pdf_status") == "pending":
+            error = await get_pdf_job_queue().fail_if_stale(doc["id"], user_id, doc.get("created_at"))
+            if error:
+                doc = {**doc, "pdf_status": "failed", "pdf_error": error}
 
-        # Fetch template
-        template_id = doc.get("template_id")
-        if not template_id:
-            raise HTTPException(400, "Document has no template assigned")
-        templates_rows = await supabase.select("templates", filters={"id": template_id, "user_id": user_id})
-        if not templates_rows:
-            raise HTTPException(404, "Template not found")
-        template_json = templates_rows[0]["template_json"]
+        pdf_status = doc.get("pdf_status") or ("ready" if doc.get("pdf_url") else "none")
+        return {
+            "document_id": doc["id"],
+            "pdf_status": pdf_status,
+            "pdf_url": doc.get("pdf_url") if pdf_status == "ready" else None,
+            "error": doc.get("pdf_error") if pdf_status == "failed" else None,
+        }
 
-        # Fetch company settings
-        settings_rows = await supabase.select("company_settings", filters={"user_id": user_id})
-        company_settings = settings_rows[0] if settings_rows else get_default_settings()
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(500, f"Failed to get PDF status: {str(e)}")
 
-        # Fetch customer
-        customer = None
-        if doc.get("customer_id"):
-            customers = await supabase.select("customers", filters={"id": doc["customer_id"], "user_id": user_id})
-            if customers:
-                customer = customers[0]
-
-        # Build dates (stored as ISO in DB, convert to DD-MM-YYYY for display in template)
-        def iso_to_display(iso_date):
-            if not iso_date:
-                return ""
-            parts = str(iso_date).split("-")
-            if len(parts) == 3 and len(parts[0]) == 4:
-                return f"{parts[2]}-{parts[1]}-{parts[0]}"
-            return str(iso_date)
 
-        date_str = iso_to_display(doc.get("date"))
-        due_date_str = iso_to_display(doc.get("due_date"))
+# In-flight lazy thumbnail renders by storage path, so concurrent requests share one
+_thumbnail_tasks: dict = {}
 
-        line_items = doc.get("line_items", [])
-        totals = calculate_totals(line_items)
 
-        input_data = build_input_data(
-            template_json, company_settings, customer,
-            line_items, doc["document_number"], date_str, due_date_str,
-            totals, doc["document_type"]
+async def _create_thumbnail(document_id: str, user_id: str, storage_path: str) -> Optional[str]:
+    pdf_bytes = await download_from_storage(storage_path)
+    if pdf_bytes is None:
+        raise HTTPException(404, "PDF not found in storage")
+    thumbnail_url = await store_thumbnail(pdf_bytes, storage_path)
+    if thumbnail_url:
+        # Only if the PDF wasn't replaced meanwhile
+        await supabase.update_many(
+            "documents", {"thumbnail_url": thumbnail_url},
+            {"id": document_id, "user_id": user_id, "storage_path": storage_path}
         )
+    return thumbnail_url
 
-        # Delete old PDF if exists
-        if doc.get("storage_path"):
-            try:
-                await delete_from_storage(doc["storage_path"])
-            except Exception:
-                pass
 
-        # Generate new PDF
-        pdf_result = await generate_pdf(
-            template_json, input_data,
-            filename=f"{doc['document_type']}_{doc['document_number']}"
-        )
-
-        # Update document record with new PDF URL
-        await supabase.update(
-            "documents",
-            {"pdf_url": pdf_result["pdf_url"], "storage_path": pdf_result["storage_path"]},
-            {"id": document_id, "user_id": user_id}
+@router.get("/{document_id}/thumbnail")
+async def get_document_thumbnail(document_id: str, user: dict = Depends(get_current_user)):
+    """
+    URL of the page-1 thumbnail of a document's PDF. Documents rendered before
+    thumbnails existed get theirs on first request: the stored PDF is
+    rasterized once and the URL saved on the row for every later request.
+    """
+    try:
+        user_id = user["sub"]
+        rows = await supabase.select(
+            "documents", columns="id,storage_path,thumbnail_url",
+            filters={"id": document_id, "user_id": user_id}
         )
+        if not rows:
+            raise HTTPException(404, "Document not found")
 
-        return {
-            "pdf_url": pdf_result["pdf_url"],
-            "document_number": doc["document_number"],
-        }
+        doc = rows[0]
+        if doc.get("thumbnail_url"):
+            return {"document_id": doc["id"], "thumbnail_url": doc["thumbnail_url"]}
+        storage_path = doc.get("storage_path")
+        if not storage_path:
+            raise HTTPException(404, "Document has no PDF")
+        if not THUMBNAILS_ENABLED:
+            raise HTTPException(501, "Thumbnails are not available (PyMuPDF is not installed)")
+
+        task = _thumbnail_tasks.get(storage_path)
+        if task is None:
+            task = asyncio.ensure_future(_create_thumbnail(document_id, user_id, storage_path))
+            _thumbnail_tasks[storage_path] = task
+            task.add_done_callback(lambda _: _thumbnail_tasks.pop(storage_path, None))
+        thumbnail_url = await asyncio.shield(task)
+
+        if not thumbnail_url:
+            raise HTTPException(500, "Failed to create thumbnail")
+        return {"document_id": doc["id"], "thumbnail_url": thumbnail_url}
 
     except HTTPException:
         raise
     except Exception as e:
-        print(f"[Documents] Error generating PDF for document: {str(e)}")
-        raise HTTPException(500, f"Failed to generate PDF: {str(e)}")
+        raise HTTPException(500, f"Failed to get thumbnail: {str(e)}")
 
 
 @router.delete("/{document_id}")
@@ -688,10 +1093,12 @@ async def delete_document(document_id: str, user: dict = Depends(get_current_use
 
         doc = rows[0]
 
-        # Try to delete stored PDF
+        # Try to delete stored PDF and its thumbnail
         if doc.get("storage_path"):
             try:
-                await delete_from_storage(doc["storage_path"])
+                await asyncio.gather(
+                    delete_from_storage(doc["storage_path"]), delete_thumbnail(doc["storage_path"])
+                )
             except Exception:
                 pass  # Non-blocking
 
@@ -3,17 +3,26 @@ Email Events API — List, dismiss, and count unread email events.
 """
 from fastapi import APIRouter, HTTPException, status, Query, Depends
 from typing import Optional
-from .supabase_client import supabase
+from .supabase_client import supabase, project_columns
 from .auth_middleware import get_current_user
 
 router = APIRouter()
 
+# Columns returned by the list route; raw_payload only on request via ?fields=
+EMAIL_EVENT_LIST_COLUMNS = [
+    "id", "document_id", "document_send_id", "event_type", "from_email",
+    "subject", "body_snippet", "detected_intent", "processed", "created_at",
+]
+
+EMAIL_EVENT_FIELDS = set(EMAIL_EVENT_LIST_COLUMNS) | {"raw_payload"}
+
 
 @router.get("/api/email-events")
 async def get_email_events(
     document_id: Optional[str] = Query(None),
     processed: Optional[bool] = Query(None),
     limit: int = Query(50, ge=1, le=200),
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return"),
     user: dict = Depends(get_current_user)
 ):
     """
@@ -22,6 +31,7 @@ async def get_email_events(
     """
     try:
         user_id = user["sub"]
+        columns = project_columns(fields, EMAIL_EVENT_LIST_COLUMNS, EMAIL_EVENT_FIELDS)
         filters = {"user_id": user_id}
         if document_id:
             filters["document_id"] = document_id
@@ -30,10 +40,14 @@ async def get_email_events(
 
         rows = await supabase.select(
             "email_events",
+            columns=columns,
             filters=filters,
-            order_by=("created_at", True)
+            order_by=("created_at", True),
+            limit=limit
         )
-        return rows[:limit]
+        return rows
+    except ValueError as e:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, str(e))
     except Exception as e:
         print(f"[EmailEvents] Error fetching events: {e}")
         raise HTTPException(
@@ -47,12 +61,11 @@ async def get_unread_count(user: dict = Depends(get_current_user)):
     """Get the count of unprocessed email events."""
     try:
         user_id = user["sub"]
-        rows = await supabase.select(
+        count = await supabase.count(
             "email_events",
-            columns="id",
             filters={"user_id": user_id, "processed": False}
         )
-        return {"count": len(rows)}
+        return {"count": count}
     except Exception as e:
         print(f"[EmailEvents] Error fetching unread count: {e}")
         raise HTTPException(
@@ -89,20 +102,13 @@ async def dismiss_all_events(user: dict = Depends(get_current_user)):
     """Mark all email events as processed for the current user."""
     try:
         user_id = user["sub"]
-        # Get all unprocessed events
-        rows = await supabase.select(
+        # One filtered PATCH marks every unprocessed event for this user
+        dismissed = await supabase.update_many(
             "email_events",
-            columns="id",
-            filters={"user_id": user_id, "processed": False}
+            {"processed": True},
+            {"user_id": user_id, "processed": False}
         )
-        # Update each one (Supabase REST doesn't support bulk update easily)
-        for row in rows:
-            await supabase.update(
-                "email_events",
-                {"processed": True},
-                {"id": row["id"], "user_id": user_id}
-            )
-        return {"dismissed": len(rows)}
+        return {"dismissed": dismissed}
     except Exception as e:
         print(f"[EmailEvents] Error dismissing all events: {e}")
         raise HTTPException(
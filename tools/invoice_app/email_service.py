@@ -2,9 +2,9 @@
 Email Service — Abstract provider with Resend and Manual implementations.
 """
 import os
-import httpx
 from abc import ABC, abstractmethod
 from dotenv import load_dotenv
+from .http_client import get_http_client
 
 load_dotenv()
 
@@ -58,29 +58,29 @@ class ResendProvider(EmailProvider):
             payload["attachments"] = attachments
 
         try:
-            async with httpx.AsyncClient() as client:
-                resp = await client.post(
-                    "https://api.resend.com/emails",
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Content-Type": "application/json",
-                    },
-                    json=payload,
-                    timeout=15,
-                )
-                if resp.status_code in (200, 201):
-                    data = resp.json()
-                    return {
-                        "provider_message_id": data.get("id"),
-                        "delivery_status": "sent",
-                        "error_message": None,
-                    }
-                else:
-                    return {
-                        "provider_message_id": None,
-                        "delivery_status": "failed",
-                        "error_message": f"Resend API {resp.status_code}: {resp.text}",
-                    }
+            client = get_http_client()
+            resp = await client.post(
+                "https://api.resend.com/emails",
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json",
+                },
+                json=payload,
+                timeout=15,
+            )
+            if resp.status_code in (200, 201):
+                data = resp.json()
+                return {
+                    "provider_message_id": data.get("id"),
+                    "delivery_status": "sent",
+                    "error_message": None,
+                }
+            else:
+                return {
+                    "provider_message_id": None,
+                    "delivery_status": "failed",
+                    "error_message": f"Resend API {resp.status_code}: {resp.text}",
+                }
         except Exception as e:
             return {
                 "provider_message_id": None,
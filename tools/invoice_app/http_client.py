@@ -0,0 +1,126 @@
+"""
+Shared HTTP connection pool
+One long-lived httpx.AsyncClient reused by Supabase REST, Storage and Resend calls,
+so requests reuse keep-alive (and optionally HTTP/2) connections instead of paying
+TCP+TLS setup on every call.
+"""
+import os
+import time
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Pool configuration
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_SECONDS", "30"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT_SECONDS", "10"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", "5"))
+HTTP_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT_SECONDS", "5"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "false").lower() == "true"
+
+_client: httpx.AsyncClient | None = None
+_stats = {
+    "clients_created": 0,
+    "requests_total": 0,
+    "responses_total": 0,
+    "last_request_at": None,
+}
+
+
+def _http2_available() -> bool:
+    """HTTP/2 needs the optional 'h2' package (pip install httpx[http2])."""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+async def _on_request(request: httpx.Request):
+    _stats["requests_total"] += 1
+    _stats["last_request_at"] = time.time()
+
+
+async def _on_response(response: httpx.Response):
+    _stats["responses_total"] += 1
+
+
+def _build_client() -> httpx.AsyncClient:
+    http2 = HTTP2_ENABLED and _http2_available()
+    if HTTP2_ENABLED and not http2:
+        print("[HTTP] HTTP2_ENABLED=true but 'h2' is not installed, falling back to HTTP/1.1")
+
+    _stats["clients_created"] += 1
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            HTTP_TIMEOUT,
+            connect=HTTP_CONNECT_TIMEOUT,
+            pool=HTTP_POOL_TIMEOUT,
+        ),
+        event_hooks={"request": [_on_request], "response": [_on_response]},
+    )
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Return the shared client, creating it on first use.
+    The app lifespan opens it on startup; lazy creation keeps serverless
+    entrypoints and scripts working without the startup hook.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
+
+
+async def open_http_client():
+    """Create the shared client (called from the FastAPI startup hook)."""
+    client = get_http_client()
+    print(f"[HTTP] Connection pool ready (max={HTTP_MAX_CONNECTIONS}, "
+          f"keepalive={HTTP_MAX_KEEPALIVE_CONNECTIONS}, http2={HTTP2_ENABLED and _http2_available()})")
+    return client
+
+
+async def close_http_client():
+    """Close the shared client and release its connections (called on shutdown)."""
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+
+
+def get_pool_stats() -> dict:
+    """
+    Snapshot of pool usage for monitoring.
+    Connection counts come from httpcore's pool and are best-effort.
+    """
+    connections = []
+    if _client is not None and not _client.is_closed:
+        pool = getattr(_client._transport, "_pool", None)
+        connections = list(getattr(pool, "connections", []) or [])
+
+    idle = sum(1 for c in connections if c.is_idle())
+    http2_connections = sum(
+        1 for c in connections
+        if type(getattr(c, "_connection", None)).__name__ == "AsyncHTTP2Connection"
+    )
+
+    return {
+        "open": _client is not None and not _client.is_closed,
+        "http2_enabled": HTTP2_ENABLED and _http2_available(),
+        "max_connections": HTTP_MAX_CONNECTIONS,
+        "max_keepalive_connections": HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        "connections": len(connections),
+        "idle_connections": idle,
+        "active_connections": len(connections) - idle,
+        "http2_connections": http2_connections,
+        **_stats,
+    }
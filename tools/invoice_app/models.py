@@ -25,6 +25,7 @@ class TemplateResponse(BaseModel):
     description: Optional[str]
     template_json: Dict[str, Any]
     thumbnail_base64: Optional[str] = None  # NEW: Template preview thumbnail
+    thumbnail_url: Optional[str] = None     # Page-1 PNG rendered server-side (see thumbnails.py)
     payment_status: str = "free"             # NEW: Payment status (free, paid, premium)
     created_at: datetime
     updated_at: datetime
@@ -32,6 +33,24 @@ class TemplateResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class TemplateListItem(BaseModel):
+    """Lean template row for list views (template_json only when requested via fields=)"""
+    id: UUID
+    name: Optional[str] = None
+    description: Optional[str] = None
+    template_json: Optional[Dict[str, Any]] = None
+    thumbnail_base64: Optional[str] = None
+    thumbnail_url: Optional[str] = None
+    payment_status: Optional[str] = None
+    is_archived: Optional[bool] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+class TemplatePage(BaseModel):
+    """One page of templates from a keyset-paginated list"""
+    items: List[TemplateListItem]
+    next_cursor: Optional[str] = None
+
 class PDFGenerateRequest(BaseModel):
     """Model for PDF generation request"""
     template_id: UUID = Field(..., description="Template ID to use for generation")
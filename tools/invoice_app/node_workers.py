@@ -0,0 +1,27 @@
+"""
+Node Workers — addresses of the Node.js render worker processes.
+Kept free of app imports: tools/start_invoice_app.py uses it to spawn the
+workers before the backend (and its Supabase/HTTP client state) is loaded,
+and pdf_generator.py uses it to route renders to the same workers.
+"""
+import os
+
+
+def node_worker_addresses(count: int = None) -> list:
+    """
+    (port, socket_path) of each render worker, from the environment. Worker i
+    listens on NODE_SERVICE_PORT + i and, with NODE_SERVICE_SOCKET set, on that
+    path (worker 0) or "<path>.<i>". count defaults to NODE_SERVICE_WORKERS.
+    """
+    if count is None:
+        count = max(1, int(os.getenv("NODE_SERVICE_WORKERS", "1")))
+    port = int(os.getenv("NODE_SERVICE_PORT", "3001"))
+    socket = os.getenv("NODE_SERVICE_SOCKET", "")
+
+    addresses = []
+    for i in range(count):
+        socket_path = ""
+        if socket:
+            socket_path = socket if i == 0 else f"{socket}.{i}"
+        addresses.append((port + i, socket_path))
+    return addresses
@@ -3,19 +3,67 @@ PDF Generator Bridge
 Calls Node.js service to generate PDFs and handles Supabase Storage uploads
 """
 import os
+import math
+import time
+import json
+import asyncio
+import hashlib
 import httpx
 import base64
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from uuid import uuid4
+from fastapi import HTTPException
 
 # Get Node.js service configuration
 NODE_SERVICE_HOST = os.getenv("NODE_SERVICE_HOST", "localhost")
 NODE_SERVICE_PORT = os.getenv("NODE_SERVICE_PORT", "3001")
 NODE_SERVICE_URL = f"http://{NODE_SERVICE_HOST}:{NODE_SERVICE_PORT}"
+# Optional Unix domain socket of a co-located Node.js service (see pdf_service.js)
+NODE_SERVICE_SOCKET = os.getenv("NODE_SERVICE_SOCKET", "")
+NODE_SERVICE_TIMEOUT = 30.0
+# Render workers: one Node.js process per port (NODE_SERVICE_PORT + i), started by the launcher
+NODE_SERVICE_WORKERS = max(1, int(os.getenv("NODE_SERVICE_WORKERS", "1")))
+NODE_HEALTH_INTERVAL_SECONDS = float(os.getenv("NODE_HEALTH_INTERVAL_SECONDS", "10"))
+# Batch rendering: inputs per /generate-batch call, and how long the batcher
+# waits for more documents with the same template before rendering
+NODE_BATCH_SIZE = max(1, int(os.getenv("NODE_BATCH_SIZE", "50")))
+NODE_BATCH_WINDOW_SECONDS = float(os.getenv("NODE_BATCH_WINDOW_SECONDS", "0.25"))
+# A /generate-batch call may take NODE_SERVICE_TIMEOUT plus this much per document
+NODE_BATCH_SECONDS_PER_DOCUMENT = float(os.getenv("NODE_BATCH_SECONDS_PER_DOCUMENT", "2"))
+# Templates each Node.js worker keeps registered by hash (same setting as pdf_service.js)
+TEMPLATE_REGISTRY_SIZE = int(os.getenv("TEMPLATE_REGISTRY_SIZE", "200"))
+
+# Render admission control: renders in flight across all workers, and how many
+# may wait per priority lane before new ones are shed with 503 + Retry-After
+RENDER_MAX_CONCURRENCY = max(1, int(os.getenv("RENDER_MAX_CONCURRENCY", str(NODE_SERVICE_WORKERS * 2))))
+RENDER_LANES = ("interactive", "document", "batch")  # highest priority first
+# Batch chunks hold a slot for their whole render, so at most this many run at once,
+# leaving slots free for the other lanes (0 = RENDER_MAX_CONCURRENCY - 1)
+RENDER_BATCH_MAX_IN_FLIGHT = max(0, int(os.getenv("RENDER_BATCH_MAX_IN_FLIGHT", "0")))
+RENDER_QUEUE_LIMITS = {
+    "interactive": int(os.getenv("RENDER_QUEUE_LIMIT_INTERACTIVE", "20")),
+    "document": int(os.getenv("RENDER_QUEUE_LIMIT_DOCUMENT", "100")),
+    "batch": int(os.getenv("RENDER_QUEUE_LIMIT_BATCH", "1000")),
+}
+
+# Designer previews: a revision arriving within this window of the previous one
+# for the same preview slot waits it out, so a newer revision can replace it
+PREVIEW_COALESCE_SECONDS = float(os.getenv("PREVIEW_COALESCE_MS", "150")) / 1000
+PREVIEW_RESULT_TTL_SECONDS = float(os.getenv("PREVIEW_RESULT_TTL_SECONDS", "600"))
+
+# Bump when the Node.js renderer output changes (pdfme upgrade, plugin patch)
+# so stored render hashes stop matching and documents are re-rendered
+RENDER_CACHE_VERSION = 1
 
 # Import Supabase client
 from .supabase_client import supabase, SUPABASE_STORAGE_BUCKET
+from .http_client import get_http_client
+from .thumbnails import store_thumbnail
+from .cache import Cache
+from .node_workers import node_worker_addresses
 
 
 class PDFGenerationError(Exception):
@@ -23,10 +71,678 @@ class PDFGenerationError(Exception):
     pass
 
 
+class RenderQueueFull(HTTPException):
+    """Render lane is saturated: 503 with a Retry-After estimate."""
+
+    def __init__(self, lane: str, retry_after: int):
+        super().__init__(
+            status_code=503,
+            detail=f"PDF renderer is busy ({lane} queue full), retry in {retry_after}s",
+            headers={"Retry-After": str(retry_after)},
+        )
+        self.lane = lane
+        self.retry_after = retry_after
+
+
+class RenderScheduler:
+    """
+    Admission control in front of the Node.js workers.
+    At most max_concurrency renders run at once. Waiting renders are queued
+    per lane (interactive > document > batch, strict priority) and, within a
+    lane, per user: users take turns, so one user's hundred renders can't
+    starve another user's single preview. A lane that already has its limit
+    of waiters sheds new renders with RenderQueueFull. At most
+    batch_max_in_flight batch renders run at once, so a long batch chunk
+    never takes the slot an interactive or document render needs.
+    """
+
+    def __init__(self, max_concurrency: int = RENDER_MAX_CONCURRENCY, queue_limits: dict = None,
+                 batch_max_in_flight: int = None):
+        self.max_concurrency = max_concurrency
+        self.queue_limits = queue_limits or RENDER_QUEUE_LIMITS
+        self.batch_max_in_flight = batch_max_in_flight or RENDER_BATCH_MAX_IN_FLIGHT or max(1, max_concurrency - 1)
+        self.in_flight = 0
+        self._lane_in_flight = {lane: 0 for lane in RENDER_LANES}
+        self._waiting = {lane: OrderedDict() for lane in RENDER_LANES}  # user -> deque of futures
+        self._depth = {lane: 0 for lane in RENDER_LANES}
+        self._admitted = {lane: 0 for lane in RENDER_LANES}
+        self._shed = {lane: 0 for lane in RENDER_LANES}
+        self._waits = {lane: deque(maxlen=500) for lane in RENDER_LANES}
+        self._max_wait = {lane: 0.0 for lane in RENDER_LANES}
+        self._render_seconds = 1.0  # moving average, for Retry-After
+
+    @asynccontextmanager
+    async def slot(self, lane: str = "document", user_id: Optional[str] = None):
+        """Hold a render slot for the duration of the block."""
+        await self._acquire(lane, user_id or "")
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._render_seconds = 0.9 * self._render_seconds + 0.1 * (time.monotonic() - started)
+            self._release(lane)
+
+    def _can_start(self, lane: str) -> bool:
+        if self.in_flight >= self.max_concurrency:
+            return False
+        return lane != "batch" or self._lane_in_flight["batch"] < self.batch_max_in_flight
+
+    def _start(self, lane: str):
+        self.in_flight += 1
+        self._lane_in_flight[lane] += 1
+
+    def _release(self, lane: str):
+        self.in_flight -= 1
+        self._lane_in_flight[lane] -= 1
+        self._dispatch()
+
+    async def _acquire(self, lane: str, user_key: str):
+        queued_at = time.monotonic()
+        if self._can_start(lane) and not any(self._depth.values()):
+            self._start(lane)
+            self._record_wait(lane, 0.0)
+            return
+
+        if self._depth[lane] >= self.queue_limits[lane]:
+            self._shed[lane] += 1
+            retry_after = max(1, math.ceil(
+                self._render_seconds * (sum(self._depth.values()) + 1) / self.max_concurrency
+            ))
+            raise RenderQueueFull(lane, retry_after)
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[lane].setdefault(user_key, deque()).append(future)
+        self._depth[lane] += 1
+        # Batch waiters held back by the cap may leave a slot this render can take
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Slot was handed over just before the cancellation: pass it on
+                self._release(lane)
+            else:
+                self._discard(lane, user_key, future)
+            raise
+        self._record_wait(lane, time.monotonic() - queued_at)
+
+    def _discard(self, lane: str, user_key: str, future):
+        queue = self._waiting[lane].get(user_key)
+        if queue and future in queue:
+            queue.remove(future)
+            self._depth[lane] -= 1
+            if not queue:
+                del self._waiting[lane][user_key]
+
+    def _dispatch(self):
+        """Hand free slots to waiters: highest lane first, round-robin over users."""
+        while self.in_flight < self.max_concurrency:
+            lane = next((name for name in RENDER_LANES if self._waiting[name] and self._can_start(name)), None)
+            if lane is None:
+                return
+            users = self._waiting[lane]
+            user_key, queue = next(iter(users.items()))
+            future = queue.popleft()
+            self._depth[lane] -= 1
+            if queue:
+                users.move_to_end(user_key)
+            else:
+                del users[user_key]
+            if future.done():
+                continue
+            self._start(lane)
+            future.set_result(None)
+
+    def _record_wait(self, lane: str, seconds: float):
+        self._admitted[lane] += 1
+        self._waits[lane].append(seconds)
+        self._max_wait[lane] = max(self._max_wait[lane], seconds)
+
+    def stats(self) -> dict:
+        lanes = {}
+        for lane in RENDER_LANES:
+            waits = sorted(self._waits[lane])
+            lanes[lane] = {
+                "depth": self._depth[lane],
+                "in_flight": self._lane_in_flight[lane],
+                "limit": self.queue_limits[lane],
+                "waiting_users": len(self._waiting[lane]),
+                "admitted": self._admitted[lane],
+                "shed": self._shed[lane],
+                "wait_avg_ms": round(sum(waits) / len(waits) * 1000, 1) if waits else None,
+                "wait_p95_ms": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 1) if waits else None,
+                "wait_max_ms": round(self._max_wait[lane] * 1000, 1),
+            }
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "batch_max_in_flight": self.batch_max_in_flight,
+            "avg_render_ms": round(self._render_seconds * 1000, 1),
+            "lanes": lanes,
+        }
+
+
+_render_scheduler: RenderScheduler | None = None
+
+
+def get_render_scheduler() -> RenderScheduler:
+    """Process-wide render scheduler, created on first use."""
+    global _render_scheduler
+    if _render_scheduler is None:
+        _render_scheduler = RenderScheduler()
+    return _render_scheduler
+
+
+_render_cache_counters = {"hits": 0, "misses": 0}
+
+
+def render_hash(template_json: Dict[str, Any], input_data: Dict[str, Any]) -> str:
+    """
+    Stable content hash of a render: identical template + inputs give the same
+    hash regardless of key order, so an unchanged document can reuse its PDF.
+    """
+    canonical = json.dumps(
+        {"v": RENDER_CACHE_VERSION, "template": template_json, "inputs": input_data},
+        sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def template_hash(template_json: Dict[str, Any]) -> str:
+    """Content hash a template is registered under in the Node.js service."""
+    canonical = json.dumps(template_json, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def record_render_cache(hit: bool):
+    _render_cache_counters["hits" if hit else "misses"] += 1
+
+
+def render_cache_stats() -> dict:
+    """Hit/miss counters of the document render cache (stored render hashes)."""
+    hits, misses = _render_cache_counters["hits"], _render_cache_counters["misses"]
+    lookups = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / lookups, 3) if lookups else None,
+    }
+
+
+class NodeWorker:
+    """One Node.js render process and its connection pool."""
+
+    def __init__(self, port: int, socket_path: str = ""):
+        self.url = f"http://{NODE_SERVICE_HOST}:{port}"
+        self.socket_path = socket_path
+        self.client = httpx.AsyncClient(
+            base_url=self.url,
+            transport=httpx.AsyncHTTPTransport(uds=socket_path) if socket_path else None,
+            timeout=NODE_SERVICE_TIMEOUT,
+        )
+        self.outstanding = 0
+        self.healthy = True
+        self.requests = 0
+        self.failures = 0
+        self.last_error = None
+        self.last_checked_at = None
+        # Template hashes this process has registered (mirrors its LRU)
+        self.templates: OrderedDict = OrderedDict()
+
+    def knows_template(self, template_hash: str) -> bool:
+        if template_hash in self.templates:
+            self.templates.move_to_end(template_hash)
+            return True
+        return False
+
+    def remember_template(self, template_hash: str):
+        self.templates[template_hash] = True
+        self.templates.move_to_end(template_hash)
+        while len(self.templates) > TEMPLATE_REGISTRY_SIZE:
+            self.templates.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {
+            "url": self.url,
+            "socket": self.socket_path or None,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "last_checked_at": self.last_checked_at,
+            "templates": len(self.templates),
+        }
+
+
+class NodeWorkerPool:
+    """
+    Routes requests across render workers by least outstanding requests.
+    A worker that refuses connections is evicted until its /health check
+    passes again (the launcher restarts crashed processes); the request is
+    retried on the next worker.
+    """
+
+    def __init__(self, addresses: list):
+        self.workers = [NodeWorker(port, socket_path) for port, socket_path in addresses]
+        self._next = 0
+        self._health_task = None
+
+    def pick(self) -> NodeWorker:
+        candidates = [w for w in self.workers if w.healthy] or self.workers
+        # Rotate the start so ties spread evenly instead of piling onto worker 0
+        self._next = (self._next + 1) % len(candidates)
+        rotated = candidates[self._next:] + candidates[:self._next]
+        return min(rotated, key=lambda w: w.outstanding)
+
+    async def request(self, method: str, path: str, build=None, **kwargs) -> httpx.Response:
+        """
+        Send a request to the least busy worker. build(worker), if given,
+        returns extra request kwargs for the chosen worker (e.g. a body that
+        depends on which templates it has registered).
+        """
+        tried = set()
+        while True:
+            worker = self.pick()
+            if worker in tried:
+                worker = next((w for w in self.workers if w not in tried), worker)
+            tried.add(worker)
+            worker.outstanding += 1
+            worker.requests += 1
+            try:
+                extra = build(worker) if build else {}
+                return await worker.client.request(method, path, **kwargs, **extra)
+            except (httpx.ConnectError, httpx.RemoteProtocolError) as e:
+                # Process is gone or restarting: evict it and try another worker
+                worker.failures += 1
+                worker.healthy = False
+                worker.last_error = str(e) or type(e).__name__
+                print(f"[PDF Generator] Worker {worker.url} unavailable, evicting: {worker.last_error}")
+                if len(tried) >= len(self.workers):
+                    raise
+            finally:
+                worker.outstanding -= 1
+
+    async def post(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", path, **kwargs)
+
+    async def post_render(self, path: str, template_json: Dict[str, Any], payload: dict,
+                          **kwargs) -> httpx.Response:
+        """
+        POST a render that references its template by hash. The full template is
+        only sent to a worker that hasn't registered it yet; if the worker lost
+        it (LRU eviction, restart) it answers 409 and the render is resent with
+        the template, which registers it again.
+        """
+        content_hash = template_hash(template_json)
+        sent = []  # (worker, template included) per attempt; the last one answered
+
+        def body(worker, resend=False):
+            data = {**payload, "template_hash": content_hash}
+            included = resend or not worker.knows_template(content_hash)
+            if included:
+                data["template"] = template_json
+            sent.append((worker, included))
+            return {"json": data}
+
+        def record(response):
+            # Only a successful render proves the worker registered the template
+            worker, included = sent[-1]
+            if included and response.status_code == 200:
+                worker.remember_template(content_hash)
+
+        response = await self.request("POST", path, build=body, **kwargs)
+        record(response)
+        if response.status_code == 409 and _is_unregistered(response):
+            for worker in self.workers:
+                worker.templates.pop(content_hash, None)
+            response = await self.request(
+                "POST", path, build=lambda worker: body(worker, resend=True), **kwargs
+            )
+            record(response)
+        return response
+
+    async def check_health(self) -> int:
+        """Probe every worker's /health, updating eviction state. Returns the healthy count."""
+        async def probe(worker):
+            try:
+                response = await worker.client.get("/health", timeout=2)
+                healthy = response.status_code == 200
+                worker.last_error = None if healthy else f"HTTP {response.status_code}"
+            except httpx.HTTPError as e:
+                healthy = False
+                worker.last_error = str(e) or type(e).__name__
+            if healthy and not worker.healthy:
+                print(f"[PDF Generator] Worker {worker.url} healthy again")
+                worker.templates.clear()  # restarted process: registry is empty
+            worker.healthy = healthy
+            worker.last_checked_at = time.time()
+
+        await asyncio.gather(*(probe(w) for w in self.workers))
+        return sum(1 for w in self.workers if w.healthy)
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(NODE_HEALTH_INTERVAL_SECONDS)
+            try:
+                await self.check_health()
+            except Exception as e:
+                print(f"[PDF Generator] Worker health check error: {e}")
+
+    def start_health_checks(self):
+        if self._health_task is None or self._health_task.done():
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def close(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        for worker in self.workers:
+            await worker.client.aclose()
+
+    def stats(self) -> dict:
+        return {
+            "workers": [w.stats() for w in self.workers],
+            "healthy_workers": sum(1 for w in self.workers if w.healthy),
+            "outstanding": sum(w.outstanding for w in self.workers),
+        }
+
+
+def _is_unregistered(response: httpx.Response) -> bool:
+    try:
+        return response.json().get("code") == "TEMPLATE_NOT_REGISTERED"
+    except ValueError:
+        return False
+
+
+_node_pool: NodeWorkerPool | None = None
+
+
+def get_node_pool() -> NodeWorkerPool:
+    """Render worker pool for the Node.js service, created on first use."""
+    global _node_pool
+    if _node_pool is None:
+        _node_pool = NodeWorkerPool(node_worker_addresses(NODE_SERVICE_WORKERS))
+        print(f"[PDF Generator] Node.js render workers: "
+              f"{', '.join('unix:' + w.socket_path if w.socket_path else w.url for w in _node_pool.workers)}")
+    return _node_pool
+
+
+async def open_node_pool():
+    """Create the pool and start background health checks (called on startup)."""
+    get_node_pool().start_health_checks()
+
+
+async def close_node_pool():
+    """Close every worker connection (called on shutdown)."""
+    global _node_pool
+    if _node_pool is not None:
+        await _node_pool.close()
+    _node_pool = None
+
+
+class PreviewSuperseded(HTTPException):
+    """A newer revision of the same preview replaced this request."""
+
+    def __init__(self):
+        super().__init__(status_code=409, detail="Superseded by a newer preview request")
+
+
+# Rendered designer previews by template hash (identical JSON renders once)
+preview_result_cache = Cache(
+    "designer_previews",
+    ttl=PREVIEW_RESULT_TTL_SECONDS,
+    max_entries=200,
+    max_bytes=32 * 1024 * 1024,
+)
+
+
+class PreviewCoalescer:
+    """
+    Collapses designer preview traffic (POST /api/preview).
+    - Identical template JSON is rendered once: concurrent requests share the
+      in-flight render and later ones hit preview_result_cache.
+    - Requests carrying a preview_key form a per-user slot where only the
+      latest revision matters: a newer request supersedes the older one,
+      which returns PreviewSuperseded (409). A render nobody waits for any
+      more is cancelled, which drops it from the render scheduler queue.
+    - Rapid revisions (within PREVIEW_COALESCE_SECONDS of the previous one)
+      wait that long before rendering; a first or isolated request renders
+      immediately.
+    """
+
+    def __init__(self):
+        self._renders: dict = {}  # template hash -> {"task", "waiters"}
+        self._slots: dict = {}    # (user_id, preview_key) -> {"generation", "last_seen", "superseded"}
+        self.requests = 0
+        self.renders = 0
+        self.deduplicated = 0
+        self.cache_hits = 0
+        self.superseded = 0
+        self.cancelled = 0
+
+    async def preview(self, template_json: Dict[str, Any], user_id: str,
+                      preview_key: Optional[str] = None) -> dict:
+        """Node.js /preview result (JSON with the base64 PDF) for the template."""
+        self.requests += 1
+        content_hash = template_hash(template_json)
+        superseded = None
+
+        if preview_key:
+            slot_key = (user_id, str(preview_key))
+            previous = self._slots.get(slot_key)
+            if previous:
+                previous["superseded"].set()
+            now = time.monotonic()
+            superseded = asyncio.Event()
+            generation = (previous["generation"] + 1) if previous else 1
+            self._slots[slot_key] = {"generation": generation, "last_seen": now, "superseded": superseded}
+            self._prune_slots(now)
+
+            if previous and now - previous["last_seen"] < PREVIEW_COALESCE_SECONDS:
+                # Rapid edits: give a newer revision the chance to replace this one
+                await asyncio.sleep(PREVIEW_COALESCE_SECONDS)
+            if superseded.is_set():
+                self.superseded += 1
+                raise PreviewSuperseded()
+
+        cached = await preview_result_cache.get(content_hash)
+        if cached is not None:
+            self.cache_hits += 1
+            return cached
+
+        entry = self._renders.get(content_hash)
+        if entry is None:
+            task = asyncio.create_task(self._render(template_json, user_id, content_hash))
+            entry = self._renders[content_hash] = {"task": task, "waiters": 0}
+            self.renders += 1
+        else:
+            self.deduplicated += 1
+        task = entry["task"]
+        entry["waiters"] += 1
+
+        superseded_wait = asyncio.ensure_future(superseded.wait()) if superseded else None
+        try:
+            waits = [task] + ([superseded_wait] if superseded_wait else [])
+            done, _ = await asyncio.wait(waits, return_when=asyncio.FIRST_COMPLETED)
+            if task not in done:
+                self.superseded += 1
+                raise PreviewSuperseded()
+            return task.result()
+        finally:
+            if superseded_wait:
+                superseded_wait.cancel()
+            entry["waiters"] -= 1
+            if entry["waiters"] == 0 and not task.done():
+                task.cancel()
+                self.cancelled += 1
+                if self._renders.get(content_hash) is entry:
+                    del self._renders[content_hash]
+
+    async def _render(self, template_json: Dict[str, Any], user_id: str, content_hash: str) -> dict:
+        try:
+            async with get_render_scheduler().slot("interactive", user_id):
+                response = await get_node_pool().post(
+                    "/preview",
+                    json={"template": template_json},
+                    headers={"Content-Type": "application/json"}
+                )
+
+            if response.status_code != 200:
+                error_data = response.json()
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"Preview generation failed: {error_data.get('message', 'Unknown error')}"
+                )
+
+            result = response.json()
+            await preview_result_cache.set(content_hash, result)
+            return result
+        finally:
+            entry = self._renders.get(content_hash)
+            if entry is not None and entry["task"] is asyncio.current_task():
+                del self._renders[content_hash]
+
+    def _prune_slots(self, now: float):
+        if len(self._slots) > 10000:
+            for slot_key in [k for k, v in self._slots.items() if now - v["last_seen"] > 60]:
+                del self._slots[slot_key]
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "renders": self.renders,
+            "deduplicated": self.deduplicated,
+            "cache_hits": self.cache_hits,
+            "superseded": self.superseded,
+            "cancelled": self.cancelled,
+            "in_flight": len(self._renders),
+        }
+
+
+_preview_coalescer: PreviewCoalescer | None = None
+
+
+def get_preview_coalescer() -> PreviewCoalescer:
+    """Process-wide designer preview coalescer, created on first use."""
+    global _preview_coalescer
+    if _preview_coalescer is None:
+        _preview_coalescer = PreviewCoalescer()
+    return _preview_coalescer
+
+
+async def render_pdf(
+    template_json: Dict[str, Any],
+    input_data: Dict[str, Any],
+    lane: str = "document",
+    user_id: Optional[str] = None
+) -> bytes:
+    """
+    Render a PDF with the Node.js service and return its raw bytes.
+    Asks for the binary transport (Accept: application/pdf); a service that
+    only speaks the JSON/base64 format is still understood. The render waits
+    for a slot in the given render scheduler lane.
+
+    Raises:
+        PDFGenerationError: If the Node.js service fails
+        RenderQueueFull: If the lane is saturated
+    """
+    payload = {
+        "inputs": [input_data]  # pdfme expects array of inputs
+    }
+
+    async with get_render_scheduler().slot(lane, user_id):
+        # Template travels by hash once the worker has it registered
+        response = await get_node_pool().post_render(
+            "/generate",
+            template_json,
+            payload,
+            headers={"Accept": "application/pdf, application/json;q=0.5"}
+        )
+
+    if response.status_code != 200:
+        error_data = response.json()
+        raise PDFGenerationError(
+            f"Node.js service error: {error_data.get('message', 'Unknown error')}"
+        )
+
+    if response.headers.get("content-type", "").startswith("application/pdf"):
+        return response.content
+
+    # JSON transport (older Node.js service)
+    result = response.json()
+    if not result.get("success") or not result.get("pdf"):
+        raise PDFGenerationError("Invalid response from Node.js service")
+    return base64.b64decode(result["pdf"])
+
+
+async def render_pdfs(
+    template_json: Dict[str, Any],
+    inputs: List[Dict[str, Any]],
+    lane: str = "batch",
+    user_id: Optional[str] = None
+) -> List[bytes]:
+    """
+    Render one PDF per input with the same template via /generate-batch.
+    Inputs are split into chunks of NODE_BATCH_SIZE that render in parallel
+    across the worker pool (one render scheduler slot per chunk); the PDFs
+    come back in input order.
+
+    Raises:
+        PDFGenerationError: If the Node.js service fails
+        RenderQueueFull: If the lane is saturated
+    """
+    async def render_chunk(chunk):
+        async with get_render_scheduler().slot(lane, user_id):
+            response = await get_node_pool().post_render(
+                "/generate-batch",
+                template_json,
+                {"inputs": chunk},
+                headers={"Accept": "application/octet-stream, application/json;q=0.5"},
+                timeout=NODE_SERVICE_TIMEOUT + NODE_BATCH_SECONDS_PER_DOCUMENT * len(chunk)
+            )
+
+        if response.status_code != 200:
+            error_data = response.json()
+            raise PDFGenerationError(
+                f"Node.js service error: {error_data.get('message', 'Unknown error')}"
+            )
+
+        if response.headers.get("content-type", "").startswith("application/octet-stream"):
+            # PDFs are concatenated; X-PDF-Sizes gives each one's length
+            sizes = [int(size) for size in response.headers.get("x-pdf-sizes", "").split(",") if size]
+            body = response.content
+            if len(sizes) != len(chunk) or sum(sizes) != len(body):
+                raise PDFGenerationError("Invalid batch response from Node.js service")
+            pdfs, offset = [], 0
+            for size in sizes:
+                pdfs.append(body[offset:offset + size])
+                offset += size
+            return pdfs
+
+        result = response.json()
+        if not result.get("success") or len(result.get("pdfs") or []) != len(chunk):
+            raise PDFGenerationError("Invalid batch response from Node.js service")
+        return [base64.b64decode(pdf) for pdf in result["pdfs"]]
+
+    chunks = [inputs[i:i + NODE_BATCH_SIZE] for i in range(0, len(inputs), NODE_BATCH_SIZE)]
+    rendered = await asyncio.gather(*(render_chunk(chunk) for chunk in chunks))
+    return [pdf for chunk_pdfs in rendered for pdf in chunk_pdfs]
+
+
+def _storage_path(filename: Optional[str]) -> str:
+    """Unique storage path for a generated PDF."""
+    timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+    random_id = str(uuid4())[:8]
+    return f"generated/{filename or 'invoice'}_{timestamp}_{random_id}.pdf"
+
+
 async def generate_pdf(
     template_json: Dict[str, Any],
     input_data: Dict[str, Any],
-    filename: Optional[str] = None
+    filename: Optional[str] = None,
+    lane: str = "document",
+    user_id: Optional[str] = None
 ) -> Dict[str, Any]:
     """
     Generate a PDF from a template and input data
@@ -35,82 +751,51 @@ async def generate_pdf(
         template_json: The pdfme template JSON (basePdf, schemas, etc.)
         input_data: Dictionary of field values to fill in the template
         filename: Optional custom filename (without extension)
+        lane: Render scheduler lane ("interactive", "document" or "batch")
+        user_id: Owner of the render, for per-user fair queuing
 
     Returns:
         Dict with:
             - pdf_url: Public URL to download the PDF
             - storage_path: Path in Supabase Storage
+            - thumbnail_url: Public URL of the page-1 PNG (None without PyMuPDF)
             - size: PDF size in bytes
             - timestamp: Generation timestamp
 
     Raises:
         PDFGenerationError: If PDF generation or upload fails
+        RenderQueueFull: If the render lane is saturated
     """
     try:
-        # 1. Prepare request for Node.js service
-        payload = {
-            "template": template_json,
-            "inputs": [input_data]  # pdfme expects array of inputs
-        }
-
-        print(f"[PDF Generator] Calling Node.js service at {NODE_SERVICE_URL}/generate")
-
-        # 2. Call Node.js service to generate PDF
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                f"{NODE_SERVICE_URL}/generate",
-                json=payload,
-                headers={"Content-Type": "application/json"}
-            )
-
-            if response.status_code != 200:
-                error_data = response.json()
-                raise PDFGenerationError(
-                    f"Node.js service error: {error_data.get('message', 'Unknown error')}"
-                )
-
-            result = response.json()
-
-        # 3. Extract base64 PDF
-        if not result.get("success") or not result.get("pdf"):
-            raise PDFGenerationError("Invalid response from Node.js service")
-
-        base64_pdf = result["pdf"]
-        pdf_size = result.get("size", 0)
+        # 1. Render PDF bytes with the Node.js service
+        pdf_bytes = await render_pdf(template_json, input_data, lane, user_id)
+        pdf_size = len(pdf_bytes)
 
         print(f"[PDF Generator] PDF generated successfully ({pdf_size} bytes)")
 
-        # 4. Decode base64 to binary
-        pdf_bytes = base64.b64decode(base64_pdf)
-
-        # 5. Generate storage path
-        timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-        random_id = str(uuid4())[:8]
-
-        if filename:
-            # Use custom filename
-            storage_filename = f"{filename}_{timestamp}_{random_id}.pdf"
-        else:
-            # Default filename
-            storage_filename = f"invoice_{timestamp}_{random_id}.pdf"
-
-        storage_path = f"generated/{storage_filename}"
+        # 2. Generate storage path
+        storage_path = _storage_path(filename)
 
         print(f"[PDF Generator] Uploading to Supabase Storage: {storage_path}")
 
-        # 6. Upload to Supabase Storage
+        # 3. Upload the bytes to Supabase Storage as-is, then the page-1 thumbnail
+        # (only once the PDF is stored, so a failed upload leaves no orphaned PNG)
         pdf_url = await upload_to_storage(pdf_bytes, storage_path)
+        thumbnail_url = await store_thumbnail(pdf_bytes, storage_path)
 
         print(f"[PDF Generator] Upload successful: {pdf_url}")
 
-        # 7. Return result
+        # 4. Return result
         return {
             "pdf_url": pdf_url,
             "storage_path": storage_path,
+            "thumbnail_url": thumbnail_url,
             "size": pdf_size,
             "timestamp": datetime.utcnow().isoformat()
         }
 
+    except RenderQueueFull:
+        raise
     except httpx.TimeoutException:
         raise PDFGenerationError("Timeout while calling Node.js service")
     except httpx.RequestError as e:
@@ -119,13 +804,153 @@ async def generate_pdf(
         raise PDFGenerationError(f"PDF generation failed: {str(e)}")
 
 
-async def upload_to_storage(pdf_bytes: bytes, storage_path: str) -> str:
+async def generate_pdfs(
+    template_json: Dict[str, Any],
+    inputs: List[Dict[str, Any]],
+    filenames: Optional[List[Optional[str]]] = None,
+    lane: str = "batch",
+    user_id: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Generate many PDFs for the same template in one render call.
+    Template parsing and font loading happen once per batch; the PDFs are
+    uploaded concurrently.
+
+    Args:
+        template_json: The pdfme template JSON shared by every document
+        inputs: One dict of field values per document
+        filenames: Optional custom filename per document (without extension)
+        lane: Render scheduler lane (batch by default)
+        user_id: Owner of the renders, for per-user fair queuing
+
+    Returns:
+        One dict per input, in input order, shaped like generate_pdf's result
+
+    Raises:
+        PDFGenerationError: If rendering or any upload fails
+    """
+    if not inputs:
+        return []
+    filenames = filenames or [None] * len(inputs)
+
+    try:
+        pdfs = await render_pdfs(template_json, inputs, lane, user_id)
+        print(f"[PDF Generator] Batch of {len(pdfs)} PDFs generated successfully "
+              f"({sum(len(pdf) for pdf in pdfs)} bytes)")
+
+        storage_paths = [_storage_path(filename) for filename in filenames]
+        urls = await asyncio.gather(*(upload_to_storage(pdf, path) for pdf, path in zip(pdfs, storage_paths)))
+        # Thumbnails only after every PDF is stored, so a failed batch leaves no orphaned PNGs
+        thumbnail_urls = await asyncio.gather(*(store_thumbnail(pdf, path) for pdf, path in zip(pdfs, storage_paths)))
+
+        timestamp = datetime.utcnow().isoformat()
+        return [
+            {"pdf_url": url, "storage_path": path, "thumbnail_url": thumbnail_url,
+             "size": len(pdf), "timestamp": timestamp}
+            for pdf, path, url, thumbnail_url in zip(pdfs, storage_paths, urls, thumbnail_urls)
+        ]
+
+    except RenderQueueFull:
+        raise
+    except httpx.TimeoutException:
+        raise PDFGenerationError("Timeout while calling Node.js service")
+    except httpx.RequestError as e:
+        raise PDFGenerationError(f"Network error: {str(e)}")
+    except Exception as e:
+        raise PDFGenerationError(f"PDF batch generation failed: {str(e)}")
+
+
+class PDFBatcher:
+    """
+    Collects generate_pdf calls that share a template and renders them with
+    one generate_pdfs call. A batch is flushed when it reaches NODE_BATCH_SIZE
+    documents or NODE_BATCH_WINDOW_SECONDS after its first document. Used by
+    the scheduler, whose month-end run produces many invoices per template.
+    """
+
+    def __init__(self, max_size: int = NODE_BATCH_SIZE, window: float = NODE_BATCH_WINDOW_SECONDS):
+        self.max_size = max_size
+        self.window = window
+        self._pending: dict = {}
+        self._timers: dict = {}
+        self._tasks: set = set()
+
+    async def generate(
+        self,
+        batch_key: str,
+        template_json: Dict[str, Any],
+        input_data: Dict[str, Any],
+        filename: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Queue one document under batch_key (e.g. template id + updated_at) and await its result."""
+        future = asyncio.get_running_loop().create_future()
+        batch = self._pending.setdefault(batch_key, (template_json, []))
+        batch[1].append((input_data, filename, future))
+
+        if len(batch[1]) >= self.max_size:
+            self._flush(batch_key)
+        elif batch_key not in self._timers:
+            self._timers[batch_key] = asyncio.get_running_loop().call_later(
+                self.window, self._flush, batch_key
+            )
+        return await future
+
+    def _flush(self, batch_key: str):
+        timer = self._timers.pop(batch_key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(batch_key, None)
+        if batch:
+            task = asyncio.create_task(self._render(*batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def close(self):
+        """Cancel unflushed batches and in-flight renders; their callers get CancelledError."""
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        for _, items in self._pending.values():
+            for _, _, future in items:
+                future.cancel()
+        self._pending.clear()
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _render(self, template_json, items):
+        try:
+            results = await generate_pdfs(
+                template_json,
+                [input_data for input_data, _, _ in items],
+                [filename for _, filename, _ in items]
+            )
+        except asyncio.CancelledError:
+            for _, _, future in items:
+                future.cancel()
+            raise
+        except Exception as e:
+            for _, _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, _, future), result in zip(items, results):
+            if not future.done():
+                future.set_result(result)
+
+
+async def upload_to_storage(
+    pdf_bytes: bytes, storage_path: str, content_type: str = "application/pdf", upsert: bool = False
+) -> str:
     """
     Upload PDF to Supabase Storage
 
     Args:
         pdf_bytes: PDF file as bytes
         storage_path: Path in storage bucket (e.g., "generated/invoice_123.pdf")
+        content_type: MIME type of the object (PDF unless given, e.g. "image/png")
+        upsert: Overwrite an existing object at storage_path instead of failing
 
     Returns:
         Public URL to access the PDF
@@ -134,23 +959,25 @@ async def upload_to_storage(pdf_bytes: bytes, storage_path: str) -> str:
         PDFGenerationError: If upload fails
     """
     try:
-        # Use Supabase REST API to upload file
-        async with httpx.AsyncClient() as client:
-            upload_url = f"{supabase.url}/storage/v1/object/{SUPABASE_STORAGE_BUCKET}/{storage_path}"
-
-            response = await client.post(
-                upload_url,
-                headers={
-                    "apikey": supabase.key,
-                    "Authorization": f"Bearer {supabase.key}",
-                    "Content-Type": "application/pdf"
-                },
-                content=pdf_bytes
-            )
+        # Use Supabase REST API to upload file (over the shared connection pool)
+        client = get_http_client()
+        upload_url = f"{supabase.url}/storage/v1/object/{SUPABASE_STORAGE_BUCKET}/{storage_path}"
 
-            if response.status_code not in (200, 201):
-                error_msg = response.text
-                raise PDFGenerationError(f"Storage upload failed: {error_msg}")
+        response = await client.post(
+            upload_url,
+            headers={
+                "apikey": supabase.key,
+                "Authorization": f"Bearer {supabase.key}",
+                "Content-Type": content_type,
+                "x-upsert": "true" if upsert else "false"
+            },
+            content=pdf_bytes,
+            timeout=30.0
+        )
+
+        if response.status_code not in (200, 201):
+            error_msg = response.text
+            raise PDFGenerationError(f"Storage upload failed: {error_msg}")
 
         # Construct public URL
         public_url = f"{supabase.url}/storage/v1/object/public/{SUPABASE_STORAGE_BUCKET}/{storage_path}"
@@ -175,22 +1002,58 @@ async def delete_from_storage(storage_path: str) -> bool:
         PDFGenerationError: If deletion fails
     """
     try:
-        async with httpx.AsyncClient() as client:
-            delete_url = f"{supabase.url}/storage/v1/object/{SUPABASE_STORAGE_BUCKET}/{storage_path}"
-
-            response = await client.delete(
-                delete_url,
-                headers={
-                    "apikey": supabase.key,
-                    "Authorization": f"Bearer {supabase.key}"
-                }
-            )
+        client = get_http_client()
+        delete_url = f"{supabase.url}/storage/v1/object/{SUPABASE_STORAGE_BUCKET}/{storage_path}"
+
+        response = await client.delete(
+            delete_url,
+            headers={
+                "apikey": supabase.key,
+                "Authorization": f"Bearer {supabase.key}"
+            }
+        )
 
-            if response.status_code not in (200, 204):
-                error_msg = response.text
-                raise PDFGenerationError(f"Storage deletion failed: {error_msg}")
+        if response.status_code not in (200, 204):
+            error_msg = response.text
+            raise PDFGenerationError(f"Storage deletion failed: {error_msg}")
 
         return True
 
     except httpx.RequestError as e:
         raise PDFGenerationError(f"Storage deletion network error: {str(e)}")
+
+
+async def download_from_storage(storage_path: str) -> Optional[bytes]:
+    """
+    Download an object from Supabase Storage
+
+    Args:
+        storage_path: Path in storage bucket
+
+    Returns:
+        The object's bytes, or None if it doesn't exist
+
+    Raises:
+        PDFGenerationError: If the download fails for another reason
+    """
+    try:
+        client = get_http_client()
+        download_url = f"{supabase.url}/storage/v1/object/{SUPABASE_STORAGE_BUCKET}/{storage_path}"
+
+        response = await client.get(
+            download_url,
+            headers={
+                "apikey": supabase.key,
+                "Authorization": f"Bearer {supabase.key}"
+            }
+        )
+
+        if response.status_code == 200:
+            return response.content
+        # Storage answers 400 or 404 for a missing object
+        if response.status_code in (400, 404):
+            return None
+        raise PDFGenerationError(f"Storage download failed: {response.text}")
+
+    except httpx.RequestError as e:
+        raise PDFGenerationError(f"Storage download network error: {str(e)}")
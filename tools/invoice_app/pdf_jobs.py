@@ -0,0 +1,311 @@
+"""
+PDF Jobs — in-process render queue for document PDFs.
+create_document stores the document with pdf_status=pending and enqueues a job;
+a bounded pool of worker tasks renders it in the background. Jobs are persisted
+in pdf_jobs (see tools/setup_pdf_jobs_migration.sql) so pending work survives a
+restart: on startup, pending jobs and stale running jobs are picked up again,
+and scheduler_loop sweeps stale jobs periodically (see PDFJobQueue.sweep).
+
+The workers need a long-lived event loop. On serverless deployments (Vercel,
+where nothing runs after the response) set PDF_JOBS_INLINE=true, the default
+when VERCEL is set: jobs are then rendered inside the request that enqueues them.
+"""
+import os
+import asyncio
+from datetime import datetime, timezone, timedelta
+from .supabase_client import supabase
+
+PDF_JOB_WORKERS = max(1, int(os.getenv("PDF_JOB_WORKERS", "4")))
+PDF_JOB_MAX_ATTEMPTS = max(1, int(os.getenv("PDF_JOB_MAX_ATTEMPTS", "3")))
+PDF_JOB_RETRY_DELAY_SECONDS = float(os.getenv("PDF_JOB_RETRY_DELAY_SECONDS", "5"))
+# A job still "running" after this long belonged to a crashed process
+PDF_JOB_STALE_SECONDS = int(os.getenv("PDF_JOB_STALE_SECONDS", "300"))
+PDF_JOB_STALE_ERROR = "PDF render did not finish, generate it again"
+# Render in the enqueueing request instead of background workers (serverless)
+PDF_JOBS_INLINE = os.getenv("PDF_JOBS_INLINE", "true" if os.getenv("VERCEL") else "false").lower() == "true"
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _stale_before() -> str:
+    return (datetime.now(timezone.utc) - timedelta(seconds=PDF_JOB_STALE_SECONDS)).isoformat()
+
+
+def _older_than_stale(timestamp) -> bool:
+    """True if a PostgREST timestamptz is older than PDF_JOB_STALE_SECONDS."""
+    if not timestamp:
+        return False
+    value = datetime.fromisoformat(str(timestamp).replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value <= datetime.now(timezone.utc) - timedelta(seconds=PDF_JOB_STALE_SECONDS)
+
+
+class PDFJobQueue:
+    """
+    Bounded worker pool over an asyncio.Queue of pdf_jobs rows.
+    A worker claims a job with a conditional update (status pending -> running),
+    so a job recovered by several app processes is still rendered once.
+    """
+
+    def __init__(self, workers: int = PDF_JOB_WORKERS):
+        self.worker_count = workers
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._workers: list = []
+        self._retries: set = set()
+        self.opened = False  # Set by open_pdf_job_queue on startup
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+
+    async def enqueue(self, document_id: str, user_id: str, reason: str = "create") -> dict:
+        """
+        Persist a pending job for the document and queue it. Returns the job row.
+        Without long-lived workers (PDF_JOBS_INLINE, or startup never ran) the
+        job is rendered before returning, in one attempt, and the returned row
+        carries its final status.
+        """
+        job = await supabase.insert("pdf_jobs", {
+            "document_id": document_id,
+            "user_id": user_id,
+            "reason": reason,
+            "status": "pending",
+            "attempts": 0,
+        })
+        if self.inline:
+            return {**job, "status": await self._run(job, retry=False)}
+
+        self.start()
+        self._queue.put_nowait(job)
+        return job
+
+    @property
+    def inline(self) -> bool:
+        """Jobs are rendered by the enqueueing request (no long-lived workers)."""
+        return PDF_JOBS_INLINE or not self.opened
+
+    async def recover(self) -> int:
+        """Requeue pending jobs and reset running jobs orphaned by a crash. Returns the count."""
+        await self.sweep(requeue=False)
+
+        pending = await supabase.select(
+            "pdf_jobs", filters={"status": "pending"}, order_by=("created_at", False)
+        )
+        for job in pending:
+            self._queue.put_nowait(job)
+        if pending:
+            print(f"[PDF Jobs] Recovered {len(pending)} pending job(s)")
+        return len(pending)
+
+    async def sweep(self, requeue: bool = True) -> int:
+        """
+        Handle jobs orphaned by a killed process or a failed status update.
+        Running jobs past PDF_JOB_STALE_SECONDS go back to pending (and the
+        queue) while attempts remain; inline, or out of attempts, they fail
+        along with their document. Inline, stale pending jobs were never
+        claimed and fail too. Returns the number of jobs handled.
+        """
+        stale_before = _stale_before()
+        stale = await supabase.select_lte(
+            "pdf_jobs", lte_column="started_at", lte_value=stale_before,
+            eq_filters={"status": "running"}
+        )
+        if self.inline:
+            stale += await supabase.select_lte(
+                "pdf_jobs", lte_column="created_at", lte_value=stale_before,
+                eq_filters={"status": "pending"}
+            )
+
+        handled = 0
+        for job in stale:
+            if self.inline or (job.get("attempts") or 0) >= PDF_JOB_MAX_ATTEMPTS:
+                handled += await self._fail_stale(job)
+            elif await supabase.update_many(
+                "pdf_jobs", {"status": "pending"}, {"id": job["id"], "status": "running"}
+            ):
+                handled += 1
+                if requeue:
+                    self._queue.put_nowait({**job, "status": "pending"})
+        if handled:
+            print(f"[PDF Jobs] Swept {handled} stale job(s)")
+        return handled
+
+    async def fail_if_stale(self, document_id: str, user_id: str, created_at=None) -> str | None:
+        """
+        For a document still pdf_status=pending: if its latest job is stale
+        (see sweep), or it has no job long after creation, mark the job and the
+        document failed so the PDF can be generated again. Returns the error,
+        or None while the render may still finish.
+        """
+        jobs = await supabase.select(
+            "pdf_jobs", filters={"document_id": document_id, "user_id": user_id},
+            order_by=("created_at", True), limit=1
+        )
+        if not jobs:
+            if not _older_than_stale(created_at):
+                return None
+            await self._fail_document(document_id, user_id, PDF_JOB_STALE_ERROR)
+            return PDF_JOB_STALE_ERROR
+
+        job = jobs[0]
+        error = job.get("error_message") or PDF_JOB_STALE_ERROR
+        if job["status"] == "running":
+            if not _older_than_stale(job.get("started_at")):
+                return None
+        elif job["status"] == "pending":
+            if not (self.inline and _older_than_stale(job.get("created_at"))):
+                return None
+        else:
+            # Finished, but the document row was never updated
+            await self._fail_document(document_id, user_id, error)
+            return error
+        # None if the job was claimed or finished meanwhile
+        return error if await self._fail_stale(job) else None
+
+    async def _fail_stale(self, job: dict) -> int:
+        """Fail a stale job if it is still in the status it was read in. Returns 1 if it was."""
+        error = job.get("error_message") or PDF_JOB_STALE_ERROR
+        changed = await supabase.update_many(
+            "pdf_jobs", {"status": "failed", "error_message": error, "completed_at": _now()},
+            {"id": job["id"], "status": job["status"]}
+        )
+        if not changed:
+            return 0
+        await self._fail_document(job["document_id"], job["user_id"], error)
+        self.failed += 1
+        return 1
+
+    async def _fail_document(self, document_id: str, user_id: str, error: str):
+        # Only a still-pending document: a regenerate may have finished meanwhile
+        await supabase.update_many(
+            "documents", {"pdf_status": "failed", "pdf_error": error},
+            {"id": document_id, "user_id": user_id, "pdf_status": "pending"}
+        )
+
+    def start(self):
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+
+    async def close(self):
+        for task in [*self._workers, *self._retries]:
+            task.cancel()
+        self._workers = []
+        self._retries.clear()
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            except Exception as e:
+                print(f"[PDF Jobs] Job {job.get('id')} crashed: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: dict, retry: bool = True) -> str:
+        """Claim and render one job. Returns its status afterwards."""
+        from .document_routes import render_stored_document_pdf
+
+        attempts = (job.get("attempts") or 0) + 1
+        claimed = await supabase.update_many(
+            "pdf_jobs",
+            {"status": "running", "attempts": attempts, "started_at": _now()},
+            {"id": job["id"], "status": "pending"}
+        )
+        if not claimed:
+            return "running"  # Done, or taken by another process
+
+        document_id, user_id = job["document_id"], job["user_id"]
+        try:
+            doc, pdf_result = await render_stored_document_pdf(document_id, user_id)
+        except Exception as e:
+            error = str(getattr(e, "detail", None) or e)[:500]
+            return await self._fail(job, attempts, error, retry)
+
+        await supabase.update(
+            "pdf_jobs", {"status": "completed", "error_message": None, "completed_at": _now()}, {"id": job["id"]}
+        )
+        self.completed += 1
+
+        if job.get("reason") == "create" and pdf_result.get("size") is not None:
+            try:
+                await supabase.insert("usage_logs", {
+                    "template_id": doc.get("template_id"),
+                    "pdf_filename": f"{doc['document_type']}_{doc['document_number']}.pdf",
+                    "file_size_bytes": pdf_result["size"],
+                    "user_id": user_id,
+                })
+            except Exception:
+                pass  # Non-blocking
+        return "completed"
+
+    async def _fail(self, job: dict, attempts: int, error: str, retry: bool = True) -> str:
+        print(f"[PDF Jobs] Job {job['id']} attempt {attempts}/{PDF_JOB_MAX_ATTEMPTS} failed: {error}")
+        if retry and attempts < PDF_JOB_MAX_ATTEMPTS:
+            await supabase.update(
+                "pdf_jobs", {"status": "pending", "error_message": error}, {"id": job["id"]}
+            )
+            self.retried += 1
+            task = asyncio.create_task(self._retry_later({**job, "attempts": attempts}, attempts))
+            self._retries.add(task)
+            task.add_done_callback(self._retries.discard)
+            return "pending"
+
+        await supabase.update(
+            "pdf_jobs", {"status": "failed", "error_message": error, "completed_at": _now()}, {"id": job["id"]}
+        )
+        await supabase.update(
+            "documents", {"pdf_status": "failed", "pdf_error": error},
+            {"id": job["document_id"], "user_id": job["user_id"]}
+        )
+        self.failed += 1
+        return "failed"
+
+    async def _retry_later(self, job: dict, attempts: int):
+        await asyncio.sleep(PDF_JOB_RETRY_DELAY_SECONDS * attempts)
+        self._queue.put_nowait(job)
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self._workers),
+            "inline": self.inline,
+            "queued": self._queue.qsize(),
+            "retries_scheduled": len(self._retries),
+            "completed": self.completed,
+            "failed": self.failed,
+            "retried": self.retried,
+        }
+
+
+_job_queue: PDFJobQueue | None = None
+
+
+def get_pdf_job_queue() -> PDFJobQueue:
+    """Process-wide PDF job queue, created on first use."""
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = PDFJobQueue()
+    return _job_queue
+
+
+async def open_pdf_job_queue():
+    """Start the workers and pick up persisted jobs (called on startup; a no-op with PDF_JOBS_INLINE)."""
+    queue = get_pdf_job_queue()
+    if PDF_JOBS_INLINE:
+        return
+    queue.opened = True
+    queue.start()
+    try:
+        await queue.recover()
+    except Exception as e:
+        print(f"[PDF Jobs] Recovery failed: {e}")
+
+
+async def close_pdf_job_queue():
+    """Stop the workers (called on shutdown); unfinished jobs stay pending in the database."""
+    global _job_queue
+    if _job_queue is not None:
+        await _job_queue.close()
+    _job_queue = None
@@ -4,7 +4,7 @@ Price Item API routes — Service/product catalog CRUD
 from fastapi import APIRouter, HTTPException, status, Query, Depends
 from typing import Optional
 from datetime import datetime, timezone
-from .supabase_client import supabase
+from .supabase_client import supabase, DEFAULT_PAGE_SIZE, filter_uuids
 from .auth_middleware import get_current_user
 from .models import PriceItemBulkCreate
 
@@ -23,12 +23,36 @@ async def list_price_items(
     category: Optional[str] = Query(None, description="Filter by category"),
     q: Optional[str] = Query(None, description="Search query"),
     active: Optional[bool] = Query(True, description="Filter by active status"),
+    limit: Optional[int] = Query(None, ge=1, le=200, description="Page size (enables pagination)"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
     user: dict = Depends(get_current_user)
 ):
-    """List all price items for the current user, with optional filters."""
+    """
+    List all price items for the current user, with optional filters.
+    With limit/cursor the response is { items, next_cursor } (keyset on sort_order).
+    """
     try:
         user_id = user["sub"]
 
+        if limit is not None or cursor:
+            filters = {"user_id": user_id}
+            if active is not None:
+                filters["is_active"] = active
+            or_filters = None
+            if q and q.strip():
+                or_filters = f"(name.ilike.*{q.strip()}*,description.ilike.*{q.strip()}*)"
+            elif category:
+                filters["category"] = category
+            items, next_cursor = await supabase.select_page(
+                "price_items",
+                filters=filters,
+                order_by=("sort_order", False),
+                limit=limit or DEFAULT_PAGE_SIZE,
+                cursor=cursor,
+                or_filters=or_filters
+            )
+            return {"items": items, "next_cursor": next_cursor}
+
         if q and q.strip():
             # Search by name or description
             search_filters = {"user_id": user_id}
@@ -54,6 +78,8 @@ async def list_price_items(
             )
 
         return rows
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         print(f"[PriceItems] Error listing: {e}")
         raise HTTPException(
@@ -92,17 +118,20 @@ async def bulk_delete_price_items(payload: dict, user: dict = Depends(get_curren
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Maximum 500 items per request")
 
     user_id = user["sub"]
-    deleted = 0
-    for item_id in ids:
-        try:
-            rows = await supabase.select("price_items", columns="id", filters={"id": item_id, "user_id": user_id})
-            if rows:
-                await supabase.delete("price_items", {"id": item_id, "user_id": user_id})
-                deleted += 1
-        except Exception:
-            pass
+    try:
+        rows = await supabase.delete_in(
+            "price_items", "id", filter_uuids(ids),
+            extra_filters={"user_id": user_id},
+            columns="id"
+        )
+    except Exception as e:
+        print(f"[PriceItems] Error bulk deleting: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to bulk delete price items: {str(e)}"
+        )
 
-    return {"deleted": deleted}
+    return {"deleted": len(rows), "ids": [r["id"] for r in rows]}
 
 
 @router.post("/bulk-archive")
@@ -115,21 +144,22 @@ async def bulk_archive_price_items(payload: dict, user: dict = Depends(get_curre
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Maximum 500 items per request")
 
     user_id = user["sub"]
-    archived = 0
-    for item_id in ids:
-        try:
-            rows = await supabase.select("price_items", columns="id", filters={"id": item_id, "user_id": user_id})
-            if rows:
-                await supabase.update(
-                    "price_items",
-                    {"is_active": False, "updated_at": datetime.now(timezone.utc).isoformat()},
-                    {"id": item_id, "user_id": user_id}
-                )
-                archived += 1
-        except Exception:
-            pass
+    try:
+        rows = await supabase.update_in(
+            "price_items",
+            {"is_active": False, "updated_at": datetime.now(timezone.utc).isoformat()},
+            "id", filter_uuids(ids),
+            extra_filters={"user_id": user_id},
+            columns="id"
+        )
+    except Exception as e:
+        print(f"[PriceItems] Error bulk archiving: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to bulk archive price items: {str(e)}"
+        )
 
-    return {"archived": archived}
+    return {"archived": len(rows), "ids": [r["id"] for r in rows]}
 
 
 @router.post("/archive/{item_id}")
@@ -1,8 +1,13 @@
 """
 API routes for template management and PDF generation
 """
-from fastapi import APIRouter, HTTPException, status, Depends, Query
-from typing import List, Optional
+import os
+import base64
+import asyncio
+import hashlib
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Request
+from fastapi.responses import JSONResponse, Response
+from typing import List, Optional, Union
 from uuid import UUID
 from datetime import datetime
 
@@ -10,21 +15,144 @@ from .models import (
     TemplateCreate,
     TemplateUpdate,
     TemplateResponse,
+    TemplateListItem,
+    TemplatePage,
     PDFGenerateRequest,
     PDFGenerateResponse
 )
-from .supabase_client import supabase, SUPABASE_STORAGE_BUCKET
+from .supabase_client import supabase, SUPABASE_STORAGE_BUCKET, DEFAULT_PAGE_SIZE, project_columns
 from .auth_middleware import get_current_user
+from .cache import Cache
 
 router = APIRouter(prefix="/api")
 
-@router.get("/templates", response_model=List[TemplateResponse])
-async def list_templates(archived: Optional[bool] = Query(False), user: dict = Depends(get_current_user)):
-    """List all templates for the current user"""
+# Columns returned by the template list; template_json only on GET /templates/{id}
+TEMPLATE_LIST_COLUMNS = [
+    "id", "name", "description", "thumbnail_base64", "thumbnail_url", "payment_status",
+    "is_archived", "created_at", "updated_at",
+]
+
+TEMPLATE_FIELDS = set(TEMPLATE_LIST_COLUMNS) | {"template_json"}
+
+# Columns needed to render a template; cached per id and revalidated against updated_at
+TEMPLATE_RENDER_COLUMNS = "id,user_id,name,updated_at,template_json"
+TEMPLATE_VERSION_COLUMNS = "id,user_id,updated_at"
+
+TEMPLATE_CACHE_TTL_SECONDS = float(os.getenv("TEMPLATE_CACHE_TTL_SECONDS", "3600"))
+TEMPLATE_CACHE_MAX_BYTES = int(float(os.getenv("TEMPLATE_CACHE_MAX_MB", "64")) * 1024 * 1024)
+
+template_cache = Cache(
+    "templates",
+    ttl=TEMPLATE_CACHE_TTL_SECONDS,
+    max_entries=500,
+    max_bytes=TEMPLATE_CACHE_MAX_BYTES,
+)
+
+# Rendered placeholder previews per template version, in memory and in storage
+PREVIEW_CACHE_TTL_SECONDS = float(os.getenv("PREVIEW_CACHE_TTL_SECONDS", "86400"))
+PREVIEW_CACHE_MAX_BYTES = int(float(os.getenv("PREVIEW_CACHE_MAX_MB", "32")) * 1024 * 1024)
+
+preview_cache = Cache(
+    "template_previews",
+    ttl=PREVIEW_CACHE_TTL_SECONDS,
+    max_entries=200,
+    max_bytes=PREVIEW_CACHE_MAX_BYTES,
+)
+
+
+def preview_version(template_id: str, updated_at) -> str:
+    """Identifies one version of a template's preview (cache key, storage name, ETag)."""
+    return hashlib.sha256(f"{template_id}:{updated_at}".encode("utf-8")).hexdigest()[:32]
+
+
+def preview_storage_path(template_id: str, updated_at) -> str:
+    return f"previews/{template_id}/{preview_version(template_id, updated_at)}.pdf"
+
+
+async def invalidate_preview(template_id: str, updated_at):
+    """Drop a template version's cached preview (and its thumbnail) from memory and storage."""
+    from .pdf_generator import delete_from_storage
+    from .thumbnails import delete_thumbnail
+
+    storage_path = preview_storage_path(template_id, updated_at)
+    await preview_cache.invalidate(preview_version(template_id, updated_at))
+    try:
+        await asyncio.gather(delete_from_storage(storage_path), delete_thumbnail(storage_path))
+    except Exception as e:
+        print(f"[API] Failed to delete cached preview of template {template_id}: {e}")
+
+
+async def resolve_template(version: dict) -> Optional[dict]:
+    """
+    Return the render columns of a template given a row with its id, user_id and
+    updated_at. The cached copy is used when its updated_at matches; otherwise
+    the template is downloaded again and cached. Returns None if it no longer exists.
+    """
+    template_id = str(version["id"])
+    cached = await template_cache.get(template_id)
+    if cached and cached.get("updated_at") == version.get("updated_at"):
+        return cached
+
+    rows = await supabase.select(
+        "templates",
+        columns=TEMPLATE_RENDER_COLUMNS,
+        filters={"id": template_id, "user_id": version["user_id"]}
+    )
+    if not rows:
+        return None
+    await template_cache.set(template_id, rows[0])
+    return rows[0]
+
+
+async def get_template_for_render(template_id: str, user_id: str) -> Optional[dict]:
+    """
+    Load a user's template for rendering. Only updated_at is fetched when the
+    cached template_json is still current.
+    """
+    rows = await supabase.select(
+        "templates",
+        columns=TEMPLATE_VERSION_COLUMNS,
+        filters={"id": str(template_id), "user_id": user_id}
+    )
+    if not rows:
+        return None
+    return await resolve_template(rows[0])
+
+@router.get(
+    "/templates",
+    response_model=Union[List[TemplateListItem], TemplatePage],
+    response_model_exclude_unset=True
+)
+async def list_templates(
+    archived: Optional[bool] = Query(False),
+    limit: Optional[int] = Query(None, ge=1, le=200, description="Page size (enables pagination)"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return, e.g. name,template_json"),
+    user: dict = Depends(get_current_user)
+):
+    """
+    List all templates for the current user (paginated as { items, next_cursor } when limit/cursor is given).
+    template_json is left out unless requested via fields=.
+    """
     try:
         user_id = user["sub"]
-        templates = await supabase.select("templates", filters={"user_id": user_id, "is_archived": archived}, order_by=("created_at", True))
+        columns = project_columns(fields, TEMPLATE_LIST_COLUMNS, TEMPLATE_FIELDS, required=("id", "created_at"))
+        filters = {"user_id": user_id, "is_archived": archived}
+        if limit is not None or cursor:
+            items, next_cursor = await supabase.select_page(
+                "templates",
+                columns=columns,
+                filters=filters,
+                order_by=("created_at", True),
+                limit=limit or DEFAULT_PAGE_SIZE,
+                cursor=cursor
+            )
+            return {"items": items, "next_cursor": next_cursor}
+
+        templates = await supabase.select("templates", columns=columns, filters=filters, order_by=("created_at", True))
         return templates
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -150,8 +278,18 @@ async def update_template(template_id: UUID, template: TemplateUpdate, user: dic
         # Clear cached thumbnail when template content changes
         if "template_json" in update_data:
             update_data["thumbnail_base64"] = None
+        # The server thumbnail belongs to the version being replaced (deleted below)
+        update_data["thumbnail_url"] = None
+
+        # Version being replaced, so its cached preview can be dropped
+        previous = await supabase.select(
+            "templates", columns=TEMPLATE_VERSION_COLUMNS, filters={"id": str(template_id), "user_id": user_id}
+        )
 
         result = await supabase.update("templates", update_data, filters={"id": str(template_id), "user_id": user_id})
+        await template_cache.invalidate(str(template_id))
+        if previous:
+            await invalidate_preview(str(template_id), previous[0].get("updated_at"))
 
         if not result:
             raise HTTPException(
@@ -173,7 +311,13 @@ async def delete_template(template_id: UUID, user: dict = Depends(get_current_us
     """Delete a template for the current user"""
     try:
         user_id = user["sub"]
+        previous = await supabase.select(
+            "templates", columns=TEMPLATE_VERSION_COLUMNS, filters={"id": str(template_id), "user_id": user_id}
+        )
         result = await supabase.delete("templates", filters={"id": str(template_id), "user_id": user_id})
+        await template_cache.invalidate(str(template_id))
+        if previous:
+            await invalidate_preview(str(template_id), previous[0].get("updated_at"))
 
         if not result:
             raise HTTPException(
@@ -190,105 +334,211 @@ async def delete_template(template_id: UUID, user: dict = Depends(get_current_us
             detail=f"Failed to delete template: {str(e)}"
         )
 
-@router.get("/templates/{template_id}/preview")
-async def preview_template(template_id: UUID, user: dict = Depends(get_current_user)):
-    """Generate a PDF preview for a template using placeholder data"""
-    import httpx
-    from .pdf_generator import NODE_SERVICE_URL
+async def load_template_preview(version: dict, user_id: str) -> dict:
+    """
+    Placeholder preview of one template version ({"success", "pdf" (base64), "size"}),
+    given a row with its id, user_id and updated_at. Looked up in memory, then
+    in storage, and rendered (and stored) only when neither has it.
+
+    Raises:
+        HTTPException: 404 if the template no longer exists, 500 if rendering fails
+    """
+    from .pdf_generator import (
+        get_node_pool, get_render_scheduler, upload_to_storage, download_from_storage
+    )
+
+    template_id = str(version["id"])
+    cache_key = preview_version(template_id, version.get("updated_at"))
+
+    # 1. Memory, 2. storage, 3. render
+    preview = await preview_cache.get(cache_key)
+    if preview is not None:
+        return preview
+
+    storage_path = preview_storage_path(template_id, version.get("updated_at"))
+    try:
+        stored = await download_from_storage(storage_path)
+    except Exception as e:
+        print(f"[API] Preview storage lookup failed: {e}")
+        stored = None
+    if stored:
+        preview = {"success": True, "pdf": base64.b64encode(stored).decode("ascii"), "size": len(stored)}
+        await preview_cache.set(cache_key, preview)
+        return preview
+
+    # Fetch template (cached while updated_at is unchanged)
+    template = await resolve_template(version)
+    if not template:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Template with ID {template_id} not found"
+        )
+
+    template_json = template["template_json"]
+
+    # Deep copy template and set all fields to readOnly for preview
+    # pdfme only renders content for readOnly fields; editable fields show as empty
+    import copy
+    preview_template = copy.deepcopy(template_json)
+    placeholder_inputs = {}
+    schemas = preview_template.get("schemas", [])
+    if schemas and len(schemas) > 0:
+        page_schema = schemas[0]
+        if isinstance(page_schema, dict):
+            for field_name, field_def in page_schema.items():
+                if isinstance(field_def, dict):
+                    field_type = field_def.get("type", "text")
+                    content = (field_def.get("content", "") or "").strip()
+                    field_def["readOnly"] = True
+                    if field_type in ("text", "multiVariableText"):
+                        if not content:
+                            field_def["content"] = field_name
+                        placeholder_inputs[field_name] = field_def["content"]
+                    else:
+                        if not content:
+                            field_def["content"] = field_name
+                        placeholder_inputs[field_name] = field_def["content"]
+                else:
+                    placeholder_inputs[field_name] = field_name
+
+    # Use the existing /generate endpoint which already works
+    async with get_render_scheduler().slot("interactive", user_id):
+        response = await get_node_pool().post(
+            "/generate",
+            json={
+                "template": preview_template,
+                "inputs": [placeholder_inputs]
+            },
+            headers={"Content-Type": "application/json"}
+        )
 
+    if response.status_code != 200:
+        error_data = response.json()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Preview generation failed: {error_data.get('message', 'Unknown error')}"
+        )
+
+    preview = response.json()
+    await preview_cache.set(cache_key, preview)
+    try:
+        await upload_to_storage(base64.b64decode(preview["pdf"]), storage_path)
+    except Exception as e:
+        print(f"[API] Failed to store preview of template {template_id}: {e}")
+    return preview
+
+
+@router.get("/templates/{template_id}/preview")
+async def preview_template(template_id: UUID, request: Request, user: dict = Depends(get_current_user)):
+    """
+    Generate a PDF preview for a template using placeholder data.
+    Previews are cached per template version (id + updated_at) in memory and
+    in storage, and served with an ETag: an unchanged template costs no
+    render, and a revalidating browser gets 304 without a body.
+    """
     try:
         user_id = user["sub"]
-        # Fetch template from database
-        templates = await supabase.select("templates", filters={"id": str(template_id), "user_id": user_id})
+        versions = await supabase.select(
+            "templates", columns=TEMPLATE_VERSION_COLUMNS, filters={"id": str(template_id), "user_id": user_id}
+        )
 
-        if not templates:
+        if not versions:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Template with ID {template_id} not found"
             )
 
-        template = templates[0]
-        template_json = template["template_json"]
+        version = versions[0]
+        etag = f'"{preview_version(str(template_id), version.get("updated_at"))}"'
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
 
-        # Deep copy template and set all fields to readOnly for preview
-        # pdfme only renders content for readOnly fields; editable fields show as empty
-        import copy
-        preview_template = copy.deepcopy(template_json)
-        placeholder_inputs = {}
-        schemas = preview_template.get("schemas", [])
-        if schemas and len(schemas) > 0:
-            page_schema = schemas[0]
-            if isinstance(page_schema, dict):
-                for field_name, field_def in page_schema.items():
-                    if isinstance(field_def, dict):
-                        field_type = field_def.get("type", "text")
-                        content = (field_def.get("content", "") or "").strip()
-                        field_def["readOnly"] = True
-                        if field_type in ("text", "multiVariableText"):
-                            if not content:
-                                field_def["content"] = field_name
-                            placeholder_inputs[field_name] = field_def["content"]
-                        else:
-                            if not content:
-                                field_def["content"] = field_name
-                            placeholder_inputs[field_name] = field_def["content"]
-                    else:
-                        placeholder_inputs[field_name] = field_name
-
-        # Use the existing /generate endpoint which already works
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                f"{NODE_SERVICE_URL}/generate",
-                json={
-                    "template": preview_template,
-                    "inputs": [placeholder_inputs]
-                },
-                headers={"Content-Type": "application/json"}
+        if etag in request.headers.get("if-none-match", ""):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        preview = await load_template_preview(version, user_id)
+        return JSONResponse(preview, headers=headers)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to generate preview: {str(e)}"
+        )
+
+@router.get("/templates/{template_id}/thumbnail")
+async def template_thumbnail(template_id: UUID, user: dict = Depends(get_current_user)):
+    """
+    URL of a PNG thumbnail of the template's placeholder preview (page 1).
+    Created on first request from the cached preview, stored next to it and
+    saved on the template row; editing the template clears it.
+    """
+    from .thumbnails import THUMBNAILS_ENABLED, store_thumbnail
+
+    try:
+        user_id = user["sub"]
+        versions = await supabase.select(
+            "templates", columns=f"{TEMPLATE_VERSION_COLUMNS},thumbnail_url",
+            filters={"id": str(template_id), "user_id": user_id}
+        )
+
+        if not versions:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Template with ID {template_id} not found"
             )
 
-        if response.status_code != 200:
-            error_data = response.json()
+        version = versions[0]
+        if version.get("thumbnail_url"):
+            return {"template_id": str(template_id), "thumbnail_url": version["thumbnail_url"]}
+        if not THUMBNAILS_ENABLED:
+            raise HTTPException(
+                status_code=status.HTTP_501_NOT_IMPLEMENTED,
+                detail="Thumbnails are not available (PyMuPDF is not installed)"
+            )
+
+        preview = await load_template_preview(version, user_id)
+        thumbnail_url = await store_thumbnail(
+            base64.b64decode(preview["pdf"]),
+            preview_storage_path(str(template_id), version.get("updated_at"))
+        )
+        if not thumbnail_url:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Preview generation failed: {error_data.get('message', 'Unknown error')}"
+                detail="Failed to create thumbnail"
             )
 
-        return response.json()
+        # Only if the template wasn't edited meanwhile
+        await supabase.update_many(
+            "templates", {"thumbnail_url": thumbnail_url},
+            {"id": str(template_id), "user_id": user_id, "updated_at": version.get("updated_at")}
+        )
+        return {"template_id": str(template_id), "thumbnail_url": thumbnail_url}
 
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to generate preview: {str(e)}"
+            detail=f"Failed to get thumbnail: {str(e)}"
         )
 
 @router.post("/preview")
 async def preview_template_json(body: dict, user: dict = Depends(get_current_user)):
-    """Generate a PDF preview from raw template JSON (no database lookup)"""
-    import httpx
-    from .pdf_generator import NODE_SERVICE_URL
+    """
+    Generate a PDF preview from raw template JSON (no database lookup).
+    Optional "preview_key" names the preview slot (e.g. one per designer or
+    template card); a newer request for the same slot supersedes this one,
+    which then gets 409. Identical templates share one render.
+    """
+    from .pdf_generator import get_preview_coalescer
 
     template_json = body.get("template")
     if not template_json:
         raise HTTPException(status_code=400, detail="Missing 'template' in request body")
 
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                f"{NODE_SERVICE_URL}/preview",
-                json={"template": template_json},
-                headers={"Content-Type": "application/json"}
-            )
-
-        if response.status_code != 200:
-            error_data = response.json()
-            raise HTTPException(
-                status_code=500,
-                detail=f"Preview generation failed: {error_data.get('message', 'Unknown error')}"
-            )
-
-        return response.json()
+        return await get_preview_coalescer().preview(template_json, user["sub"], body.get("preview_key"))
 
     except HTTPException:
         raise
@@ -323,16 +573,15 @@ async def generate_pdf_endpoint(request: PDFGenerateRequest, user: dict = Depend
 
     try:
         user_id = user["sub"]
-        # 1. Fetch template from database
-        templates = await supabase.select("templates", filters={"id": str(request.template_id), "user_id": user_id})
+        # 1. Fetch template (cached while updated_at is unchanged)
+        template = await get_template_for_render(str(request.template_id), user_id)
 
-        if not templates:
+        if not template:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Template with ID {request.template_id} not found"
             )
 
-        template = templates[0]
         template_json = template["template_json"]
 
         print(f"[API] Generating PDF from template: {template['name']}")
@@ -341,7 +590,8 @@ async def generate_pdf_endpoint(request: PDFGenerateRequest, user: dict = Depend
         result = await generate_pdf(
             template_json=template_json,
             input_data=request.input_data,
-            filename=request.filename
+            filename=request.filename,
+            user_id=user_id
         )
 
         # 3. Log usage to database
@@ -2,6 +2,7 @@
 Scheduler — Idempotent recurring invoice job runner.
 Finds due recurring_rules, clones the source document, optionally sends it.
 """
+import os
 import asyncio
 from datetime import datetime, timezone, timedelta
 from .supabase_client import supabase
@@ -10,10 +11,14 @@ from .activity_routes import _log_activity
 # Re-use the next_run calculator
 from .automation_routes import _calculate_next_run
 
+# Rules executed concurrently per run; their PDFs are rendered in batches per template
+SCHEDULER_CONCURRENCY = max(1, int(os.getenv("SCHEDULER_CONCURRENCY", "25")))
 
-async def execute_single_rule(rule: dict) -> dict:
+
+async def execute_single_rule(rule: dict, batcher=None) -> dict:
     """
-    Execute a single recurring rule:
+    Execute a single recurring rule (PDFs go through batcher, a PDFBatcher,
+    when given):
     1. Claim via INSERT into recurring_runs (unique index = idempotency)
     2. Fetch + clone source document with new number & dates
     3. Generate PDF
@@ -45,32 +50,25 @@ async def execute_single_rule(rule: dict) -> dict:
     run_id = run["id"]
 
     try:
-        # 2. Fetch source document
-        source_docs = await supabase.select(
-            "documents",
-            filters={"id": rule["source_document_id"], "user_id": user_id}
+        from .document_routes import gather_or_raise, load_document_for_render
+        from .settings_routes import get_company_settings
+
+        # 2. Fetch source document (with customer + template) and company settings in parallel
+        (source, customer, template), settings = await gather_or_raise(
+            load_document_for_render(rule["source_document_id"], user_id),
+            get_company_settings(user_id),
         )
-        if not source_docs:
+        if not source:
             raise Exception("Source document not found")
-        source = source_docs[0]
 
         # 3. Generate new document number
-        settings_rows = await supabase.select("company_settings", filters={"user_id": user_id})
-        company_settings = settings_rows[0] if settings_rows else {}
+        company_settings = settings or {}
 
         doc_type = source.get("document_type", "invoice")
-        if doc_type == "invoice":
-            fmt = company_settings.get("invoice_number_format", "F-{YEAR}-{SEQ}")
-            prefix = company_settings.get("invoice_number_prefix", "F")
-            next_num = company_settings.get("invoice_number_next", 1)
-        else:
-            fmt = company_settings.get("quote_number_format", "O-{YEAR}-{SEQ}")
-            prefix = company_settings.get("quote_number_prefix", "O")
-            next_num = company_settings.get("quote_number_next", 1)
-
-        from .settings_routes import format_document_number
-        actual_fmt = fmt.replace("{PREFIX}", prefix)
-        new_doc_number = format_document_number(actual_fmt, next_num)
+
+        from .settings_routes import allocate_document_number
+        allocated = await allocate_document_number(user_id, doc_type)
+        new_doc_number = allocated["formatted"]
 
         # 4. New dates
         today = now.strftime("%Y-%m-%d")
@@ -103,26 +101,14 @@ async def execute_single_rule(rule: dict) -> dict:
         # 6. Generate PDF
         pdf_url = None
         try:
-            from .pdf_generator import generate_pdf
+            from .pdf_generator import generate_pdf, render_hash
             from .document_routes import build_input_data, calculate_totals
 
-            template_rows = await supabase.select(
-                "templates", filters={"id": source["template_id"], "user_id": user_id}
-            )
-            if template_rows:
-                template_json = template_rows[0]["template_json"]
+            if template:
+                template_json = template["template_json"]
                 line_items = source.get("line_items", [])
                 totals = calculate_totals(line_items)
 
-                # Fetch customer for PDF
-                customer = None
-                if source.get("customer_id"):
-                    cust_rows = await supabase.select(
-                        "customers", filters={"id": source["customer_id"], "user_id": user_id}
-                    )
-                    if cust_rows:
-                        customer = cust_rows[0]
-
                 # Convert dates for display
                 def iso_to_display(iso_date):
                     if not iso_date:
@@ -139,44 +125,41 @@ async def execute_single_rule(rule: dict) -> dict:
                     totals, doc_type
                 )
 
-                pdf_result = await generate_pdf(
-                    template_json, input_data,
-                    filename=f"{doc_type}_{new_doc_number}"
-                )
+                filename = f"{doc_type}_{new_doc_number}"
+                if batcher is not None:
+                    pdf_result = await batcher.generate(
+                        f"{template['id']}:{template.get('updated_at')}",
+                        template_json, input_data, filename=filename
+                    )
+                else:
+                    pdf_result = await generate_pdf(
+                        template_json, input_data, filename=filename, lane="batch", user_id=user_id
+                    )
                 pdf_url = pdf_result["pdf_url"]
 
                 await supabase.update(
                     "documents",
-                    {"pdf_url": pdf_url, "storage_path": pdf_result["storage_path"], "status": "sent"},
+                    {
+                        "pdf_url": pdf_url,
+                        "storage_path": pdf_result["storage_path"],
+                        "thumbnail_url": pdf_result["thumbnail_url"],
+                        "render_hash": render_hash(template_json, input_data),
+                        "pdf_status": "ready",
+                        "status": "sent",
+                    },
                     {"id": created_doc_id, "user_id": user_id}
                 )
         except Exception as pdf_err:
             print(f"[Scheduler] PDF generation failed for rule {rule_id}: {pdf_err}")
 
-        # 7. Increment document number in settings
-        if settings_rows:
-            try:
-                num_field = "invoice_number_next" if doc_type == "invoice" else "quote_number_next"
-                await supabase.update(
-                    "company_settings",
-                    {num_field: next_num + 1},
-                    {"id": company_settings["id"], "user_id": user_id}
-                )
-            except Exception:
-                pass
-
-        # 8. Optionally auto-send
+        # 7. Optionally auto-send
         send_id = None
         if rule.get("auto_send") and pdf_url and source.get("customer_id"):
             try:
                 from .email_service import get_email_provider, build_document_email
 
-                # Fetch full customer for email
-                cust_rows = await supabase.select(
-                    "customers", filters={"id": source["customer_id"], "user_id": user_id}
-                )
-                if cust_rows:
-                    customer = cust_rows[0]
+                # Customer was embedded with the source document
+                if customer:
                     email = customer.get("email")
                     if email:
                         provider = get_email_provider()
@@ -219,7 +202,7 @@ async def execute_single_rule(rule: dict) -> dict:
             except Exception as send_err:
                 print(f"[Scheduler] Auto-send failed for rule {rule_id}: {send_err}")
 
-        # 9. Advance next_run_at
+        # 8. Advance next_run_at
         next_run = _calculate_next_run(
             rule["frequency"],
             rule.get("day_of_month"),
@@ -246,7 +229,7 @@ async def execute_single_rule(rule: dict) -> dict:
             "recurring_rules", rule_updates, {"id": rule_id, "user_id": user_id}
         )
 
-        # 10. Mark run as completed
+        # 9. Mark run as completed
         await supabase.update(
             "recurring_runs",
             {
@@ -258,7 +241,7 @@ async def execute_single_rule(rule: dict) -> dict:
             {"id": run_id}
         )
 
-        # 11. Log activity
+        # 10. Log activity
         await _log_activity(
             user_id=user_id,
             document_id=created_doc_id,
@@ -315,18 +298,32 @@ async def run_due_automations():
 
         print(f"[Scheduler] Found {len(rules)} due automation(s)")
 
-        for rule in rules:
-            try:
-                await execute_single_rule(rule)
-            except Exception as e:
-                print(f"[Scheduler] Failed to execute rule {rule['id']}: {e}")
+        from .pdf_generator import PDFBatcher
+
+        # Rules run concurrently so PDFs for the same template meet in the batcher
+        batcher = PDFBatcher()
+        semaphore = asyncio.Semaphore(SCHEDULER_CONCURRENCY)
+
+        async def run_rule(rule):
+            async with semaphore:
+                try:
+                    await execute_single_rule(rule, batcher)
+                except Exception as e:
+                    print(f"[Scheduler] Failed to execute rule {rule['id']}: {e}")
+
+        try:
+            await asyncio.gather(*(run_rule(rule) for rule in rules))
+        finally:
+            await batcher.close()
 
     except Exception as e:
         print(f"[Scheduler] Error in run_due_automations: {e}")
 
 
 async def scheduler_loop(interval_seconds: int = 300):
-    """Background loop that checks for due automations every interval."""
+    """Background loop that checks for due automations and sweeps stale PDF jobs every interval."""
+    from .pdf_jobs import get_pdf_job_queue
+
     print(f"[Scheduler] Started — checking every {interval_seconds}s")
     while True:
         await asyncio.sleep(interval_seconds)
@@ -334,3 +331,7 @@ async def scheduler_loop(interval_seconds: int = 300):
             await run_due_automations()
         except Exception as e:
             print(f"[Scheduler] Loop error: {e}")
+        try:
+            await get_pdf_job_queue().sweep()
+        except Exception as e:
+            print(f"[Scheduler] PDF job sweep error: {e}")
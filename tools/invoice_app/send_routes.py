@@ -2,14 +2,16 @@
 Document Send Routes — email sending, send history, reminders, manual mark-as-sent.
 """
 import base64
-import httpx
 from datetime import datetime, timezone
-from fastapi import APIRouter, HTTPException, status, Depends
-from .supabase_client import supabase
+from fastapi import APIRouter, HTTPException, status, Depends, Query
+from typing import Optional
+from .supabase_client import supabase, DEFAULT_PAGE_SIZE
+from .http_client import get_http_client
 from .auth_middleware import get_current_user
 from .email_service import get_email_provider, build_document_email
 from .activity_routes import _log_activity
-from .settings_routes import get_default_settings
+from .settings_routes import get_company_settings, get_default_settings
+from .document_routes import load_document_for_render
 
 router = APIRouter()
 
@@ -20,9 +22,9 @@ async def _fetch_pdf_attachment(doc: dict) -> list | None:
     if not pdf_url:
         return None
     try:
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(pdf_url, timeout=15)
-            resp.raise_for_status()
+        client = get_http_client()
+        resp = await client.get(pdf_url, timeout=15)
+        resp.raise_for_status()
         doc_number = doc.get("document_number", "document")
         filename = f"{doc_number}.pdf"
         return [{
@@ -35,18 +37,10 @@ async def _fetch_pdf_attachment(doc: dict) -> list | None:
 
 
 async def _get_document_with_customer(document_id: str, user_id: str):
-    """Fetch document and its customer in one helper."""
-    rows = await supabase.select("documents", filters={"id": document_id, "user_id": user_id})
-    if not rows:
+    """Fetch document and its customer in a single embedded select."""
+    doc, customer, _ = await load_document_for_render(document_id, user_id, with_template=False)
+    if not doc:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Document not found")
-    doc = rows[0]
-
-    customer = None
-    if doc.get("customer_id"):
-        cust_rows = await supabase.select("customers", filters={"id": doc["customer_id"], "user_id": user_id})
-        if cust_rows:
-            customer = cust_rows[0]
-
     return doc, customer
 
 
@@ -77,8 +71,7 @@ async def send_document(document_id: str, send_data: dict, user: dict = Depends(
             recipient_name = customer.get("name", "")
 
         # Build email content from templates (or use overrides from request)
-        settings_rows = await supabase.select("company_settings", filters={"user_id": user_id})
-        settings = settings_rows[0] if settings_rows else get_default_settings()
+        settings = await get_company_settings(user_id) or get_default_settings()
 
         email_content = build_document_email(doc, customer, settings)
 
@@ -156,16 +149,36 @@ async def send_document(document_id: str, send_data: dict, user: dict = Depends(
 
 
 @router.get("/api/documents/{document_id}/sends")
-async def get_send_history(document_id: str, user: dict = Depends(get_current_user)):
-    """Get the send history for a document."""
+async def get_send_history(
+    document_id: str,
+    limit: Optional[int] = Query(None, ge=1, le=200),
+    cursor: Optional[str] = Query(None),
+    user: dict = Depends(get_current_user)
+):
+    """
+    Get the send history for a document.
+    With limit/cursor the response is { items, next_cursor }.
+    """
     try:
         user_id = user["sub"]
+        if limit is not None or cursor:
+            items, next_cursor = await supabase.select_page(
+                "document_sends",
+                filters={"document_id": document_id, "user_id": user_id},
+                order_by=("created_at", True),
+                limit=limit or DEFAULT_PAGE_SIZE,
+                cursor=cursor
+            )
+            return {"items": items, "next_cursor": next_cursor}
+
         rows = await supabase.select(
             "document_sends",
             filters={"document_id": document_id, "user_id": user_id},
             order_by=("created_at", True)
         )
         return rows
+    except ValueError as e:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, str(e))
     except Exception as e:
         print(f"[Send] Error fetching send history: {e}")
         raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR, f"Failed to fetch sends: {str(e)}")
@@ -196,8 +209,7 @@ async def send_reminder(document_id: str, send_data: dict, user: dict = Depends(
         if not recipient_name and customer:
             recipient_name = customer.get("name", "")
 
-        settings_rows = await supabase.select("company_settings", filters={"user_id": user_id})
-        settings = settings_rows[0] if settings_rows else get_default_settings()
+        settings = await get_company_settings(user_id) or get_default_settings()
 
         email_content = build_document_email(doc, customer, settings)
         subject = send_data.get("subject", "").strip() or f"Reminder: {email_content['subject']}"
@@ -1,13 +1,37 @@
 """
 Settings API routes for company details and preferences
 """
+import os
+import httpx
 from fastapi import APIRouter, HTTPException, status, Depends
 from datetime import datetime
 from .supabase_client import supabase
+from .cache import Cache
 from .auth_middleware import get_current_user
 
 router = APIRouter(prefix="/api/settings")
 
+# company_settings columns per document type: (next, format, prefix, default format, default prefix)
+NUMBER_FIELDS = {
+    "invoice": ("invoice_number_next", "invoice_number_format", "invoice_number_prefix", "F-{YEAR}-{SEQ}", "F"),
+    "quote": ("quote_number_next", "quote_number_format", "quote_number_prefix", "O-{YEAR}-{SEQ}", "O"),
+}
+
+# Retries for the compare-and-swap fallback used when the RPC is not installed
+NUMBER_CAS_MAX_ATTEMPTS = 5
+
+_allocate_rpc_available = True
+
+# company_settings is read on nearly every write path; cache the row per user
+SETTINGS_CACHE_TTL_SECONDS = float(os.getenv("SETTINGS_CACHE_TTL_SECONDS", "60"))
+SETTINGS_CACHE_MAX_ENTRIES = int(os.getenv("SETTINGS_CACHE_MAX_ENTRIES", "1000"))
+
+settings_cache = Cache(
+    "company_settings",
+    ttl=SETTINGS_CACHE_TTL_SECONDS,
+    max_entries=SETTINGS_CACHE_MAX_ENTRIES,
+)
+
 
 def get_default_settings():
     """Return default settings when none exist"""
@@ -71,6 +95,113 @@ def format_document_number(fmt: str, next_num: int) -> str:
     return result
 
 
+async def get_company_settings(user_id: str) -> dict | None:
+    """
+    Cached company_settings row for a user, or None if none exists yet.
+    Callers get their own copy, so mutating it never touches the cache.
+    """
+    async def load():
+        return await supabase.select("company_settings", filters={"user_id": user_id})
+
+    rows = await settings_cache.get_or_load(user_id, load)
+    return dict(rows[0]) if rows else None
+
+
+async def invalidate_company_settings(user_id: str):
+    """Drop a user's cached settings after any write to their company_settings row."""
+    await settings_cache.invalidate(user_id)
+
+
+async def _allocate_with_cas(user_id: str, document_type: str, count: int):
+    """
+    Fallback allocator for databases without the allocate_document_number function
+    (tools/setup_numbering_migration.sql): a PATCH conditioned on the value just read,
+    retried when another request got there first.
+    """
+    next_field, fmt_field, prefix_field, default_fmt, default_prefix = NUMBER_FIELDS[document_type]
+    for _ in range(NUMBER_CAS_MAX_ATTEMPTS):
+        rows = await supabase.select(
+            "company_settings",
+            columns=f"id,{next_field},{fmt_field},{prefix_field}",
+            filters={"user_id": user_id}
+        )
+        if not rows:
+            return None
+        row = rows[0]
+        # A NULL counter counts as 1 (like the RPC's COALESCE) but must be matched with is.null.
+        # The returned row, not a count, decides the race: a PATCH that applied but came
+        # back without a count would otherwise be retried and burn another number block.
+        current = row.get(next_field) or 1
+        updated = await supabase.update(
+            "company_settings",
+            {next_field: current + count},
+            {"id": row["id"], next_field: row.get(next_field)}
+        )
+        if updated:
+            return {
+                "first_number": current,
+                "last_number": current + count - 1,
+                "number_format": row.get(fmt_field) or default_fmt,
+                "number_prefix": row.get(prefix_field) or default_prefix,
+            }
+    raise RuntimeError("Could not allocate a document number, please retry")
+
+
+async def _allocate_block(user_id: str, document_type: str, count: int):
+    """Reserve count numbers via the RPC, falling back to compare-and-swap if it is missing."""
+    global _allocate_rpc_available
+    if _allocate_rpc_available:
+        try:
+            rows = await supabase.rpc("allocate_document_number", {
+                "p_user_id": user_id,
+                "p_document_type": document_type,
+                "p_count": count,
+            })
+            return rows[0] if rows else None
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code != 404:
+                raise
+            _allocate_rpc_available = False
+            print("[Settings] allocate_document_number RPC not found, using conditional updates "
+                  "(run tools/setup_numbering_migration.sql)")
+    return await _allocate_with_cas(user_id, document_type, count)
+
+
+async def allocate_document_number(user_id: str, document_type: str, count: int = 1) -> dict:
+    """
+    Atomically take the next document number(s) for a user.
+    With count > 1 a contiguous block is reserved; the returned "format" has
+    {PREFIX} resolved so the rest of the block can be rendered with
+    format_document_number(fmt, n).
+
+    Returns:
+        Dict with number, last_number, formatted and format
+    """
+    if document_type not in NUMBER_FIELDS:
+        raise ValueError("document_type must be 'invoice' or 'quote'")
+
+    block = await _allocate_block(user_id, document_type, count)
+    if not block:
+        # First document for this user: create default settings and retry
+        default = get_default_settings()
+        default["user_id"] = user_id
+        await supabase.insert("company_settings", default)
+        block = await _allocate_block(user_id, document_type, count)
+        if not block:
+            raise RuntimeError("Company settings missing, cannot allocate document number")
+
+    # The *_number_next counter changed
+    await invalidate_company_settings(user_id)
+
+    fmt = block["number_format"].replace("{PREFIX}", block["number_prefix"] or "")
+    return {
+        "number": block["first_number"],
+        "last_number": block["last_number"],
+        "formatted": format_document_number(fmt, block["first_number"]),
+        "format": fmt,
+    }
+
+
 @router.get("")
 async def get_settings(user: dict = Depends(get_current_user)):
     """
@@ -78,10 +209,7 @@ async def get_settings(user: dict = Depends(get_current_user)):
     """
     try:
         user_id = user["sub"]
-        rows = await supabase.select("company_settings", filters={"user_id": user_id})
-        if rows and len(rows) > 0:
-            return rows[0]
-        return get_default_settings()
+        return await get_company_settings(user_id) or get_default_settings()
     except Exception as e:
         print(f"[Settings] Error fetching settings: {str(e)}")
         raise HTTPException(
@@ -105,20 +233,21 @@ async def update_settings(settings_data: dict, user: dict = Depends(get_current_
         settings_data.pop("user_id", None)
 
         # Check if settings exist for this user
-        rows = await supabase.select("company_settings", columns="id", filters={"user_id": user_id})
+        existing = await get_company_settings(user_id)
 
-        if rows and len(rows) > 0:
+        if existing:
             # Update existing
             result = await supabase.update(
                 "company_settings",
                 settings_data,
-                {"id": rows[0]["id"], "user_id": user_id}
+                {"id": existing["id"], "user_id": user_id}
             )
         else:
             # Insert new with user_id
             settings_data["user_id"] = user_id
             result = await supabase.insert("company_settings", settings_data)
 
+        await invalidate_company_settings(user_id)
         return result
     except Exception as e:
         print(f"[Settings] Error updating settings: {str(e)}")
@@ -141,8 +270,7 @@ async def get_next_number(document_type: str, user: dict = Depends(get_current_u
 
     try:
         user_id = user["sub"]
-        rows = await supabase.select("company_settings", filters={"user_id": user_id})
-        settings = rows[0] if rows else get_default_settings()
+        settings = await get_company_settings(user_id) or get_default_settings()
 
         if document_type == "invoice":
             fmt = settings.get("invoice_number_format", "F-{YEAR}-{SEQ}")
@@ -181,41 +309,13 @@ async def increment_number(document_type: str, user: dict = Depends(get_current_
 
     try:
         user_id = user["sub"]
-        rows = await supabase.select("company_settings", filters={"user_id": user_id})
-
-        if not rows:
-            # Create default settings first
-            default = get_default_settings()
-            default["user_id"] = user_id
-            await supabase.insert("company_settings", default)
-            rows = await supabase.select("company_settings", filters={"user_id": user_id})
-
-        settings = rows[0]
-
-        if document_type == "invoice":
-            fmt = settings.get("invoice_number_format", "F-{YEAR}-{SEQ}")
-            current = settings.get("invoice_number_next", 1)
-            formatted = format_document_number(fmt, current)
-            await supabase.update(
-                "company_settings",
-                {"invoice_number_next": current + 1},
-                {"id": settings["id"], "user_id": user_id}
-            )
-        else:
-            fmt = settings.get("quote_number_format", "O-{YEAR}-{SEQ}")
-            current = settings.get("quote_number_next", 1)
-            formatted = format_document_number(fmt, current)
-            await supabase.update(
-                "company_settings",
-                {"quote_number_next": current + 1},
-                {"id": settings["id"], "user_id": user_id}
-            )
+        allocated = await allocate_document_number(user_id, document_type)
 
         return {
             "document_type": document_type,
-            "number": current,
-            "formatted": formatted,
-            "next_number": current + 1,
+            "number": allocated["number"],
+            "formatted": allocated["formatted"],
+            "next_number": allocated["number"] + 1,
         }
     except Exception as e:
         print(f"[Settings] Error incrementing number: {str(e)}")
@@ -17,7 +17,8 @@ async def get_dashboard_overview(user: dict = Depends(get_current_user)):
     try:
         user_id = user["sub"]
         templates = await supabase.select("templates", filters={"user_id": user_id})
-        usage_logs = await supabase.select("usage_logs", filters={"user_id": user_id})
+        # Only template_id is needed to rank usage
+        usage_logs = await supabase.select("usage_logs", columns="template_id", filters={"user_id": user_id})
 
         total_templates = len(templates)
         total_generations = len(usage_logs)
@@ -84,8 +85,8 @@ async def get_dashboard_stats(user: dict = Depends(get_current_user)):
     try:
         user_id = user["sub"]
         # Fetch all data for the current user
-        templates = await supabase.select("templates", filters={"user_id": user_id})
-        usage_logs = await supabase.select("usage_logs", filters={"user_id": user_id})
+        templates = await supabase.select("templates", columns="id,name", filters={"user_id": user_id})
+        usage_logs = await supabase.select("usage_logs", columns="template_id", filters={"user_id": user_id})
 
         # Try fetching documents and customers (tables may not exist yet)
         try:
@@ -94,9 +95,9 @@ async def get_dashboard_stats(user: dict = Depends(get_current_user)):
             documents = []
 
         try:
-            customers = await supabase.select("customers", filters={"user_id": user_id})
+            total_customers = await supabase.count("customers", filters={"user_id": user_id})
         except Exception:
-            customers = []
+            total_customers = 0
 
         # -- Template stats --
         total_templates = len(templates)
@@ -108,7 +109,6 @@ async def get_dashboard_stats(user: dict = Depends(get_current_user)):
 
         total_invoices = len(invoices)
         total_quotes = len(quotes)
-        total_customers = len(customers)
 
         # Revenue this month (paid invoices in current calendar month)
         now = datetime.utcnow()
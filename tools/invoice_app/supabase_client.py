@@ -2,8 +2,11 @@
 Supabase client initialization using httpx for direct REST API calls
 """
 import os
-import httpx
+import json
+import base64
+from uuid import UUID
 from dotenv import load_dotenv
+from .http_client import get_http_client
 
 # Load environment variables
 load_dotenv()
@@ -14,6 +17,71 @@ SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY", "")
 SUPABASE_STORAGE_BUCKET = os.getenv("SUPABASE_STORAGE_BUCKET", "generated-pdfs")
 
+# Page size used when a list route is paginated without an explicit limit
+DEFAULT_PAGE_SIZE = 50
+
+# Max values per in.(...) filter; 100 UUIDs keep the query string around 4 KB,
+# well under typical proxy URL limits
+IN_FILTER_CHUNK_SIZE = 100
+
+
+def filter_uuids(values: list) -> list:
+    """Keep only well-formed UUID strings (deduplicated, order preserved)."""
+    result = []
+    seen = set()
+    for value in values:
+        try:
+            normalized = str(UUID(str(value)))
+        except (ValueError, TypeError, AttributeError):
+            continue
+        if normalized not in seen:
+            seen.add(normalized)
+            result.append(normalized)
+    return result
+
+
+def encode_cursor(sort_value, row_id) -> str:
+    """Encode the (sort value, id) of the last row on a page as an opaque cursor."""
+    raw = json.dumps([sort_value, row_id], separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Decode a cursor from encode_cursor. Raises ValueError if it is malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if row_id is None:
+        raise ValueError("Invalid cursor")
+    return sort_value, row_id
+
+
+def project_columns(fields: str, default_columns: list, allowed_columns: set, required: tuple = ("id",)) -> str:
+    """
+    Resolve a comma-separated fields= query value into a PostgREST select string.
+    Falls back to default_columns when fields is empty; raises ValueError on columns
+    outside allowed_columns. Columns in required are always included (e.g. the id
+    and sort column that pagination cursors are built from).
+    """
+    if fields and fields.strip():
+        columns = [c.strip() for c in fields.split(",") if c.strip()]
+        unknown = [c for c in columns if c not in allowed_columns]
+        if unknown:
+            raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+    else:
+        columns = list(default_columns)
+    missing = [c for c in required if c not in columns]
+    return ",".join(missing + columns)
+
+
+def _quote(value) -> str:
+    """Quote a value for use inside a PostgREST logical filter (or=/and=)."""
+    text = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{text}"'
+
+
 class SimpleSupabaseClient:
     """
     Simplified Supabase client using httpx for direct REST API calls
@@ -37,7 +105,8 @@ class SimpleSupabaseClient:
             "Prefer": "return=representation"
         }
 
-    async def select(self, table: str, columns: str = "*", filters: dict = None, order_by: tuple = None):
+    async def select(self, table: str, columns: str = "*", filters: dict = None, order_by: tuple = None,
+                     limit: int = None, offset: int = None):
         """
         SELECT query
         Args:
@@ -45,56 +114,80 @@ class SimpleSupabaseClient:
             columns: Columns to select (default: *)
             filters: Dict of column:value filters
             order_by: Tuple of (column, descending: bool)
+            limit: Optional max number of rows (applied by PostgREST)
+            offset: Optional number of rows to skip (applied by PostgREST)
         """
-        async with httpx.AsyncClient() as client:
-            params = {"select": columns}
+        client = get_http_client()
+        params = {"select": columns}
 
-            if filters:
-                for key, value in filters.items():
-                    if isinstance(value, bool):
-                        params[key] = f"eq.{str(value).lower()}"
-                    else:
-                        params[key] = f"eq.{value}"
+        if filters:
+            for key, value in filters.items():
+                if isinstance(value, bool):
+                    params[key] = f"eq.{str(value).lower()}"
+                else:
+                    params[key] = f"eq.{value}"
 
-            if order_by:
-                column, desc = order_by
-                params["order"] = f"{column}.{'desc' if desc else 'asc'}"
+        if order_by:
+            column, desc = order_by
+            params["order"] = f"{column}.{'desc' if desc else 'asc'}"
 
-            response = await client.get(
-                f"{self.rest_url}/{table}",
-                headers=self.headers,
-                params=params
-            )
-            response.raise_for_status()
-            return response.json()
+        if limit is not None:
+            params["limit"] = str(limit)
+        if offset:
+            params["offset"] = str(offset)
+
+        response = await client.get(
+            f"{self.rest_url}/{table}",
+            headers=self.headers,
+            params=params
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def select_embedded(self, table: str, embeds: dict, columns: str = "*",
+                              filters: dict = None, limit: int = None):
+        """
+        SELECT with PostgREST resource embedding, so related rows come back
+        in the same round trip (e.g. select=*,customers(*),templates(template_json)).
+        Args:
+            table: Table name
+            embeds: Dict of related table -> columns to embed; each embedded
+                    resource is returned under its table name (object or null
+                    for many-to-one relations)
+            columns: Columns of the base table (default: *)
+            filters: Dict of column:value filters on the base table
+            limit: Optional max number of rows
+        """
+        select = ",".join([columns] + [f"{name}({cols})" for name, cols in embeds.items()])
+        return await self.select(table, columns=select, filters=filters, limit=limit)
 
     async def insert(self, table: str, data: dict):
         """INSERT query"""
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.rest_url}/{table}",
-                headers=self.headers,
-                json=data
-            )
-            if response.status_code >= 400:
-                print(f"[Supabase] INSERT {table} failed ({response.status_code}): {response.text}")
-                print(f"[Supabase] Payload keys: {list(data.keys())}")
-            response.raise_for_status()
-            result = response.json()
-            return result[0] if result else None
+        client = get_http_client()
+        response = await client.post(
+            f"{self.rest_url}/{table}",
+            headers=self.headers,
+            json=data
+        )
+        if response.status_code >= 400:
+            print(f"[Supabase] INSERT {table} failed ({response.status_code}): {response.text}")
+            print(f"[Supabase] Payload keys: {list(data.keys())}")
+        response.raise_for_status()
+        result = response.json()
+        return result[0] if result else None
 
     async def insert_many(self, table: str, data_list: list):
         """INSERT multiple rows in a single request. PostgREST supports array payloads natively."""
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.rest_url}/{table}",
-                headers=self.headers,
-                json=data_list
-            )
-            if response.status_code >= 400:
-                print(f"[Supabase] INSERT_MANY {table} failed ({response.status_code}): {response.text}")
-            response.raise_for_status()
-            return response.json()
+        client = get_http_client()
+        response = await client.post(
+            f"{self.rest_url}/{table}",
+            headers=self.headers,
+            json=data_list
+        )
+        if response.status_code >= 400:
+            print(f"[Supabase] INSERT_MANY {table} failed ({response.status_code}): {response.text}")
+        response.raise_for_status()
+        return response.json()
 
     async def update(self, table: str, data: dict, filters: dict):
         """
@@ -102,30 +195,67 @@ class SimpleSupabaseClient:
         Args:
             table: Table name
             data: Data to update
-            filters: Dict of column:value filters for WHERE clause
+            filters: Dict of column:value filters for WHERE clause (None matches NULL)
+        Returns:
+            The first updated row, or None if no row matched
         """
-        async with httpx.AsyncClient() as client:
-            params = {}
-            for key, value in filters.items():
-                if isinstance(value, bool):
-                    params[key] = f"eq.{str(value).lower()}"
-                else:
-                    params[key] = f"eq.{value}"
+        client = get_http_client()
+        params = {}
+        for key, value in filters.items():
+            if value is None:
+                params[key] = "is.null"
+            elif isinstance(value, bool):
+                params[key] = f"eq.{str(value).lower()}"
+            else:
+                params[key] = f"eq.{value}"
 
-            response = await client.patch(
-                f"{self.rest_url}/{table}",
-                headers=self.headers,
-                params=params,
-                json=data
-            )
-            if response.status_code >= 400:
-                print(f"[Supabase] UPDATE {table} failed ({response.status_code}): {response.text}")
-                print(f"[Supabase] Payload keys: {list(data.keys())}")
-            response.raise_for_status()
-            result = response.json()
-            if not result:
-                print(f"[Supabase] UPDATE {table} returned empty result (0 rows affected). Filters: {filters}")
-            return result[0] if result else None
+        response = await client.patch(
+            f"{self.rest_url}/{table}",
+            headers=self.headers,
+            params=params,
+            json=data
+        )
+        if response.status_code >= 400:
+            print(f"[Supabase] UPDATE {table} failed ({response.status_code}): {response.text}")
+            print(f"[Supabase] Payload keys: {list(data.keys())}")
+        response.raise_for_status()
+        result = response.json()
+        if not result:
+            print(f"[Supabase] UPDATE {table} returned empty result (0 rows affected). Filters: {filters}")
+        return result[0] if result else None
+
+    async def update_many(self, table: str, data: dict, filters: dict) -> int:
+        """
+        UPDATE every row matching filters in a single PATCH and return how many changed.
+        Asks PostgREST for return=minimal + count=exact so no rows come back;
+        the affected-row count is read from the Content-Range header.
+        Args:
+            table: Table name
+            data: Data to update
+            filters: Dict of column:value filters for WHERE clause (None matches NULL)
+        """
+        client = get_http_client()
+        params = {}
+        for key, value in filters.items():
+            if value is None:
+                params[key] = "is.null"
+            elif isinstance(value, bool):
+                params[key] = f"eq.{str(value).lower()}"
+            else:
+                params[key] = f"eq.{value}"
+
+        headers = {**self.headers, "Prefer": "return=minimal,count=exact"}
+        response = await client.patch(
+            f"{self.rest_url}/{table}",
+            headers=headers,
+            params=params,
+            json=data
+        )
+        if response.status_code >= 400:
+            print(f"[Supabase] UPDATE_MANY {table} failed ({response.status_code}): {response.text}")
+        response.raise_for_status()
+        total = response.headers.get("content-range", "").rsplit("/", 1)[-1]
+        return int(total) if total.isdigit() else 0
 
     async def select_filtered(self, table: str, columns: str = "*", eq_filters: dict = None, gte_filters: dict = None, order_by: tuple = None):
         """
@@ -137,27 +267,27 @@ class SimpleSupabaseClient:
             gte_filters: Dict of column:value for greater-than-or-equal filters
             order_by: Tuple of (column, descending: bool)
         """
-        async with httpx.AsyncClient() as client:
-            params = {"select": columns}
-            if eq_filters:
-                for key, value in eq_filters.items():
-                    if isinstance(value, bool):
-                        params[key] = f"eq.{str(value).lower()}"
-                    else:
-                        params[key] = f"eq.{value}"
-            if gte_filters:
-                for key, value in gte_filters.items():
-                    params[key] = f"gte.{value}"
-            if order_by:
-                column, desc = order_by
-                params["order"] = f"{column}.{'desc' if desc else 'asc'}"
-            response = await client.get(
-                f"{self.rest_url}/{table}",
-                headers=self.headers,
-                params=params
-            )
-            response.raise_for_status()
-            return response.json()
+        client = get_http_client()
+        params = {"select": columns}
+        if eq_filters:
+            for key, value in eq_filters.items():
+                if isinstance(value, bool):
+                    params[key] = f"eq.{str(value).lower()}"
+                else:
+                    params[key] = f"eq.{value}"
+        if gte_filters:
+            for key, value in gte_filters.items():
+                params[key] = f"gte.{value}"
+        if order_by:
+            column, desc = order_by
+            params["order"] = f"{column}.{'desc' if desc else 'asc'}"
+        response = await client.get(
+            f"{self.rest_url}/{table}",
+            headers=self.headers,
+            params=params
+        )
+        response.raise_for_status()
+        return response.json()
 
     async def select_or(self, table: str, or_filters: str, columns: str = "*", order_by: tuple = None, filters: dict = None):
         """
@@ -169,61 +299,220 @@ class SimpleSupabaseClient:
             order_by: Tuple of (column, descending: bool)
             filters: Optional dict of column:value AND filters (combined with OR)
         """
-        async with httpx.AsyncClient() as client:
-            params = {"select": columns, "or": or_filters}
+        client = get_http_client()
+        params = {"select": columns, "or": or_filters}
 
-            if filters:
-                for key, value in filters.items():
-                    if isinstance(value, bool):
-                        params[key] = f"eq.{str(value).lower()}"
-                    else:
-                        params[key] = f"eq.{value}"
+        if filters:
+            for key, value in filters.items():
+                if isinstance(value, bool):
+                    params[key] = f"eq.{str(value).lower()}"
+                else:
+                    params[key] = f"eq.{value}"
 
-            if order_by:
-                column, desc = order_by
-                params["order"] = f"{column}.{'desc' if desc else 'asc'}"
+        if order_by:
+            column, desc = order_by
+            params["order"] = f"{column}.{'desc' if desc else 'asc'}"
 
-            response = await client.get(
-                f"{self.rest_url}/{table}",
-                headers=self.headers,
-                params=params
-            )
-            response.raise_for_status()
-            return response.json()
+        response = await client.get(
+            f"{self.rest_url}/{table}",
+            headers=self.headers,
+            params=params
+        )
+        response.raise_for_status()
+        return response.json()
 
     async def select_lte(self, table: str, lte_column: str, lte_value: str, columns: str = "*", eq_filters: dict = None, order_by: tuple = None):
         """
         SELECT with a <= filter on one column plus optional eq filters.
         Useful for scheduler queries like next_run_at <= now().
         """
-        async with httpx.AsyncClient() as client:
-            params = {"select": columns, lte_column: f"lte.{lte_value}"}
-            if eq_filters:
-                for key, value in eq_filters.items():
+        client = get_http_client()
+        params = {"select": columns, lte_column: f"lte.{lte_value}"}
+        if eq_filters:
+            for key, value in eq_filters.items():
+                if isinstance(value, bool):
+                    params[key] = f"eq.{str(value).lower()}"
+                else:
+                    params[key] = f"eq.{value}"
+        if order_by:
+            column, desc = order_by
+            params["order"] = f"{column}.{'desc' if desc else 'asc'}"
+        response = await client.get(
+            f"{self.rest_url}/{table}",
+            headers=self.headers,
+            params=params
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def count(self, table: str, filters: dict = None, gte_filters: dict = None):
+        """
+        Exact row count without transferring rows.
+        Sends a HEAD request with Prefer: count=exact and reads the total from
+        the Content-Range header (e.g. "0-24/25" or "*/0").
+        Args:
+            table: Table name
+            filters: Dict of column:value equality filters
+            gte_filters: Dict of column:value greater-than-or-equal filters
+        """
+        client = get_http_client()
+        params = {"select": "id"}
+        if filters:
+            for key, value in filters.items():
+                if isinstance(value, bool):
+                    params[key] = f"eq.{str(value).lower()}"
+                else:
+                    params[key] = f"eq.{value}"
+        if gte_filters:
+            for key, value in gte_filters.items():
+                params[key] = f"gte.{value}"
+
+        headers = {**self.headers, "Prefer": "count=exact"}
+        response = await client.head(
+            f"{self.rest_url}/{table}",
+            headers=headers,
+            params=params
+        )
+        response.raise_for_status()
+        content_range = response.headers.get("content-range", "")
+        total = content_range.rsplit("/", 1)[-1]
+        if not total.isdigit():
+            raise ValueError(f"Missing exact count in Content-Range for {table}: '{content_range}'")
+        return int(total)
+
+    async def select_page(self, table: str, columns: str = "*", filters: dict = None,
+                          order_by: tuple = ("created_at", True), limit: int = DEFAULT_PAGE_SIZE,
+                          cursor: str = None, or_filters: str = None, range_filters: list = None):
+        """
+        Keyset-paginated SELECT.
+        Rows are ordered by (order column, id) so the page boundary is stable under
+        concurrent inserts, and the page size is requested with a PostgREST Range header.
+        NULLs in the order column sort last in either direction.
+        Args:
+            table: Table name
+            columns: Columns to select (must include the order column and id)
+            filters: Dict of column:value filters
+            order_by: Tuple of (column, descending: bool)
+            limit: Page size
+            cursor: Opaque cursor returned as next_cursor by the previous page
+            or_filters: Optional PostgREST OR filter string, e.g. "(name.ilike.*q*,city.ilike.*q*)"
+            range_filters: Optional list of (column, operator, value) tuples,
+                e.g. [("date", "gte", "2025-01-01"), ("date", "lte", "2025-03-31")]
+        Returns:
+            Tuple of (rows, next_cursor); next_cursor is None on the last page
+        """
+        client = get_http_client()
+        column, desc = order_by
+        direction = "desc" if desc else "asc"
+        params = {
+            "select": columns,
+            "order": f"{column}.{direction}.nullslast,id.{direction}",
+        }
+
+        if filters:
+            for key, value in filters.items():
+                if isinstance(value, bool):
+                    params[key] = f"eq.{str(value).lower()}"
+                else:
+                    params[key] = f"eq.{value}"
+
+        if cursor:
+            # Rows strictly after the cursor: (col, id) < (last_col, last_id) for desc
+            last_value, last_id = decode_cursor(cursor)
+            op = "lt" if desc else "gt"
+            if last_value is None:
+                # Already among the trailing NULLs: only later ids remain
+                keyset = f"(and({column}.is.null,id.{op}.{_quote(last_id)}))"
+            else:
+                keyset = (
+                    f"({column}.{op}.{_quote(last_value)},"
+                    f"and({column}.eq.{_quote(last_value)},id.{op}.{_quote(last_id)}),"
+                    f"{column}.is.null)"
+                )
+            if or_filters:
+                params["and"] = f"(or{or_filters},or{keyset})"
+            else:
+                params["or"] = keyset
+        elif or_filters:
+            params["or"] = or_filters
+
+        if range_filters:
+            # The same column may appear twice (gte + lte), so send params as a list
+            params = list(params.items()) + [
+                (key, f"{op}.{value}") for key, op, value in range_filters
+            ]
+
+        # Ask for one extra row to learn whether another page exists
+        headers = {**self.headers, "Range-Unit": "items", "Range": f"0-{limit}"}
+        response = await client.get(
+            f"{self.rest_url}/{table}",
+            headers=headers,
+            params=params
+        )
+        response.raise_for_status()
+        rows = response.json()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = encode_cursor(last.get(column), last.get("id"))
+        return rows, next_cursor
+
+    async def update_in(self, table: str, data: dict, column: str, values: list,
+                        extra_filters: dict = None, columns: str = "*"):
+        """
+        UPDATE rows where column value is IN a list, in one PATCH per chunk.
+        Uses PostgREST in filter: column=in.(val1,val2,...)
+        Args:
+            table: Table name
+            data: Data to update
+            column: Column matched against values
+            values: Values to match (split into IN_FILTER_CHUNK_SIZE chunks)
+            extra_filters: Dict of column:value filters ANDed with the IN filter (e.g. user_id)
+            columns: Columns to return for the affected rows
+        Returns:
+            List of affected rows
+        """
+        if not values:
+            return []
+        client = get_http_client()
+        affected = []
+        for start in range(0, len(values), IN_FILTER_CHUNK_SIZE):
+            chunk = values[start:start + IN_FILTER_CHUNK_SIZE]
+            params = {"select": columns, column: f"in.({','.join(_quote(v) for v in chunk)})"}
+            if extra_filters:
+                for key, value in extra_filters.items():
                     if isinstance(value, bool):
                         params[key] = f"eq.{str(value).lower()}"
                     else:
                         params[key] = f"eq.{value}"
-            if order_by:
-                column, desc = order_by
-                params["order"] = f"{column}.{'desc' if desc else 'asc'}"
-            response = await client.get(
+            response = await client.patch(
                 f"{self.rest_url}/{table}",
                 headers=self.headers,
-                params=params
+                params=params,
+                json=data
             )
+            if response.status_code >= 400:
+                print(f"[Supabase] UPDATE_IN {table} failed ({response.status_code}): {response.text}")
             response.raise_for_status()
-            return response.json()
+            affected.extend(response.json())
+        return affected
 
-    async def delete_in(self, table: str, column: str, values: list, extra_filters: dict = None):
+    async def delete_in(self, table: str, column: str, values: list, extra_filters: dict = None,
+                        columns: str = "*"):
         """
-        DELETE rows where column value is IN a list.
+        DELETE rows where column value is IN a list, in one request per chunk.
         Uses PostgREST in filter: column=in.(val1,val2,...)
+        Returns the deleted rows (projected to columns).
         """
         if not values:
             return []
-        async with httpx.AsyncClient() as client:
-            params = {column: f"in.({','.join(str(v) for v in values)})"}
+        client = get_http_client()
+        deleted = []
+        for start in range(0, len(values), IN_FILTER_CHUNK_SIZE):
+            chunk = values[start:start + IN_FILTER_CHUNK_SIZE]
+            params = {"select": columns, column: f"in.({','.join(_quote(v) for v in chunk)})"}
             if extra_filters:
                 for key, value in extra_filters.items():
                     if isinstance(value, bool):
@@ -236,7 +525,8 @@ class SimpleSupabaseClient:
                 params=params
             )
             response.raise_for_status()
-            return response.json()
+            deleted.extend(response.json())
+        return deleted
 
     async def delete(self, table: str, filters: dict):
         """
@@ -245,22 +535,38 @@ class SimpleSupabaseClient:
             table: Table name
             filters: Dict of column:value filters for WHERE clause
         """
-        async with httpx.AsyncClient() as client:
-            params = {}
-            for key, value in filters.items():
-                if isinstance(value, bool):
-                    params[key] = f"eq.{str(value).lower()}"
-                else:
-                    params[key] = f"eq.{value}"
+        client = get_http_client()
+        params = {}
+        for key, value in filters.items():
+            if isinstance(value, bool):
+                params[key] = f"eq.{str(value).lower()}"
+            else:
+                params[key] = f"eq.{value}"
 
-            response = await client.delete(
-                f"{self.rest_url}/{table}",
-                headers=self.headers,
-                params=params
-            )
-            response.raise_for_status()
-            result = response.json()
-            return result[0] if result else None
+        response = await client.delete(
+            f"{self.rest_url}/{table}",
+            headers=self.headers,
+            params=params
+        )
+        response.raise_for_status()
+        result = response.json()
+        return result[0] if result else None
+
+    async def rpc(self, function: str, params: dict = None):
+        """
+        Call a Postgres function exposed by PostgREST (POST /rpc/<function>).
+        Args:
+            function: Function name
+            params: Named arguments for the function
+        """
+        client = get_http_client()
+        response = await client.post(
+            f"{self.rest_url}/rpc/{function}",
+            headers=self.headers,
+            json=params or {}
+        )
+        response.raise_for_status()
+        return response.json()
 
 # Create a singleton client instance
 supabase = SimpleSupabaseClient(SUPABASE_URL, SUPABASE_KEY, SUPABASE_SERVICE_ROLE_KEY) if SUPABASE_URL and SUPABASE_KEY else None
@@ -0,0 +1,112 @@
+"""
+Thumbnails — page-1 PNG previews of rendered PDFs.
+Page 1 is rasterized at low DPI with PyMuPDF (also used by ai_template_routes)
+in a small process pool, so the CPU-bound work never blocks the event loop.
+The PNG is stored next to its PDF ("generated/x.pdf" -> "generated/x.thumb.png")
+and its public URL is saved on the document or template row.
+
+PyMuPDF is optional: without it no thumbnails are produced and the frontend
+keeps rendering previews itself with pdf.js.
+"""
+import os
+import asyncio
+import importlib.util
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+THUMBNAIL_DPI = int(os.getenv("THUMBNAIL_DPI", "40"))
+THUMBNAIL_WORKERS = max(1, int(os.getenv("THUMBNAIL_WORKERS", "2")))
+THUMBNAILS_ENABLED = (
+    os.getenv("THUMBNAILS_ENABLED", "true").lower() == "true"
+    and importlib.util.find_spec("fitz") is not None
+)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_stats = {"rendered": 0, "failed": 0}
+
+
+def rasterize_first_page(pdf_bytes: bytes, dpi: int = THUMBNAIL_DPI) -> bytes:
+    """Render page 1 of a PDF to PNG bytes (runs in a pool process)."""
+    import fitz  # PyMuPDF
+
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        pix = doc[0].get_pixmap(dpi=dpi, alpha=False)
+        return pix.tobytes("png")
+
+
+def thumbnail_path(storage_path: str) -> str:
+    """Storage path of the thumbnail that belongs to a PDF."""
+    base = storage_path[:-4] if storage_path.endswith(".pdf") else storage_path
+    return f"{base}.thumb.png"
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: don't fork the server's threads and open sockets into the workers
+        _pool = ProcessPoolExecutor(
+            max_workers=THUMBNAIL_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pool
+
+
+async def render_thumbnail(pdf_bytes: bytes) -> Optional[bytes]:
+    """PNG of the PDF's first page, or None when PyMuPDF is not installed."""
+    if not THUMBNAILS_ENABLED:
+        return None
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_pool(), rasterize_first_page, pdf_bytes, THUMBNAIL_DPI)
+
+
+async def store_thumbnail(pdf_bytes: bytes, storage_path: str) -> Optional[str]:
+    """
+    Render the thumbnail of a PDF stored at storage_path and upload it next to it.
+    Returns its public URL, or None if thumbnails are unavailable or this one
+    failed; a missing thumbnail never fails the PDF it belongs to.
+    """
+    from .pdf_generator import upload_to_storage
+
+    if not THUMBNAILS_ENABLED:
+        return None
+    try:
+        png = await render_thumbnail(pdf_bytes)
+        # Upsert: a concurrent lazy request may have stored the same thumbnail already
+        url = await upload_to_storage(
+            png, thumbnail_path(storage_path), content_type="image/png", upsert=True
+        )
+    except Exception as e:
+        _stats["failed"] += 1
+        print(f"[Thumbnails] Failed to create thumbnail for {storage_path}: {e}")
+        return None
+    _stats["rendered"] += 1
+    return url
+
+
+async def delete_thumbnail(storage_path: Optional[str]):
+    """Best-effort removal of the thumbnail next to a PDF."""
+    from .pdf_generator import delete_from_storage
+
+    if not storage_path:
+        return
+    try:
+        await delete_from_storage(thumbnail_path(storage_path))
+    except Exception:
+        pass  # Older PDFs may have no thumbnail
+
+
+def thumbnail_stats() -> dict:
+    return {
+        "enabled": THUMBNAILS_ENABLED,
+        "workers": THUMBNAIL_WORKERS if _pool is not None else 0,
+        "dpi": THUMBNAIL_DPI,
+        **_stats,
+    }
+
+
+def close_thumbnail_pool():
+    """Stop the pool processes (called on shutdown)."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+    _pool = None
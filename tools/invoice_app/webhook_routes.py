@@ -10,6 +10,7 @@ from fastapi import APIRouter, HTTPException, Request, status
 from .supabase_client import supabase
 from .activity_routes import _log_activity
 from .email_service import get_email_provider
+from .settings_routes import get_company_settings
 
 router = APIRouter()
 
@@ -27,10 +28,9 @@ async def _notify_sender(user_id: str, document: dict, from_email: str,
                          detected_intent: str | None, body_snippet: str):
     """Send a notification email to the Invoice Studio user when a reply is received."""
     try:
-        settings_rows = await supabase.select("company_settings", filters={"user_id": user_id})
-        if not settings_rows:
+        settings = await get_company_settings(user_id)
+        if not settings:
             return
-        settings = settings_rows[0]
         owner_email = settings.get("email_reply_to") or settings.get("email")
         if not owner_email:
             return
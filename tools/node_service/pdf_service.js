@@ -3,9 +3,11 @@
  * Express API that wraps pdfme/generator for PDF creation
  */
 
+const fs = require('fs');
 const express = require('express');
 const cors = require('cors');
 const { generate } = require('@pdfme/generator');
+const { PDFDocument } = require('@pdfme/pdf-lib');
 const {
   text: _text,
   image: _image,
@@ -42,14 +44,121 @@ const barcodes = Object.fromEntries(
   Object.entries(_barcodes).map(([k, v]) => [k, patchPlugin(v, k)])
 );
 
+const plugins = { text, image, line, rectangle, ellipse, svg, table, multiVariableText, ...barcodes };
+
 const app = express();
 const PORT = process.env.NODE_SERVICE_PORT || 3001;
+// Optional Unix domain socket for a co-located FastAPI backend (skips loopback TCP)
+const SOCKET_PATH = process.env.NODE_SERVICE_SOCKET || '';
+// Registered templates kept per process (least recently used evicted first)
+const TEMPLATE_REGISTRY_SIZE = parseInt(process.env.TEMPLATE_REGISTRY_SIZE || '200', 10);
+const templateRegistry = new Map();
+const registryStats = { hits: 0, misses: 0, registrations: 0, evictions: 0 };
+
+/**
+ * Prepare a template once for repeated renders: a base64 / data-URI basePdf
+ * is decoded to bytes here instead of on every generate() call.
+ */
+function prepareTemplate(template) {
+  if (typeof template.basePdf === 'string' && !/^https?:/.test(template.basePdf)) {
+    const base64 = template.basePdf.replace(/^data:application\/pdf;base64,/, '');
+    return { ...template, basePdf: new Uint8Array(Buffer.from(base64, 'base64')) };
+  }
+  return template;
+}
+
+function registerTemplate(templateHash, template) {
+  const prepared = prepareTemplate(template);
+  templateRegistry.delete(templateHash);
+  templateRegistry.set(templateHash, prepared);
+  registryStats.registrations++;
+  while (templateRegistry.size > TEMPLATE_REGISTRY_SIZE) {
+    templateRegistry.delete(templateRegistry.keys().next().value);
+    registryStats.evictions++;
+  }
+  return prepared;
+}
+
+function lookupTemplate(templateHash) {
+  const template = templateRegistry.get(templateHash);
+  if (!template) {
+    registryStats.misses++;
+    return null;
+  }
+  // Refresh LRU position
+  templateRegistry.delete(templateHash);
+  templateRegistry.set(templateHash, template);
+  registryStats.hits++;
+  return template;
+}
+
+/**
+ * Template for a render request. An inline template is used as-is, and
+ * registered when it comes with a template_hash; a bare template_hash is
+ * looked up in the registry. An unknown hash (evicted, or this process
+ * restarted) gets 409 TEMPLATE_NOT_REGISTERED so the client resends the
+ * full template. Returns null once an error response has been sent.
+ */
+function resolveTemplate(req, res) {
+  const { template, template_hash: templateHash } = req.body;
+
+  if (template) {
+    if (!template.schemas || !Array.isArray(template.schemas)) {
+      res.status(400).json({ error: 'Invalid template: missing schemas array' });
+      return null;
+    }
+    return templateHash ? registerTemplate(templateHash, template) : template;
+  }
+
+  if (templateHash) {
+    const registered = lookupTemplate(templateHash);
+    if (!registered) {
+      res.status(409).json({
+        error: 'Template not registered',
+        code: 'TEMPLATE_NOT_REGISTERED',
+        template_hash: templateHash
+      });
+    }
+    return registered;
+  }
+
+  res.status(400).json({ error: 'Missing required field: template' });
+  return null;
+}
 
 // Middleware
 app.use(cors());
 app.use(express.json({ limit: '50mb' })); // Allow large template JSONs
 app.use(express.urlencoded({ extended: true, limit: '50mb' }));
 
+/**
+ * Send a generated PDF in the format the client asked for.
+ * Clients sending "Accept: application/pdf" (the Python bridge) get the raw
+ * bytes with metadata in X-PDF-* headers; everyone else (the browser preview)
+ * gets the original JSON body with the PDF base64-encoded.
+ */
+function sendPdf(req, res, pdf, meta = {}) {
+  // Wrap the Uint8Array without copying it
+  const buffer = Buffer.from(pdf.buffer, pdf.byteOffset, pdf.byteLength);
+
+  if (req.accepts(['json', 'application/pdf']) === 'application/pdf') {
+    res.set({
+      'Content-Type': 'application/pdf',
+      'Content-Length': buffer.length,
+      'X-PDF-Size': buffer.length,
+      ...(meta.timestamp ? { 'X-PDF-Generated-At': meta.timestamp } : {})
+    });
+    return res.end(buffer);
+  }
+
+  res.json({
+    success: true,
+    pdf: buffer.toString('base64'),
+    size: buffer.length,
+    ...meta
+  });
+}
+
 /**
  * Health check endpoint
  */
@@ -58,6 +167,7 @@ app.get('/health', (req, res) => {
     status: 'healthy',
     service: 'pdf-generator',
     version: '1.0.0',
+    templates: { registered: templateRegistry.size, ...registryStats },
     timestamp: new Date().toISOString()
   });
 });
@@ -68,36 +178,28 @@ app.get('/health', (req, res) => {
  * Request body:
  * {
  *   template: { basePdf: ..., schemas: [...] },
+ *   template_hash: "...",  // optional: register the template under this hash
  *   inputs: [{ field1: value1, field2: value2, ... }]
  * }
+ * or, for a registered template, { template_hash, inputs } (409 if unknown)
  *
  * Response:
- * - Success: PDF buffer as base64 string
+ * - Success: raw PDF (Accept: application/pdf) or PDF as base64 string in JSON
  * - Error: JSON with error message
  */
 app.post('/generate', async (req, res) => {
   try {
-    const { template, inputs } = req.body;
+    const { inputs } = req.body;
 
     // Validate request
-    if (!template) {
-      return res.status(400).json({
-        error: 'Missing required field: template'
-      });
-    }
-
     if (!inputs || !Array.isArray(inputs) || inputs.length === 0) {
       return res.status(400).json({
         error: 'Missing or invalid field: inputs (must be non-empty array)'
       });
     }
 
-    // Validate template structure
-    if (!template.schemas || !Array.isArray(template.schemas)) {
-      return res.status(400).json({
-        error: 'Invalid template: missing schemas array'
-      });
-    }
+    const template = resolveTemplate(req, res);
+    if (!template) return;
 
     const fieldCount = Array.isArray(template.schemas[0])
       ? template.schemas[0].length
@@ -111,26 +213,118 @@ app.post('/generate', async (req, res) => {
     const pdf = await generate({
       template,
       inputs,
-      plugins: { text, image, line, rectangle, ellipse, svg, table, multiVariableText, ...barcodes }
+      plugins
     });
 
     console.log('[PDF Service] PDF generated successfully');
 
-    // Convert PDF buffer to base64
-    const base64Pdf = Buffer.from(pdf).toString('base64');
+    sendPdf(req, res, pdf, { timestamp: new Date().toISOString() });
+
+  } catch (error) {
+    console.error('[PDF Service] Error generating PDF:', error);
+
+    res.status(500).json({
+      error: 'Failed to generate PDF',
+      message: error.message,
+      details: process.env.DEBUG === 'true' ? error.stack : undefined
+    });
+  }
+});
+
+/**
+ * Split a multi-input render into one PDF per input.
+ * pdfme lays out every input with the template's pages in order, so input i
+ * owns pages [i * pagesPerInput, (i + 1) * pagesPerInput). Returns null when
+ * the page count doesn't add up (e.g. a table overflowed onto extra pages),
+ * in which case the caller renders inputs one by one instead.
+ */
+async function splitPdf(pdf, inputCount, pagesPerInput) {
+  const source = await PDFDocument.load(pdf);
+  if (source.getPageCount() !== inputCount * pagesPerInput) return null;
+
+  const parts = [];
+  for (let i = 0; i < inputCount; i++) {
+    const part = await PDFDocument.create();
+    const indices = Array.from({ length: pagesPerInput }, (_, p) => i * pagesPerInput + p);
+    const pages = await part.copyPages(source, indices);
+    pages.forEach((page) => part.addPage(page));
+    parts.push(await part.save());
+  }
+  return parts;
+}
+
+/**
+ * Batch generate endpoint - many documents for the same template in one call
+ * (month-end recurring invoices). The template, its base PDF and its fonts are
+ * processed once for the whole batch instead of once per document.
+ *
+ * Request body:
+ * {
+ *   template: { basePdf: ..., schemas: [...] },  // or template_hash, as for /generate
+ *   inputs: [{ ...document 1 fields }, { ...document 2 fields }, ...]
+ * }
+ *
+ * Response (one PDF per input, in input order):
+ * - Accept: application/octet-stream - the PDFs concatenated, with their byte
+ *   lengths in the X-PDF-Sizes header (comma separated)
+ * - Otherwise JSON: { success, pdfs: [base64, ...], sizes: [...], count }
+ */
+app.post('/generate-batch', async (req, res) => {
+  try {
+    const { inputs } = req.body;
+
+    if (!inputs || !Array.isArray(inputs) || inputs.length === 0) {
+      return res.status(400).json({
+        error: 'Missing or invalid field: inputs (must be non-empty array)'
+      });
+    }
+
+    const template = resolveTemplate(req, res);
+    if (!template) return;
+
+    console.log(`[PDF Service] Generating batch of ${inputs.length} PDF(s)...`);
+
+    const combined = await generate({ template, inputs, plugins });
+    let pdfs = await splitPdf(combined, inputs.length, Math.max(1, template.schemas.length));
+
+    if (!pdfs) {
+      // Variable page counts: fall back to one render per input
+      console.log('[PDF Service] Batch pages do not split evenly, rendering inputs separately');
+      pdfs = [];
+      for (const input of inputs) {
+        pdfs.push(await generate({ template, inputs: [input], plugins }));
+      }
+    }
+
+    const buffers = pdfs.map((pdf) => Buffer.from(pdf.buffer, pdf.byteOffset, pdf.byteLength));
+    const sizes = buffers.map((buffer) => buffer.length);
+
+    console.log(`[PDF Service] Batch generated successfully (${buffers.length} PDFs)`);
+
+    if (req.accepts(['json', 'application/octet-stream']) === 'application/octet-stream') {
+      const body = Buffer.concat(buffers);
+      res.set({
+        'Content-Type': 'application/octet-stream',
+        'Content-Length': body.length,
+        'X-PDF-Sizes': sizes.join(','),
+        'X-PDF-Generated-At': new Date().toISOString()
+      });
+      return res.end(body);
+    }
 
     res.json({
       success: true,
-      pdf: base64Pdf,
-      size: pdf.byteLength,
+      pdfs: buffers.map((buffer) => buffer.toString('base64')),
+      sizes,
+      count: buffers.length,
       timestamp: new Date().toISOString()
     });
 
   } catch (error) {
-    console.error('[PDF Service] Error generating PDF:', error);
+    console.error('[PDF Service] Error generating PDF batch:', error);
 
     res.status(500).json({
-      error: 'Failed to generate PDF',
+      error: 'Failed to generate PDF batch',
       message: error.message,
       details: process.env.DEBUG === 'true' ? error.stack : undefined
     });
@@ -199,18 +393,12 @@ app.post('/preview', async (req, res) => {
     const pdf = await generate({
       template: previewTemplate,
       inputs: [placeholderInputs],
-      plugins: { text, image, line, rectangle, ellipse, svg, table, multiVariableText, ...barcodes }
+      plugins
     });
 
     console.log('[PDF Service] Preview generated successfully');
 
-    const base64Pdf = Buffer.from(pdf).toString('base64');
-
-    res.json({
-      success: true,
-      pdf: base64Pdf,
-      size: pdf.byteLength
-    });
+    sendPdf(req, res, pdf);
 
   } catch (error) {
     console.error('[PDF Service] Error generating preview:', error);
@@ -231,6 +419,7 @@ app.get('/info', (req, res) => {
     endpoints: {
       health: 'GET /health',
       generate: 'POST /generate',
+      generateBatch: 'POST /generate-batch',
       preview: 'POST /preview',
       info: 'GET /info'
     },
@@ -267,24 +456,38 @@ const server = app.listen(PORT, () => {
   console.log(`Port: ${PORT}`);
   console.log(`Health: http://localhost:${PORT}/health`);
   console.log(`Generate: POST http://localhost:${PORT}/generate`);
+  if (SOCKET_PATH) console.log(`Socket: ${SOCKET_PATH}`);
   console.log(`${'='.repeat(50)}\n`);
 });
 
-// Graceful shutdown
-process.on('SIGTERM', () => {
-  console.log('[PDF Service] SIGTERM received, shutting down gracefully');
+// Same app on a Unix domain socket, next to the TCP port
+let socketServer = null;
+if (SOCKET_PATH) {
+  // Remove a stale socket left behind by a previous run
+  if (fs.existsSync(SOCKET_PATH)) fs.unlinkSync(SOCKET_PATH);
+  socketServer = app.listen(SOCKET_PATH, () => {
+    fs.chmodSync(SOCKET_PATH, 0o660);
+    console.log(`[PDF Service] Listening on unix socket ${SOCKET_PATH}`);
+  });
+}
+
+function shutdown() {
+  if (socketServer) socketServer.close();
   server.close(() => {
     console.log('[PDF Service] Server closed');
     process.exit(0);
   });
+}
+
+// Graceful shutdown
+process.on('SIGTERM', () => {
+  console.log('[PDF Service] SIGTERM received, shutting down gracefully');
+  shutdown();
 });
 
 process.on('SIGINT', () => {
   console.log('\n[PDF Service] SIGINT received, shutting down gracefully');
-  server.close(() => {
-    console.log('[PDF Service] Server closed');
-    process.exit(0);
-  });
+  shutdown();
 });
 
 module.exports = app;
@@ -0,0 +1,60 @@
+-- Atomic Document Number Allocation
+-- Run in Supabase Dashboard > SQL Editor
+--
+-- Hands out invoice/quote numbers with a single UPDATE ... RETURNING, so
+-- concurrent document creation can never receive the same number.
+-- p_count > 1 reserves a contiguous block (first_number..last_number) for batch runs.
+
+CREATE OR REPLACE FUNCTION allocate_document_number(
+    p_user_id UUID,
+    p_document_type TEXT,
+    p_count INTEGER DEFAULT 1
+)
+RETURNS TABLE (
+    first_number INTEGER,
+    last_number INTEGER,
+    number_format TEXT,
+    number_prefix TEXT
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_settings_id UUID;
+BEGIN
+    IF p_count IS NULL OR p_count < 1 THEN
+        RAISE EXCEPTION 'p_count must be at least 1';
+    END IF;
+
+    SELECT id INTO v_settings_id
+    FROM company_settings
+    WHERE user_id = p_user_id
+    ORDER BY created_at
+    LIMIT 1;
+
+    IF v_settings_id IS NULL THEN
+        RETURN;  -- no settings row yet; caller creates one and retries
+    END IF;
+
+    IF p_document_type = 'invoice' THEN
+        RETURN QUERY
+        UPDATE company_settings
+           SET invoice_number_next = COALESCE(invoice_number_next, 1) + p_count
+         WHERE id = v_settings_id
+        RETURNING invoice_number_next - p_count,
+                  invoice_number_next - 1,
+                  COALESCE(invoice_number_format, 'F-{YEAR}-{SEQ}'),
+                  COALESCE(invoice_number_prefix, 'F');
+    ELSIF p_document_type = 'quote' THEN
+        RETURN QUERY
+        UPDATE company_settings
+           SET quote_number_next = COALESCE(quote_number_next, 1) + p_count
+         WHERE id = v_settings_id
+        RETURNING quote_number_next - p_count,
+                  quote_number_next - 1,
+                  COALESCE(quote_number_format, 'O-{YEAR}-{SEQ}'),
+                  COALESCE(quote_number_prefix, 'O');
+    ELSE
+        RAISE EXCEPTION 'document_type must be invoice or quote';
+    END IF;
+END;
+$$;
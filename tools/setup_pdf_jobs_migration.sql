@@ -0,0 +1,32 @@
+-- Background PDF render jobs
+-- Run in Supabase Dashboard > SQL Editor
+--
+-- New documents are stored with pdf_status = 'pending' and rendered by the
+-- in-process job queue (pdf_jobs.py). Job rows persist the queue so pending
+-- renders are picked up again after a restart or crash.
+
+-- 1. Render state on the document: pending | ready | failed (NULL = no PDF requested)
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS pdf_status TEXT;
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS pdf_error TEXT;
+
+-- 2. Job rows: pending -> running -> completed | failed
+CREATE TABLE IF NOT EXISTS pdf_jobs (
+    id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+    user_id UUID NOT NULL,
+    document_id UUID NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    reason TEXT NOT NULL DEFAULT 'create',
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error_message TEXT,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    started_at TIMESTAMPTZ,
+    completed_at TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS idx_pdf_jobs_status ON pdf_jobs(status, created_at);
+CREATE INDEX IF NOT EXISTS idx_pdf_jobs_document_id ON pdf_jobs(document_id);
+
+ALTER TABLE pdf_jobs ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view own pdf jobs" ON pdf_jobs
+    FOR SELECT USING (auth.uid() = user_id);
@@ -0,0 +1,9 @@
+-- Content-addressed PDF render cache
+-- Run in Supabase Dashboard > SQL Editor
+--
+-- render_hash is the SHA-256 of the template JSON + pdfme inputs a document's
+-- PDF was rendered from (see render_hash() in pdf_generator.py). Re-generating
+-- a document whose hash is unchanged reuses the stored PDF instead of
+-- rendering and uploading it again. NULL = unknown, the next generate renders.
+
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS render_hash TEXT;
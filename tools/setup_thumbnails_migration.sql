@@ -0,0 +1,14 @@
+-- Page-1 PNG thumbnails of documents and templates
+-- Run in Supabase Dashboard > SQL Editor
+--
+-- thumbnail_url is the public URL of a low-DPI PNG of page 1, stored next to
+-- the PDF it was rasterized from (see thumbnails.py). New PDFs get one when
+-- they are rendered; older documents and templates get theirs on the first
+-- GET /api/documents/{id}/thumbnail or /api/templates/{id}/thumbnail.
+-- NULL = not created yet (or PyMuPDF is not installed on the server).
+--
+-- Required: the document and template lists select thumbnail_url and
+-- document writes set it, so they fail until these columns exist.
+
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS thumbnail_url TEXT;
+ALTER TABLE templates ADD COLUMN IF NOT EXISTS thumbnail_url TEXT;
@@ -9,6 +9,7 @@ import sys
 import subprocess
 import time
 import signal
+import threading
 import requests
 from pathlib import Path
 from dotenv import load_dotenv
@@ -19,15 +20,21 @@ sys.path.insert(0, str(Path(__file__).parent))
 # Load environment variables
 load_dotenv()
 
+# Worker ports/sockets, same layout the backend routes to (no app imports)
+from invoice_app.node_workers import node_worker_addresses
+
 # Configuration
 BACKEND_HOST = os.getenv("BACKEND_HOST", "0.0.0.0")
 BACKEND_PORT = int(os.getenv("BACKEND_PORT", 8000))
 NODE_SERVICE_HOST = os.getenv("NODE_SERVICE_HOST", "localhost")
 NODE_SERVICE_PORT = int(os.getenv("NODE_SERVICE_PORT", 3001))
+NODE_SERVICE_WORKERS = max(1, int(os.getenv("NODE_SERVICE_WORKERS", 1)))
+WATCHDOG_INTERVAL_SECONDS = 5
 
 # Process references
-node_process = None
+node_processes = {}  # port -> Popen
 fastapi_process = None
+shutting_down = False
 
 def check_service_health(url, service_name, max_retries=10, retry_delay=1):
     """Check if a service is healthy"""
@@ -49,12 +56,35 @@ def check_service_health(url, service_name, max_retries=10, retry_delay=1):
     print(f"[Launcher] ERROR: {service_name} failed to start")
     return False
 
-def start_node_service():
-    """Start the Node.js PDF generation service"""
-    global node_process
+def spawn_node_worker(node_service_path, port, socket_path):
+    """Start one Node.js render worker on its own port (and socket)"""
+    env = {**os.environ, "NODE_SERVICE_PORT": str(port)}
+    if socket_path:
+        env["NODE_SERVICE_SOCKET"] = socket_path
+    return subprocess.Popen(
+        ["node", str(node_service_path)],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        universal_newlines=True,
+        bufsize=1,
+        env=env
+    )
+
+def watch_node_workers(node_service_path):
+    """Restart render workers that exit; the backend re-admits them on its next health check"""
+    while not shutting_down:
+        time.sleep(WATCHDOG_INTERVAL_SECONDS)
+        for port, socket_path in node_worker_addresses():
+            process = node_processes.get(port)
+            if shutting_down or process is None or process.poll() is None:
+                continue
+            print(f"[Launcher] Node.js worker on port {port} exited ({process.returncode}), restarting...")
+            node_processes[port] = spawn_node_worker(node_service_path, port, socket_path)
 
+def start_node_service():
+    """Start the Node.js PDF generation service (NODE_SERVICE_WORKERS processes)"""
     print(f"\n{'='*60}")
-    print("Starting Node.js PDF Generation Service")
+    print(f"Starting Node.js PDF Generation Service ({NODE_SERVICE_WORKERS} worker(s))")
     print(f"{'='*60}")
 
     # Check if node is installed
@@ -79,34 +109,40 @@ def start_node_service():
             print(f"[Launcher] ERROR: Failed to install Node.js dependencies: {e}")
             sys.exit(1)
 
-    # Start Node.js service
+    # Start Node.js render workers
     node_service_path = Path(__file__).parent / "node_service" / "start_service.js"
 
     try:
-        node_process = subprocess.Popen(
-            ["node", str(node_service_path)],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            universal_newlines=True,
-            bufsize=1
-        )
-
-        # Wait for service to be ready
-        if not check_service_health(
-            f"http://{NODE_SERVICE_HOST}:{NODE_SERVICE_PORT}/health",
-            "Node.js PDF Service"
-        ):
-            print("[Launcher] ERROR: Node.js service failed to start properly")
-            if node_process:
-                node_process.terminate()
-            sys.exit(1)
-
-        return node_process
+        for port, socket_path in node_worker_addresses():
+            node_processes[port] = spawn_node_worker(node_service_path, port, socket_path)
+
+        # Wait for every worker to be ready
+        for port in node_processes:
+            if not check_service_health(
+                f"http://{NODE_SERVICE_HOST}:{port}/health",
+                f"Node.js PDF Service (port {port})"
+            ):
+                print("[Launcher] ERROR: Node.js service failed to start properly")
+                stop_node_workers()
+                sys.exit(1)
+
+        threading.Thread(target=watch_node_workers, args=(node_service_path,), daemon=True).start()
+        return node_processes
 
     except Exception as e:
         print(f"[Launcher] ERROR starting Node.js service: {e}")
         sys.exit(1)
 
+def stop_node_workers():
+    """Terminate all Node.js render workers"""
+    for process in node_processes.values():
+        process.terminate()
+    for process in node_processes.values():
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
 def start_fastapi():
     """Start the FastAPI backend"""
     print(f"\n{'='*60}")
@@ -143,15 +179,13 @@ def start_fastapi():
 
 def cleanup(signum=None, frame=None):
     """Cleanup processes on exit"""
+    global shutting_down
     print("\n[Launcher] Shutting down services...")
+    shutting_down = True
 
-    if node_process:
+    if node_processes:
         print("[Launcher] Stopping Node.js service...")
-        node_process.terminate()
-        try:
-            node_process.wait(timeout=5)
-        except subprocess.TimeoutExpired:
-            node_process.kill()
+        stop_node_workers()
 
     print("[Launcher] All services stopped. Goodbye!")
     sys.exit(0)